@@ -0,0 +1,299 @@
+import sys
+import os
+import time
+import json
+import pickle
+import threading
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.api.json_formatter import format_ner_output
+from src.storage.segment_store import SegmentReader, STORE_DIR
+from src.analytics.timeline import Timeline
+from src.analytics.search_index import SearchIndex
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '../../data/aggregates.json')
+
+class Aggregator:
+    """
+    Running totals behind the dashboard's Intel Core.
+
+    Every result is folded in once: disease and medication counts, their
+    (disease, medication) co-occurrences and the note timeline. Work per
+    update is proportional to the new rows only, never to the history.
+    """
+    def __init__(self):
+        self.total_processed = 0
+        self.entities_found = 0
+        self.diseases = Counter()
+        self.medications = Counter()
+        self.pairs = Counter() # (Disease, Med)
+        self.timeline = Timeline()
+
+    def update(self, results):
+        for result in results:
+            entities = result.get('entities', [])
+            self.total_processed += 1
+            self.entities_found += len(entities)
+            self.timeline.add(result['timestamp'])
+
+            current_diseases = []
+            current_meds = []
+            for entity in entities:
+                if "Disease" in entity['label']:
+                    self.diseases[entity['entity']] += 1
+                    current_diseases.append(entity['entity'])
+                elif "Medication" in entity['label']:
+                    self.medications[entity['entity']] += 1
+                    current_meds.append(entity['entity'])
+
+            # Simple Pair Counting (Cross product for now)
+            for d in current_diseases:
+                for m in current_meds:
+                    self.pairs[(d, m)] += 1
+
+    def to_state(self):
+        return {
+            "total_processed": self.total_processed,
+            "entities_found": self.entities_found,
+            "diseases": dict(self.diseases),
+            "medications": dict(self.medications),
+            "pairs": [[d, m, count] for (d, m), count in self.pairs.items()],
+            "timeline": self.timeline.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        aggregator = cls()
+        aggregator.total_processed = state["total_processed"]
+        aggregator.entities_found = state["entities_found"]
+        aggregator.diseases = Counter(state["diseases"])
+        aggregator.medications = Counter(state["medications"])
+        aggregator.pairs = Counter({(d, m): count for d, m, count in state["pairs"]})
+        aggregator.timeline = Timeline.from_state(state["timeline"])
+        return aggregator
+
+class AggregationService:
+    """
+    One Aggregator shared by every dashboard session.
+
+    `refresh` tails the segment store and folds in only the rows written
+    since the last call; sessions then read an immutable `snapshot`, so a new
+    viewer costs nothing and never replays the history. The aggregates and
+    the store cursor are checkpointed together (atomically) every
+    `checkpoint_interval` seconds, so a restarted dashboard resumes where it
+    stopped instead of re-reading the whole store.
+
+    It also keeps the Data Vault's SearchIndex over the full history, fed
+    from the same rows. The index is larger, so it is pickled next to the
+    checkpoint only every `index_checkpoint_interval` seconds, with its own
+    cursor; a restart replays just the rows between that cursor and the
+    aggregates' one.
+    """
+    def __init__(self, root=STORE_DIR, checkpoint_path=CHECKPOINT_PATH, checkpoint_interval=5.0, recent_size=200,
+                 index_checkpoint_interval=60.0):
+        self.reader = SegmentReader(root)
+        self.checkpoint_path = checkpoint_path
+        self.index_path = os.path.splitext(checkpoint_path)[0] + '_index.pkl' if checkpoint_path else None
+        self.checkpoint_interval = checkpoint_interval
+        self.index_checkpoint_interval = index_checkpoint_interval
+        self.aggregator = Aggregator()
+        # Latest formatted messages, newest first, for the transmission log and vault
+        self.recent = deque(maxlen=recent_size)
+        self.index = SearchIndex()
+
+        self.lock = threading.Lock()
+        self.version = 0
+        self.dirty = False
+        self.last_checkpoint = time.monotonic()
+        self.last_index_checkpoint = self.last_checkpoint
+        self._snapshot = None
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._load_checkpoint()
+
+    def refresh(self):
+        """
+        Folds in newly written results. Returns how many there were.
+        """
+        with self.lock:
+            try:
+                results = self.reader.read_new()
+            except Exception as e:
+                print(f"Aggregation refresh failed: {e}")
+                return 0
+            if results:
+                self.aggregator.update(results)
+                self.index.add(results)
+                for result in results:
+                    self.recent.appendleft(format_ner_output(result))
+                self.version += 1
+                self.dirty = True
+            if self.dirty and time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+                self.checkpoint()
+            return len(results)
+
+    def snapshot(self, since=None):
+        """
+        Returns a read-only view of the aggregates, with the chart DataFrames
+        prebuilt. It is rebuilt only after new results arrive and shared by
+        all sessions until then.
+
+        With `since` (a `baseline`), only what arrived after it is counted;
+        that view is built on every call, so callers should keep it per version.
+        """
+        with self.lock:
+            if since is not None:
+                return self._build_snapshot(since)
+            if self._snapshot is None or self._snapshot['version'] != self.version:
+                self._snapshot = self._build_snapshot()
+            return self._snapshot
+
+    def baseline(self):
+        """
+        Marks the current aggregates as one viewer's zero point (the dashboard's
+        purge) for `snapshot(since=...)`. The shared aggregates are untouched.
+        """
+        with self.lock:
+            aggregator = self.aggregator
+            return {
+                'purged_at': time.time(),
+                'total_processed': aggregator.total_processed,
+                'entities_found': aggregator.entities_found,
+                'diseases': Counter(aggregator.diseases),
+                'medications': Counter(aggregator.medications),
+                'pairs': Counter(aggregator.pairs),
+                'velocity': {width: dict(zip(*(values.tolist() for values in aggregator.timeline.series(width))))
+                             for width in aggregator.timeline.rings},
+            }
+
+    def search(self, query, page=0, page_size=50):
+        """
+        Searches the full history, see `SearchIndex.search`.
+        Returns (total matches, [(timestamp, masked text, entity string), ...]).
+        """
+        with self.lock:
+            total, doc_ids = self.index.search(query, page, page_size)
+            return total, self.index.rows(doc_ids)
+
+    def _build_snapshot(self, since=None):
+        aggregator = self.aggregator
+        diseases, medications, pairs = aggregator.diseases, aggregator.medications, aggregator.pairs
+        total_processed, entities_found = aggregator.total_processed, aggregator.entities_found
+        if since is not None:
+            # Counter subtraction drops keys whose count didn't grow
+            diseases, medications, pairs = diseases - since['diseases'], medications - since['medications'], pairs - since['pairs']
+            total_processed -= since['total_processed']
+            entities_found -= since['entities_found']
+        return {
+            'version': self.version,
+            'purged_at': since['purged_at'] if since is not None else None,
+            'total_processed': total_processed,
+            'entities_found': entities_found,
+            # Newest first, so the notes that arrived since the baseline come first
+            'messages': list(self.recent)[:total_processed],
+            'diseases': pd.DataFrame(list(diseases.items()), columns=['Disease', 'Count']),
+            'medications': pd.DataFrame(list(medications.items()), columns=['Medication', 'Count']),
+            'pairs': pd.DataFrame([(d, m, count) for (d, m), count in pairs.items()], columns=['Disease', 'Medication', 'Count']),
+            # Bin width (s) -> notes per bin, empty bins included
+            'velocity': {width: self._velocity_frame(*aggregator.timeline.series(width), since and since['velocity'][width])
+                         for width in aggregator.timeline.rings},
+        }
+
+    def _velocity_frame(self, starts, counts, since=None):
+        if since:
+            counts = np.maximum(counts - np.array([since.get(start, 0) for start in starts.tolist()], dtype=np.int64), 0)
+            first = int(np.argmax(counts > 0)) if counts.any() else len(counts)
+            starts, counts = starts[first:], counts[first:]
+        return pd.DataFrame({'Timestamp': pd.to_datetime(starts, unit='s'), 'Count': counts})
+
+    def checkpoint(self, save_index=None):
+        """
+        Atomically saves the aggregates with the store cursor they correspond to,
+        and the search index too once `index_checkpoint_interval` has passed
+        (or if `save_index` says so).
+        """
+        now = time.monotonic()
+        if save_index is None:
+            save_index = now - self.last_index_checkpoint >= self.index_checkpoint_interval
+        self.dirty = False
+        self.last_checkpoint = now
+        if not self.checkpoint_path:
+            return
+        state = {
+            "aggregates": self.aggregator.to_state(),
+            "reader": self.reader.state(),
+            "recent": list(self.recent),
+        }
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+        # Written after the aggregates, so the index's cursor is never ahead of theirs
+        if save_index:
+            self.last_index_checkpoint = now
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump({"index": self.index, "reader": state["reader"]}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.index_path)
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                state = json.load(f)
+            aggregator = Aggregator.from_state(state["aggregates"])
+            self.reader.restore(state["reader"])
+        except (ValueError, KeyError, OSError) as e:
+            # A damaged checkpoint only costs a replay from the start of the store
+            print(f"Ignoring aggregation checkpoint {self.checkpoint_path}: {e}")
+            self.reader = SegmentReader(self.reader.root)
+            return
+        self.aggregator = aggregator
+        self.recent.extend(state.get("recent", []))
+        self._load_index()
+        self.version += 1
+
+    def _load_index(self):
+        """
+        Restores the pickled index and brings it up to the aggregates' cursor,
+        replaying only the rows written between the two checkpoints.
+        """
+        index, index_reader = SearchIndex(), SegmentReader(self.reader.root)
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'rb') as f:
+                    state = pickle.load(f)
+                index_reader.restore(state["reader"])
+                index = state["index"]
+            except Exception as e:
+                print(f"Ignoring search index checkpoint {self.index_path}: {e}")
+                index, index_reader = SearchIndex(), SegmentReader(self.reader.root)
+        # An index ahead of the aggregates (e.g. from another checkpoint file) can't be rewound
+        if any(self.reader.cursor.get(path, (0, 0))[1] < consumed for path, (_, consumed) in index_reader.cursor.items()):
+            print(f"Ignoring search index checkpoint {self.index_path}: it is ahead of the aggregates")
+            index, index_reader = SearchIndex(), SegmentReader(self.reader.root)
+        index.add(index_reader.read_until(self.reader))
+        self.index = index
+
+if __name__ == "__main__":
+    # Catch up with the store and write a fresh checkpoint, e.g. before starting the dashboard:
+    #   python src/analytics/aggregator.py
+    service = AggregationService()
+    started = time.perf_counter()
+    total = 0
+    while True:
+        new = service.refresh()
+        if not new:
+            break
+        total += new
+    service.checkpoint(save_index=True)
+    print(f"Aggregated {total} new notes in {time.perf_counter() - started:.2f}s "
+          f"({service.aggregator.total_processed} total) -> {os.path.abspath(service.checkpoint_path)}")
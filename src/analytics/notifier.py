@@ -0,0 +1,191 @@
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from collections import deque
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+class Inotify:
+    """
+    Minimal ctypes binding to Linux inotify, so watching needs no extra package.
+    """
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns [(wd, mask, name)] for the pending events.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class StoreWatcher:
+    """
+    Calls `on_change` from a background thread whenever results land in the segment store.
+
+    On Linux it sleeps on inotify events for the store root, the newest day
+    directory and the newest hour partitions (new partitions are picked up as
+    they are created), so an idle store costs no CPU at all. Bursts of events
+    within `debounce` seconds are coalesced into one call. Elsewhere it falls
+    back to checking the newest partition's segment sizes every `poll_interval` seconds.
+    """
+    def __init__(self, root, on_change, debounce=0.2, poll_interval=1.0):
+        self.root = root
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="store-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        try:
+            inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling the store every {self.poll_interval}s")
+            self._poll()
+            return
+        try:
+            self._watch(inotify)
+        finally:
+            inotify.close()
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"Store change handler failed: {e}")
+
+    def _watch(self, inotify):
+        while not os.path.isdir(self.root):
+            if self.stopped.wait(self.poll_interval):
+                return
+
+        # wd -> (path, depth below root); only the newest partitions are watched
+        watches = {}
+        hour_watches = deque()
+
+        def watch(path, depth):
+            if any(watched == path for watched, _ in watches.values()):
+                return
+            try:
+                wd = inotify.add_watch(path)
+            except OSError:
+                return
+            watches[wd] = (path, depth)
+            if depth == 2:
+                hour_watches.append(wd)
+                # Writers only append to the current hour; keep one older hour for stragglers
+                while len(hour_watches) > 2:
+                    old = hour_watches.popleft()
+                    inotify.rm_watch(old)
+                    watches.pop(old, None)
+
+        def newest(path):
+            names = sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+            return os.path.join(path, names[-1]) if names else None
+
+        watch(self.root, 0)
+        day = newest(self.root)
+        if day:
+            watch(day, 1)
+            hour = newest(day)
+            if hour:
+                watch(hour, 2)
+        # Catch up with anything written before the watches were in place
+        self._notify()
+
+        while not self.stopped.is_set():
+            events = inotify.read(1.0)
+            if not events:
+                continue
+            # Coalesce the rest of the burst
+            deadline = time.monotonic() + self.debounce
+            while True:
+                for wd, mask, name in events:
+                    if mask & IN_CREATE and mask & IN_ISDIR and wd in watches:
+                        path, depth = watches[wd]
+                        if depth < 2:
+                            watch(os.path.join(path, name), depth + 1)
+                            if depth == 0:
+                                # The hour directory may have been created before the day's watch
+                                hour = newest(os.path.join(path, name))
+                                if hour:
+                                    watch(hour, 2)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                events = inotify.read(remaining)
+            self._notify()
+
+    def _signature(self):
+        try:
+            day = max(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+            day_dir = os.path.join(self.root, day)
+            hour_dir = os.path.join(day_dir, max(os.listdir(day_dir)))
+            return hour_dir, sorted((entry.name, entry.stat().st_size) for entry in os.scandir(hour_dir))
+        except (OSError, ValueError):
+            return None
+
+    def _poll(self):
+        last = self._signature()
+        while not self.stopped.wait(self.poll_interval):
+            current = self._signature()
+            if current != last:
+                last = current
+                self._notify()
@@ -0,0 +1,141 @@
+import re
+import math
+import bisect
+from array import array
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+# Matches in extracted entities rank above matches elsewhere in the note
+ENTITY_BOOST = 2.0
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+class SearchIndex:
+    """
+    Incremental inverted index over processed notes for the Data Vault.
+
+    Every note gets a sequential doc id; postings map each token of the masked
+    text, and separately of the entity strings, to the ascending ids of the
+    notes containing it. The vocabulary is kept sorted so the last query word
+    can be matched as a prefix (search-as-you-type). Note texts are interned,
+    since de-identified notes repeat heavily.
+    """
+    def __init__(self):
+        self.timestamps = array('d')
+        self.text_ids = array('I')
+        self.entity_ids = array('I')
+        self.strings = []
+        self.string_ids = {}
+
+        self.text_postings = {}
+        self.entity_postings = {}
+        self.vocabulary = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _intern(self, value):
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self.string_ids[value] = string_id
+        return string_id
+
+    def _post(self, postings, token, doc_id):
+        doc_ids = postings.get(token)
+        if doc_ids is None:
+            doc_ids = postings[token] = array('I')
+            index = bisect.bisect_left(self.vocabulary, token)
+            if index == len(self.vocabulary) or self.vocabulary[index] != token:
+                self.vocabulary.insert(index, token)
+        elif doc_ids[-1] == doc_id:
+            return
+        doc_ids.append(doc_id)
+
+    def add(self, results):
+        for result in results:
+            doc_id = len(self.timestamps)
+            text = result.get('original_text_masked') or ""
+            entities = ", ".join(entity['entity'] for entity in result.get('entities', []))
+
+            self.timestamps.append(result['timestamp'])
+            self.text_ids.append(self._intern(text))
+            self.entity_ids.append(self._intern(entities))
+            for token in tokenize(text):
+                self._post(self.text_postings, token, doc_id)
+            for token in tokenize(entities):
+                self._post(self.entity_postings, token, doc_id)
+
+    def _matches(self, terms):
+        """
+        Returns (doc ids containing every term, [(document frequency, entity doc ids)] per term).
+        A term is a (token, is_prefix) pair.
+        """
+        candidates = None
+        per_term = []
+        for token, is_prefix in terms:
+            tokens = self._expand(token) if is_prefix else [token]
+            text_docs = self._union(self.text_postings, tokens)
+            entity_docs = self._union(self.entity_postings, tokens)
+            docs = np.union1d(text_docs, entity_docs)
+            per_term.append((docs.size, entity_docs))
+            candidates = docs if candidates is None else np.intersect1d(candidates, docs, assume_unique=True)
+            if not candidates.size:
+                break
+        return candidates, per_term
+
+    def _expand(self, prefix):
+        first = bisect.bisect_left(self.vocabulary, prefix)
+        last = bisect.bisect_left(self.vocabulary, prefix + '\U0010ffff', first)
+        return self.vocabulary[first:last]
+
+    def _union(self, postings, tokens):
+        arrays = [np.array(postings[token], dtype=np.uint32) for token in tokens if token in postings]
+        if not arrays:
+            return np.empty(0, dtype=np.uint32)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
+
+    def search(self, query, page=0, page_size=50):
+        """
+        Returns (total matches, doc ids of the requested page).
+
+        Every query word must match; the last one also matches as a prefix
+        unless the query ends with a space. Results are ranked by the summed
+        idf of the matched words (doubled for matches in entities), newest
+        first among equal scores. An empty query lists all notes, newest first.
+        """
+        words = tokenize(query)
+        total_docs = len(self.timestamps)
+        if not words:
+            first = max(total_docs - page * page_size, 0)
+            last = max(first - page_size, 0)
+            return total_docs, list(range(first - 1, last - 1, -1))
+
+        terms = [(word, False) for word in words[:-1]]
+        terms.append((words[-1], not query[-1:].isspace()))
+        candidates, per_term = self._matches(terms)
+        if candidates is None or not candidates.size:
+            return 0, []
+
+        scores = np.zeros(candidates.size)
+        for document_frequency, entity_docs in per_term:
+            idf = math.log(1 + total_docs / document_frequency)
+            in_entities = np.isin(candidates, entity_docs, assume_unique=True)
+            scores += idf * np.where(in_entities, ENTITY_BOOST, 1.0)
+
+        # Score descending, then newest (highest doc id) first
+        order = np.lexsort((-candidates.astype(np.int64), -scores))
+        page_ids = candidates[order[page * page_size:(page + 1) * page_size]]
+        return int(candidates.size), page_ids.tolist()
+
+    def rows(self, doc_ids):
+        """
+        Returns (timestamp, masked text, entity string) for each doc id.
+        """
+        return [(self.timestamps[i], self.strings[self.text_ids[i]], self.strings[self.entity_ids[i]]) for i in doc_ids]
@@ -0,0 +1,83 @@
+import numpy as np
+
+# (bin width in seconds, bins kept): 1 hour of 10s bins, 1 day of minutes, 30 days of hours
+RESOLUTIONS = ((10, 360), (60, 1440), (3600, 720))
+
+class Ring:
+    """
+    Fixed-size ring of counts for consecutive time bins of one width.
+
+    Slot `bin % size` holds the count of bin `bin`; `bins` remembers which bin
+    each slot currently holds, so slots left over from an earlier lap read as
+    empty without ever being swept.
+    """
+    def __init__(self, width, size):
+        self.width = width
+        self.size = size
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.bins = np.full(size, -1, dtype=np.int64)
+        self.latest = -1
+
+    def add(self, timestamp, count=1):
+        b = int(timestamp // self.width)
+        if b <= self.latest - self.size:
+            # Older than anything the ring still covers
+            return
+        slot = b % self.size
+        if self.bins[slot] != b:
+            self.bins[slot] = b
+            self.counts[slot] = 0
+        self.counts[slot] += count
+        if b > self.latest:
+            self.latest = b
+
+    def series(self):
+        """
+        Returns (bin start timestamps, counts) for the bins ending at the latest
+        one, from the first non-empty bin on.
+        """
+        if self.latest < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        wanted = np.arange(self.latest - self.size + 1, self.latest + 1)
+        slots = wanted % self.size
+        counts = np.where(self.bins[slots] == wanted, self.counts[slots], 0)
+        first = int(np.argmax(counts > 0))
+        return wanted[first:] * self.width, counts[first:]
+
+class Timeline:
+    """
+    Note counts over time at several resolutions, in fixed memory.
+
+    Every note costs O(1) per resolution and rendering a resolution costs
+    O(bins), however long the dashboard has been up.
+    """
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.rings = {width: Ring(width, size) for width, size in resolutions}
+
+    def add(self, timestamp):
+        for ring in self.rings.values():
+            ring.add(timestamp)
+
+    def series(self, width):
+        return self.rings[width].series()
+
+    def to_state(self):
+        # Only live slots are saved, so checkpoints stay small
+        state = {}
+        for width, ring in self.rings.items():
+            live = np.nonzero(ring.bins >= 0)[0]
+            state[str(width)] = {
+                "size": ring.size,
+                "bins": ring.bins[live].tolist(),
+                "counts": ring.counts[live].tolist(),
+            }
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        timeline = cls([(int(width), ring["size"]) for width, ring in state.items()])
+        for width, ring_state in state.items():
+            ring = timeline.rings[int(width)]
+            for b, count in zip(ring_state["bins"], ring_state["counts"]):
+                ring.add(b * ring.width, count)
+        return timeline
@@ -0,0 +1,292 @@
+import sys
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.api.json_formatter import format_ner_output
+from src.deidentification.phi_removal import PHIRemover
+from src.ner.inference import add_model_arguments, load_model, apply_runtime, process_batch
+
+DEFAULT_SOCKET = '/tmp/helix-ner.sock'
+
+# Default time a caller waits for its result
+DEFAULT_BUDGET_MS = 500
+
+# Longest request line accepted, in bytes
+MAX_REQUEST_BYTES = 1 << 20
+
+class DeadlineExceeded(Exception):
+    """
+    The request's latency budget ran out before its result was ready.
+    """
+
+class Overloaded(Exception):
+    """
+    Too many requests are already waiting; the caller should back off.
+    """
+
+class InferenceService:
+    """
+    On-demand de-identification and NER of single notes, for internal tools.
+
+    Concurrent requests are coalesced into dynamic micro-batches: the batcher
+    takes what is waiting (up to `batch_size` notes) and holds the batch open
+    for at most `max_wait` seconds, but never so long that the tightest
+    deadline in it can't be met given how long recent batches took. Batches
+    run on a single executor thread, so the event loop keeps accepting and
+    answering requests while the model works. Each request has a latency
+    budget (`budget_ms` unless it asks for its own); requests whose budget ran
+    out while queued are dropped without running the model, and at most
+    `max_queue` requests may wait at once.
+    """
+    def __init__(self, model, phi_remover, batch_size=16, max_wait=0.005, budget_ms=DEFAULT_BUDGET_MS, max_queue=1024):
+        self.model = model
+        self.phi_remover = phi_remover
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.budget_ms = budget_ms
+        self.max_queue = max_queue
+
+        # (deadline, message, future) in arrival order
+        self.pending = deque()
+        self.arrived = None
+        self.task = None
+        # One thread: the model isn't thread-safe, and torch parallelizes inside a batch anyway
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="helix-ner")
+        # Smoothed seconds per batch, kept free inside every deadline
+        self.batch_seconds = 0.0
+        self.stats = {"requests": 0, "batches": 0, "batched_notes": 0, "expired": 0, "overloaded": 0, "failed": 0}
+
+    async def start(self):
+        self.arrived = asyncio.Event()
+        self.task = asyncio.create_task(self._batch_loop())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def infer(self, note, timestamp=None, budget_ms=None):
+        """
+        De-identifies and tags one note. Returns it in the `format_ner_output` shape.
+        Raises DeadlineExceeded or Overloaded.
+        """
+        loop = asyncio.get_running_loop()
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        deadline = loop.time() + budget
+        if len(self.pending) >= self.max_queue:
+            self.stats["overloaded"] += 1
+            raise Overloaded(f"{len(self.pending)} requests already waiting")
+        future = loop.create_future()
+        self.pending.append((deadline, {'note': note, 'timestamp': time.time() if timestamp is None else timestamp}, future))
+        self.stats["requests"] += 1
+        self.arrived.set()
+        try:
+            # Shielded: the batch may still be running when the budget runs out
+            result = await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.stats["expired"] += 1
+            raise DeadlineExceeded(f"no result within {budget * 1000:.0f} ms")
+        return format_ner_output(result)
+
+    def _flush_at(self, opened):
+        # The batch closes after max_wait, or earlier if a deadline in it needs the time to run
+        tightest = min(deadline for deadline, _, _ in list(self.pending)[:self.batch_size])
+        return min(opened + self.max_wait, tightest - self.batch_seconds)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.pending:
+                self.arrived.clear()
+                await self.arrived.wait()
+
+            opened = loop.time()
+            while len(self.pending) < self.batch_size:
+                remaining = self._flush_at(opened) - loop.time()
+                if remaining <= 0:
+                    break
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+            now = loop.time()
+            live = [(message, future) for deadline, message, future in batch if not future.done() and now < deadline]
+            if not live:
+                continue
+
+            started = time.perf_counter()
+            results = await loop.run_in_executor(self.executor, self._process, [message for message, _ in live])
+            elapsed = time.perf_counter() - started
+            self.batch_seconds = elapsed if not self.stats["batches"] else 0.8 * self.batch_seconds + 0.2 * elapsed
+            self.stats["batches"] += 1
+            self.stats["batched_notes"] += len(live)
+
+            for (_, future), result in zip(live, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.stats["failed"] += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _process(self, messages):
+        """
+        Runs on the executor thread. Returns a result or an exception per message;
+        a failed batch is retried note by note so one bad note only fails itself.
+        """
+        try:
+            return process_batch(messages, self.model, self.phi_remover, batch_size=self.batch_size)
+        except Exception as e:
+            if len(messages) == 1:
+                return [e]
+        return [self._process([message])[0] for message in messages]
+
+    async def handle(self, reader, writer):
+        """
+        Serves one connection: a JSON request per line ({"note", optional "id",
+        "timestamp", "budget_ms"}), a JSON response per line. Requests on a
+        connection are served concurrently and answered as they complete, so
+        responses carry the request's "id". Failures are answered with {"id", "error"}.
+        """
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(writer, lock, {"id": None, "error": f"request longer than {MAX_REQUEST_BYTES} bytes"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer, lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get('id')
+            if not isinstance(request, dict) or not isinstance(request.get('note'), str):
+                raise ValueError('expected {"note": str}')
+            response = await self.infer(request['note'], request.get('timestamp'), request.get('budget_ms'))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        response["id"] = request_id
+        await self._send(writer, lock, response)
+
+    async def _send(self, writer, lock, response):
+        async with lock:
+            try:
+                writer.write(json.dumps(response).encode('utf-8') + b"\n")
+                await writer.drain()
+            except ConnectionError:
+                # The caller hung up; nothing to answer
+                pass
+
+async def serve(service, socket_path=DEFAULT_SOCKET, port=None, ready=None):
+    """
+    Serves `service` on a Unix socket at `socket_path` (owner and group only),
+    or on 127.0.0.1:`port` if a port is given, until cancelled.
+    `ready` (an asyncio.Event) is set once it accepts connections.
+    """
+    await service.start()
+    if port is not None:
+        server = await asyncio.start_server(service.handle, '127.0.0.1', port, limit=MAX_REQUEST_BYTES)
+        address = f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    else:
+        if os.path.exists(socket_path):
+            # Left behind by a server that didn't shut down cleanly
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(service.handle, socket_path, limit=MAX_REQUEST_BYTES)
+        os.chmod(socket_path, 0o660)
+        address = socket_path
+    print(f" [*] Serving NER on {address}. To exit press CTRL+C")
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if port is None and os.path.exists(socket_path):
+            os.remove(socket_path)
+        await service.stop()
+
+def query(note, address=DEFAULT_SOCKET, budget_ms=None, timeout=30.0):
+    """
+    Blocking client for tools that aren't async: sends one note and returns
+    the response dict. `address` is a socket path or a (host, port) pair.
+    """
+    family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+    request = {"id": 0, "note": note}
+    if budget_ms is not None:
+        request["budget_ms"] = budget_ms
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix on-demand NER service on a local socket")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path to listen on.")
+    parser.add_argument('--port', type=int, default=None, help="Listen on 127.0.0.1 at this port instead of a Unix socket.")
+    parser.add_argument('--batch-size', type=int, default=16, help="Max notes coalesced into one model batch.")
+    parser.add_argument('--max-wait', type=float, default=0.005,
+                        help="Max seconds a batch is held open for more requests after its first one.")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Default latency budget per request; requests may send their own \"budget_ms\".")
+    parser.add_argument('--max-queue', type=int, default=1024, help="Requests allowed to wait before new ones are refused.")
+    add_model_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("Loading NER Model... (this may take a moment)")
+    model = load_model(args)
+    apply_runtime(model, args)
+    service = InferenceService(model, PHIRemover(), batch_size=args.batch_size, max_wait=args.max_wait,
+                               budget_ms=args.budget_ms, max_queue=args.max_queue)
+    try:
+        asyncio.run(serve(service, args.socket, args.port))
+    except KeyboardInterrupt:
+        print("Stopping NER service...")
+    finally:
+        stats = service.stats
+        if stats["batches"]:
+            print(f" [i] {stats['requests']} requests in {stats['batches']} batches "
+                  f"({stats['batched_notes'] / stats['batches']:.1f} notes/batch); {stats}.")
+        if model.cache is not None:
+            model.cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,18 @@
 import streamlit as st
 import time
 import os
-import json
 import pandas as pd
 import sys
-from collections import Counter
 import altair as alt
 
 # Add src to python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from src.api.json_formatter import format_ner_output
+from src.analytics.aggregator import AggregationService
+from src.analytics.notifier import StoreWatcher
+from src.ner.metrics import scrape, DEFAULT_PORT
+
+# Inference worker metrics endpoints, comma-separated (worker N serves on the base port + N)
+METRICS_URLS = os.environ.get("HELIX_METRICS_URLS", f"http://127.0.0.1:{DEFAULT_PORT}/metrics").split(",")
 
 # Page Config
 st.set_page_config(
@@ -167,66 +170,36 @@ with c1:
 with c2:
     st.markdown('<div style="text-align: right; padding-top: 10px;"><div class="glass-card" style="padding: 8px 16px; display:inline-flex; align-items:center; gap:10px;"><div class="pulse-dot"></div><span style="font-size:0.8rem; font-weight:600; color:#4ade80;">SYSTEM OPTIMAL</span></div></div>', unsafe_allow_html=True)
 
-# Data File
-DATA_FILE = os.path.join(os.path.dirname(__file__), '../../data/processed_notes.jsonl')
-
-# Session State
-if 'last_pos' not in st.session_state: st.session_state.last_pos = 0
-if 'messages' not in st.session_state: st.session_state.messages = []
-if 'total_processed' not in st.session_state: st.session_state.total_processed = 0
-if 'entities_found' not in st.session_state: st.session_state.entities_found = 0
-if 'history_stats' not in st.session_state: 
-    st.session_state.history_stats = {
-        'diseases': Counter(), 
-        'medications': Counter(), 
-        'pairs': Counter(), # (Disease, Med)
-        'timestamps': []
-    }
+@st.cache_resource
+def get_aggregation_service():
+    # One per server process: every session reads the same incrementally maintained aggregates,
+    # which a single watcher thread refreshes only when new results land in the store
+    service = AggregationService()
+    service.refresh()
+    StoreWatcher(service.reader.root, service.refresh).start()
+    return service
 
-CRITICAL_CONDITIONS = ["sepsis", "stroke", "myocardial infarction", "meningitis", "pulmonary embolism"]
+service = get_aggregation_service()
 
-def read_data():
-    if not os.path.exists(DATA_FILE): return []
-    new_data = []
-    try:
-        with open(DATA_FILE, 'r') as f:
-            f.seek(st.session_state.last_pos)
-            lines = f.readlines()
-            st.session_state.last_pos = f.tell()
-            for line in lines:
-                if line.strip():
-                    try: new_data.append(json.loads(line))
-                    except: pass
-    except: pass
-    return new_data
-
-def process_batch(items):
-    formatted = []
-    for item in items:
-        fmt = format_ner_output(item)
-        formatted.append(fmt)
-        st.session_state.total_processed += 1
-        st.session_state.entities_found += len(fmt['entities'])
-        st.session_state.history_stats['timestamps'].append(fmt['timestamp'])
-        
-        # Stats & Pairs
-        current_diseases = []
-        current_meds = []
-        
-        for ent in fmt['entities']:
-            if "Disease" in ent['Label']: 
-                st.session_state.history_stats['diseases'][ent['Text']] += 1
-                current_diseases.append(ent['Text'])
-            elif "Medication" in ent['Label']: 
-                st.session_state.history_stats['medications'][ent['Text']] += 1
-                current_meds.append(ent['Text'])
-        
-        # Simple Pair Counting (Cross product for now)
-        for d in current_diseases:
-            for m in current_meds:
-                st.session_state.history_stats['pairs'][(d, m)] += 1
-                
-    return formatted
+@st.cache_data(ttl=1.0, show_spinner=False)
+def get_worker_metrics():
+    # Scraped at most once a second for all sessions; None while no worker is up
+    return scrape(METRICS_URLS, timeout=0.3)
+
+def session_snapshot():
+    """
+    The shared snapshot, or this session's view of it since its last purge,
+    rebuilt only when the aggregates change.
+    """
+    baseline = st.session_state.get("purge_baseline")
+    if baseline is None:
+        return service.snapshot()
+    snapshot = st.session_state.get("purged_snapshot")
+    if snapshot is None or snapshot['version'] != service.version:
+        snapshot = st.session_state.purged_snapshot = service.snapshot(since=baseline)
+    return snapshot
+
+CRITICAL_CONDITIONS = ["sepsis", "stroke", "myocardial infarction", "meningitis", "pulmonary embolism"]
 
 def is_critical(entities):
     for ent in entities:
@@ -234,32 +207,64 @@ def is_critical(entities):
             return True
     return False
 
-# --- TABS ---
-tab_ops, tab_intel, tab_vault = st.tabs(["🚀 OPS CENTER", "🧠 INTEL CORE", "💾 DATA VAULT"])
+# Sidebar
+with st.sidebar:
+    st.title("COMMAND")
+    with st.expander("System Controls", expanded=True):
+        run_live = st.toggle("UPLINK ACTIVE", value=True)
+        if st.button("PURGE BUFFER", type="primary"):
+            # Clears this session's view only; other viewers and the checkpoint keep everything
+            st.session_state.purge_baseline = service.baseline()
+            st.session_state.purged_snapshot = None
+            st.rerun()
+
+    st.markdown("---")
+    st.markdown("<div style='text-align: center; color: #64748b; font-size: 0.8rem;'>Architected by <br><b>Oussama Aslouj</b></div>", unsafe_allow_html=True)
+
+# Streamlit can't push to a browser without a script run, so while the uplink is active a
+# tiny fragment compares the watcher's version with the one this session last rendered,
+# once a second. Only when new results have landed does it rerun the page; an idle tick
+# does nothing else. The store itself is only read by the watcher.
+LIVE_EVERY = 1.0 if run_live else None
 
-with tab_ops:
+@st.fragment(run_every=LIVE_EVERY)
+def live_updates():
+    if service.version != st.session_state.get("rendered_version"):
+        st.rerun()
+
+@st.fragment
+def ops_panel():
+    snapshot = session_snapshot()
+    telemetry = get_worker_metrics()
+    end_to_end = telemetry['end_to_end'] if telemetry else None
+    if end_to_end and end_to_end['count']:
+        latency = f"{end_to_end['p50_ms']:.0f}ms"
+        latency_note = f"p95 {end_to_end['p95_ms']:.0f}ms · {telemetry['throughput']:.1f} notes/s"
+    else:
+        latency = "—"
+        latency_note = "Awaiting worker" if telemetry else "Worker offline"
     # CUSTOM METRIC CARDS
     m1, m2, m3, m4 = st.columns(4)
     with m1:
         st.markdown(f"""
         <div class="glass-card">
             <div class="metric-label"><i class="fa-solid fa-file-medical metric-icon"></i> RECORDS SCANNED</div>
-            <div class="metric-value">{st.session_state.total_processed}</div>
+            <div class="metric-value">{snapshot['total_processed']}</div>
             <div style="font-size:0.75rem; color:#4ade80; margin-top:5px;"><i class="fa-solid fa-arrow-trend-up"></i> Live Feed</div>
         </div>""", unsafe_allow_html=True)
     with m2:
         st.markdown(f"""
         <div class="glass-card">
             <div class="metric-label"><i class="fa-solid fa-tags metric-icon"></i> ENTITIES EXTRACTED</div>
-            <div class="metric-value">{st.session_state.entities_found}</div>
+            <div class="metric-value">{snapshot['entities_found']}</div>
             <div style="font-size:0.75rem; color:#60a5fa; margin-top:5px;"><i class="fa-solid fa-bullseye"></i> High Precision</div>
         </div>""", unsafe_allow_html=True)
     with m3:
         st.markdown(f"""
         <div class="glass-card">
             <div class="metric-label"><i class="fa-solid fa-server metric-icon"></i> LATENCY</div>
-            <div class="metric-value">24ms</div>
-            <div style="font-size:0.75rem; color:#a855f7; margin-top:5px;"><i class="fa-solid fa-bolt"></i> Real-time</div>
+            <div class="metric-value">{latency}</div>
+            <div style="font-size:0.75rem; color:#a855f7; margin-top:5px;"><i class="fa-solid fa-bolt"></i> {latency_note}</div>
         </div>""", unsafe_allow_html=True)   
     with m4:
         st.markdown(f"""
@@ -269,10 +274,19 @@ with tab_ops:
             <div style="font-size:0.75rem; color:#94a3b8; margin-top:5px;"><i class="fa-solid fa-lock"></i> HIPAA Compliant</div>
         </div>""", unsafe_allow_html=True)
     
+    if telemetry:
+        with st.expander("Pipeline Telemetry", expanded=False):
+            stages = pd.DataFrame([{'Stage': stage, 'Calls': stats['count'], 'p50 (ms)': stats['p50_ms'], 'p95 (ms)': stats['p95_ms'], 'Mean (ms)': stats['mean_ms']}
+                                   for stage, stats in telemetry['stages'].items()])
+            st.dataframe(stages, use_container_width=True, hide_index=True)
+            depth = telemetry['queue_depth']
+            st.caption(f"{telemetry['workers']} worker(s) · queue depth {depth if depth is not None else 'n/a'} · "
+                       f"{telemetry['counters'].get('notes_processed', 0)} notes processed")
+
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown('<div style="margin-bottom:10px; font-weight:600; font-size:0.9rem; color:#94a3b8; text-transform:uppercase; letter-spacing:0.05em;"><i class="fa-solid fa-satellite-dish"></i> Incoming Transmission Log</div>', unsafe_allow_html=True)
     
-    msgs = st.session_state.messages[:15]
+    msgs = snapshot['messages'][:15]
     if not msgs: st.info("Awaiting Stream Initialization...")
     
     for msg in msgs:
@@ -301,115 +315,143 @@ with tab_ops:
                     st.markdown(tags, unsafe_allow_html=True)
                 else: st.caption("No pathology.")
 
-with tab_intel:
+# Chart specs are built once per snapshot version (and purge, for sessions that purged) and
+# shared by all sessions. The snapshot itself is passed unhashed (leading underscore).
+@st.cache_data(max_entries=4, show_spinner=False)
+def intel_charts(version, purged_at, _snapshot):
+    """
+    Vega-Lite specs (data inlined) of the frequency and correlation charts, None where there is no data yet.
+    """
+    def bars(data, field, color):
+        return alt.Chart(data).mark_bar(cornerRadiusTopLeft=4, cornerRadiusTopRight=4).encode(
+            x=alt.X('Count', title=None), y=alt.Y(field, sort='-x', title=None),
+            color=alt.value(color), tooltip=[field, 'Count']
+        ).properties(height=250).configure_axis(grid=False, labelColor='#94a3b8').configure_view(strokeWidth=0).to_dict()
+
+    charts = {'diseases': None, 'medications': None, 'pairs': None}
+    if not _snapshot['diseases'].empty:
+        charts['diseases'] = bars(_snapshot['diseases'], 'Disease', '#ef4444')
+    if not _snapshot['medications'].empty:
+        charts['medications'] = bars(_snapshot['medications'], 'Medication', '#3b82f6')
+    if not _snapshot['pairs'].empty:
+        charts['pairs'] = alt.Chart(_snapshot['pairs']).mark_rect().encode(
+            x='Medication:O', y='Disease:O',
+            color=alt.Color('Count:Q', scale=alt.Scale(scheme='magma')),
+            tooltip=['Disease', 'Medication', 'Count']
+        ).properties(height=300).to_dict()
+    return charts
+
+@st.cache_data(max_entries=12, show_spinner=False)
+def velocity_chart(version, purged_at, width, _snapshot):
+    """
+    Vega-Lite spec of the notes-per-bin area chart at bin `width` seconds, None while empty.
+    """
+    ts_df = _snapshot['velocity'][width]
+    if ts_df.empty:
+        return None
+    return alt.Chart(ts_df).mark_area(
+        line={'color':'#4ade80'},
+        color=alt.Gradient(
+            gradient='linear',
+            stops=[alt.GradientStop(offset=0, color='#4ade80'), alt.GradientStop(offset=1, color='rgba(74, 222, 128, 0.1)')],
+            x1=1, x2=1, y1=1, y2=0
+        )
+    ).encode(
+        x='Timestamp:T',
+        y='Count:Q'
+    ).properties(height=300).to_dict()
+
+# Changing the resolution reruns only this panel
+@st.fragment
+def intel_panel():
+    snapshot = session_snapshot()
+    charts = intel_charts(snapshot['version'], snapshot['purged_at'], snapshot)
     st.markdown("### <i class='fa-solid fa-brain' style='color:#a855f7'></i> Clinical Intelligence Core", unsafe_allow_html=True)
     
     # Row 1: Frequency Distributions
     c1, c2 = st.columns(2)
     with c1:
         st.markdown("#### Pathology Frequency")
-        if st.session_state.history_stats['diseases']:
-            data = pd.DataFrame.from_dict(st.session_state.history_stats['diseases'], orient='index', columns=['Count']).reset_index()
-            data.columns = ['Disease', 'Count']
-            chart = alt.Chart(data).mark_bar(cornerRadiusTopLeft=4, cornerRadiusTopRight=4).encode(
-                x=alt.X('Count', title=None), y=alt.Y('Disease', sort='-x', title=None),
-                color=alt.value('#ef4444'), tooltip=['Disease', 'Count']
-            ).properties(height=250).configure_axis(grid=False, labelColor='#94a3b8').configure_view(strokeWidth=0)
-            st.altair_chart(chart, use_container_width=True)
+        if charts['diseases']:
+            st.vega_lite_chart(spec=charts['diseases'], use_container_width=True)
     with c2:
         st.markdown("#### Therapeutic Utilization")
-        if st.session_state.history_stats['medications']:
-            data = pd.DataFrame.from_dict(st.session_state.history_stats['medications'], orient='index', columns=['Count']).reset_index()
-            data.columns = ['Medication', 'Count']
-            chart = alt.Chart(data).mark_bar(cornerRadiusTopLeft=4, cornerRadiusTopRight=4).encode(
-                x=alt.X('Count', title=None), y=alt.Y('Medication', sort='-x', title=None),
-                color=alt.value('#3b82f6'), tooltip=['Medication', 'Count']
-            ).properties(height=250).configure_axis(grid=False, labelColor='#94a3b8').configure_view(strokeWidth=0)
-            st.altair_chart(chart, use_container_width=True)
+        if charts['medications']:
+            st.vega_lite_chart(spec=charts['medications'], use_container_width=True)
 
     # Row 2: Heatmap & Time Series
     c3, c4 = st.columns(2)
     with c3:
         st.markdown("#### Treatment Correlations (Disease vs Meds)")
-        if st.session_state.history_stats['pairs']:
-            pair_data = [{'Disease': k[0], 'Medication': k[1], 'Count': v} for k, v in st.session_state.history_stats['pairs'].items()]
-            df_pairs = pd.DataFrame(pair_data)
-            chart_heat = alt.Chart(df_pairs).mark_rect().encode(
-                x='Medication:O', y='Disease:O',
-                color=alt.Color('Count:Q', scale=alt.Scale(scheme='magma')),
-                tooltip=['Disease', 'Medication', 'Count']
-            ).properties(height=300)
-            st.altair_chart(chart_heat, use_container_width=True)
+        if charts['pairs']:
+            st.vega_lite_chart(spec=charts['pairs'], use_container_width=True)
         else: st.info("Correlating data...")
 
     with c4:
         st.markdown("#### Patient Influx Velocity")
-        if st.session_state.history_stats['timestamps']:
-            # Create a time series dataframe
-            ts_df = pd.DataFrame({'Timestamp': pd.to_datetime(st.session_state.history_stats['timestamps'], unit='s')})
-            ts_df['Count'] = 1
-            ts_df = ts_df.set_index('Timestamp').resample('10s').sum().reset_index() # 10s bins
-            
-            chart_line = alt.Chart(ts_df).mark_area(
-                line={'color':'#4ade80'},
-                color=alt.Gradient(
-                    gradient='linear',
-                    stops=[alt.GradientStop(offset=0, color='#4ade80'), alt.GradientStop(offset=1, color='rgba(74, 222, 128, 0.1)')],
-                    x1=1, x2=1, y1=1, y2=0
-                )
-            ).encode(
-                x='Timestamp:T',
-                y='Count:Q'
-            ).properties(height=300)
-            st.altair_chart(chart_line, use_container_width=True)
+        resolution = st.radio("Resolution", ["10s", "1min", "1h"], horizontal=True, label_visibility="collapsed")
+        chart_line = velocity_chart(snapshot['version'], snapshot['purged_at'], {"10s": 10, "1min": 60, "1h": 3600}[resolution], snapshot)
+        if chart_line:
+            st.vega_lite_chart(spec=chart_line, use_container_width=True)
         else: st.info("Gathering timeline...")
 
-with tab_vault:
+def vault_frame(rows):
+    return pd.DataFrame([{'Time': time.strftime('%H:%M:%S', time.localtime(ts)), 'Content': text, 'Entities': entities} for ts, text, entities in rows],
+                        columns=['Time', 'Content', 'Entities'])
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def export_csv(search_term, version):
+    """
+    CSV of the top 10,000 matches, built once per (term, index version).
+    """
+    _, rows = service.search(search_term, page_size=10000)
+    return vault_frame(rows).to_csv(index=False).encode('utf-8')
+
+# Searches rerun only this fragment
+@st.fragment
+def vault_panel():
     st.markdown("### <i class='fa-solid fa-magnifying-glass' style='color:#60a5fa'></i> Smart Query Engine", unsafe_allow_html=True)
     
-    # Search Bar
-    search_term = st.text_input("Filter Registry (Name, ID, Diagnosis, Rx...)", placeholder="e.g. Sepsis, 10293, Aspirin...")
+    # Search Bar; a new term starts again from its first page
+    search_term = st.text_input("Filter Registry (Name, ID, Diagnosis, Rx...)", placeholder="e.g. Sepsis, 10293, Aspirin...",
+                                on_change=lambda: st.session_state.update(vault_page=1))
     
-    if st.session_state.messages:
-        df = pd.DataFrame([{'Time': time.strftime('%H:%M:%S', time.localtime(m['timestamp'])), 'Content': m['text'], 'Entities': ", ".join([e['Text'] for e in m['entities']])} for m in st.session_state.messages])
-        
-        # Filter
-        if search_term:
-            df = df[df.apply(lambda row: row.astype(str).str.contains(search_term, case=False).any(), axis=1)]
-        
-        st.dataframe(df, use_container_width=True, hide_index=True)
+    # Ranked lookups on the inverted index over the full history; one call gives the page and the total
+    PAGE_SIZE = 50
+    st.session_state.setdefault("vault_page", 1)
+    page = st.session_state.vault_page - 1
+    total_matches, rows = service.search(search_term, page=page, page_size=PAGE_SIZE)
+    n_pages = (total_matches + PAGE_SIZE - 1) // PAGE_SIZE
+    if total_matches and page >= n_pages:
+        # The index was purged since the page was picked
+        page = n_pages - 1
+        st.session_state.vault_page = n_pages
+        total_matches, rows = service.search(search_term, page=page, page_size=PAGE_SIZE)
+    if total_matches:
+        p1, p2 = st.columns([1, 3])
+        with p1:
+            st.number_input("Page", min_value=1, max_value=n_pages, step=1, key="vault_page")
+        with p2:
+            st.caption(f"{total_matches} matching records across the full history · page {page + 1} of {n_pages}")
+
+        st.dataframe(vault_frame(rows), use_container_width=True, hide_index=True)
         
-        # CSV Export
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Download Filtered Report (CSV)",
-            data=csv,
-            file_name='helix_intelligence_report.csv',
-            mime='text/csv',
-        )
+        # CSV Export (top-ranked matches), only built when asked for
+        if st.button("Export Filtered Report"):
+            st.download_button(
+                label="Download Filtered Report (CSV)",
+                data=export_csv(search_term, service.version),
+                file_name='helix_intelligence_report.csv',
+                mime='text/csv',
+            )
+    elif search_term: st.caption("No matching records.")
     else: st.caption("Vault empty.")
 
-# Sidebar
-with st.sidebar:
-    st.title("COMMAND")
-    with st.expander("System Controls", expanded=True):
-        run_live = st.toggle("UPLINK ACTIVE", value=True)
-        if st.button("PURGE BUFFER", type="primary"):
-            st.session_state.messages = []
-            st.session_state.total_processed = 0
-            st.session_state.entities_found = 0
-            st.session_state.history_stats = {'diseases': Counter(), 'medications': Counter(), 'pairs': Counter(), 'timestamps': []}
-            st.rerun()
-
-    st.markdown("---")
-    st.markdown("<div style='text-align: center; color: #64748b; font-size: 0.8rem;'>Architected by <br><b>Oussama Aslouj</b></div>", unsafe_allow_html=True)
-
-
-if run_live:
-    new_items = read_data()
-    if new_items:
-        formatted = process_batch(new_items)
-        for f in formatted: st.session_state.messages.insert(0, f)
-        st.session_state.messages = st.session_state.messages[:200]
-        time.sleep(0.8)
-        st.rerun()
+# --- TABS ---
+# Read before the panels take their snapshots, so a result landing meanwhile triggers one more rerun
+st.session_state.rendered_version = service.version
+tab_ops, tab_intel, tab_vault = st.tabs(["🚀 OPS CENTER", "🧠 INTEL CORE", "💾 DATA VAULT"])
+with tab_ops: ops_panel()
+with tab_intel: intel_panel()
+with tab_vault: vault_panel()
+live_updates()
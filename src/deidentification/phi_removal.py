@@ -1,4 +1,69 @@
 import re
+from bisect import bisect_right
+
+class OffsetMap:
+    """
+    Maps character offsets between a de-identified text and its original.
+
+    Built from the replacements made by PHIRemover; each edit is
+    (masked_start, masked_end, original_start, original_end). Lookups are a
+    binary search over the edits, so no regex has to be re-run.
+    """
+    def __init__(self, edits=()):
+        self.edits = [tuple(edit) for edit in edits]
+        self.masked_starts = [edit[0] for edit in self.edits]
+        self.original_starts = [edit[2] for edit in self.edits]
+
+    @classmethod
+    def from_replacements(cls, replacements):
+        """
+        Builds the map from (original_start, original_end, placeholder) replacements.
+        """
+        edits = []
+        delta = 0
+        for original_start, original_end, placeholder in sorted(replacements):
+            masked_start = original_start + delta
+            edits.append((masked_start, masked_start + len(placeholder), original_start, original_end))
+            delta += len(placeholder) - (original_end - original_start)
+        return cls(edits)
+
+    def _translate(self, offset, starts, source, target, end):
+        i = bisect_right(starts, offset - 1 if end else offset) - 1
+        if i < 0:
+            return offset
+        edit = self.edits[i]
+        source_start, source_end = edit[source], edit[source + 1]
+        target_start, target_end = edit[target], edit[target + 1]
+        if offset < source_end or (end and offset == source_end):
+            # Inside a replaced span: snap to the whole span
+            return target_end if end else target_start
+        return offset - source_end + target_end
+
+    def to_original(self, offset, end=False):
+        """
+        Translates an offset in the masked text to the original text.
+        With `end=True` the offset is treated as an exclusive span end.
+        """
+        return self._translate(offset, self.masked_starts, 0, 2, end)
+
+    def to_masked(self, offset, end=False):
+        """
+        Translates an offset in the original text to the masked text.
+        """
+        return self._translate(offset, self.original_starts, 2, 0, end)
+
+    def to_original_span(self, start, end):
+        return self.to_original(start), self.to_original(end, end=True)
+
+    def translate_entities(self, entities):
+        """
+        Returns copies of NER entities with `original_start`/`original_end` added.
+        """
+        translated = []
+        for entity in entities:
+            original_start, original_end = self.to_original_span(entity['start'], entity['end'])
+            translated.append(dict(entity, original_start=original_start, original_end=original_end))
+        return translated
 
 class PHIRemover:
     """
@@ -20,32 +85,142 @@ class PHIRemover:
         # Specific pattern for "ID: <num>. <Name>" which was missed
         self.id_name_pattern = re.compile(r'ID:\s*\d+\.\s+([A-Z][a-z]+(\s[A-Z][a-z]+)?)')
 
+        # All rules above combined into one alternation, in the order the sequential
+        # passes apply them. Named groups tell the replacement which placeholder to use.
+        # Every branch starts with one of a few known characters, which the leading
+        # lookahead exposes to the regex engine so it can skip ahead between candidates:
+        # name contexts are matched as literals instead of lookbehinds, and the date/ID
+        # word boundary is checked after the first digit ("\d(?<!\w\d)" == "\b\d").
+        self.scrub_pattern = re.compile(
+            r'(?=[IPfeD\d])(?:'
+            r'(?P<id_name>(?P<id_prefix>ID:\s*)(?P<id_digits>\d+)(?P<id_sep>\.\s+)(?P<id_name_value>[A-Z][a-z]+(?:\s[A-Z][a-z]+)?))'
+            r'|(?P<date>\d(?<!\w\d)\d?[/-]\d{1,2}[/-]\d{2,4}\b)'
+            r'|(?P<id>\d(?<!\w\d)\d{4}\b)'
+            r'|(?P<name>(?P<name_context>Patient\s|for\s|evaluated\s)(?P<name_value>[A-Z][a-z]+(?:\s[A-Z][a-z]+)?))'
+            r'|(?P<dr>(?P<dr_context>Dr\.\s)(?P<dr_value>[A-Z][a-z]+))'
+            r')'
+        )
+        # Name rules of the sequential reference implementation
+        self.patient_name_pattern = re.compile(r'(?<=Patient\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)')
+        self.dr_name_pattern = re.compile(r'(?<=Dr\.\s)([A-Z][a-z]+)')
+        self.for_name_pattern = re.compile(r'(?<=for\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)') # "Discharge summary for X"
+        self.evaluated_name_pattern = re.compile(r'(?<=evaluated\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)') # "evaluated X"
+
+        # Contexts the name rules look behind for
+        self.context_pattern = re.compile(r'(?:Patient|for|evaluated)\s|Dr\.\s')
+
     def deidentify(self, text):
         """
         Replaces PHI in the text with placeholder tags.
+        All rules are applied in a single scan of the text.
+        """
+        conflicts = []
+        cleaned_text = self.scrub_pattern.sub(lambda m: self._scrub_match(m, conflicts), text)
+        if conflicts:
+            # A rule overlapped the context of a later one: only the sequential passes give the reference output
+            return self._deidentify_sequential(text)
+        return cleaned_text
+
+    def deidentify_with_map(self, text):
+        """
+        Same as `deidentify`, but also returns an OffsetMap between the cleaned
+        and the original text, so entity offsets can be reconciled with the source.
+        """
+        conflicts = []
+        replacements = []
+        cleaned_text = self.scrub_pattern.sub(lambda m: self._scrub_match(m, conflicts, replacements), text)
+        if conflicts:
+            replacements = []
+            cleaned_text = self._deidentify_sequential(text, replacements)
+        return cleaned_text, OffsetMap.from_replacements(replacements)
+
+    def deidentify_batch(self, texts):
+        """
+        De-identifies a list of texts, returned in the same order.
+        """
+        deidentify = self.deidentify
+        return [deidentify(text) for text in texts]
+
+    def deidentify_batch_with_map(self, texts):
+        """
+        Batch version of `deidentify_with_map`: returns (cleaned_texts, offset_maps).
+        """
+        pairs = [self.deidentify_with_map(text) for text in texts]
+        return [cleaned for cleaned, _ in pairs], [offset_map for _, offset_map in pairs]
+
+    def _scrub_match(self, m, conflicts, replacements=None):
+        kind = m.lastgroup
+        if kind == 'date' or kind == 'id':
+            placeholder = '[DATE]' if kind == 'date' else '[ID]'
+            if replacements is not None:
+                replacements.append((m.start(), m.end(), placeholder))
+            return placeholder
+
+        value_start = m.start(kind + '_value')
+        # The sequential passes replace one rule at a time, so once a name is masked a
+        # later rule can no longer see a context inside it (e.g. "Smithfor Mary"), and a
+        # masked name next to a digit creates a new word boundary for the date/ID rules.
+        if self.context_pattern.search(m.string, value_start, m.end() + 2):
+            conflicts.append(m)
+        elif kind == 'id_name' and m.string[m.end():m.end() + 1].isalnum():
+            conflicts.append(m)
+
+        if replacements is not None:
+            replacements.append((value_start, m.end(), '[NAME]'))
+
+        if kind == 'id_name':
+            digits = m.group('id_digits')
+            # The ID rule still applies to the number the ID/name rule consumed
+            if len(digits) == 5:
+                digits = '[ID]'
+                if replacements is not None:
+                    replacements.append(m.span('id_digits') + ('[ID]',))
+            return m.group('id_prefix') + digits + m.group('id_sep') + '[NAME]'
+        return m.string[m.start():value_start] + '[NAME]'
+
+    def _deidentify_sequential(self, text, replacements=None):
+        """
+        Reference implementation: applies each rule in its own pass over the text.
+        If `replacements` is given, (original_start, original_end, placeholder)
+        tuples are appended to it for every replaced span.
         """
         cleaned_text = text
-        
-        # Patch for "ID: 12345. Name ..." pattern
-        # Must run BEFORE ID replacement because it relies on the number being present
-        cleaned_text = self.id_name_pattern.sub(lambda m: m.group(0).replace(m.group(1), '[NAME]'), cleaned_text)
+        offset_map = OffsetMap()
 
-        # Replace Dates
-        cleaned_text = self.date_pattern.sub('[DATE]', cleaned_text)
-        
-        # Replace IDs
-        cleaned_text = self.id_pattern.sub('[ID]', cleaned_text)
-        
-        # Replace Names
-        # Note: Name replacement is tricky with regex alone.
-        # We'll use a slightly broader pattern for the simulation based on our generator's structure.
-        # Capturing "Patient X" or "Dr. Y"
-        
-        # Specific replacements based on known prefixes in our synthetic data
-        cleaned_text = re.sub(r'(?<=Patient\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)', '[NAME]', cleaned_text)
-        cleaned_text = re.sub(r'(?<=Dr\.\s)([A-Z][a-z]+)', '[NAME]', cleaned_text)
-        cleaned_text = re.sub(r'(?<=for\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)', '[NAME]', cleaned_text) # "Discharge summary for X"
-        cleaned_text = re.sub(r'(?<=evaluated\s)([A-Z][a-z]+(\s[A-Z][a-z]+)?)', '[NAME]', cleaned_text) # "evaluated X"
+        passes = [
+            # Patch for "ID: 12345. Name ..." pattern
+            # Must run BEFORE ID replacement because it relies on the number being present
+            (self.id_name_pattern, 1, '[NAME]'),
+            # Replace Dates
+            (self.date_pattern, 0, '[DATE]'),
+            # Replace IDs
+            (self.id_pattern, 0, '[ID]'),
+            # Replace Names
+            # Note: Name replacement is tricky with regex alone.
+            # Specific replacements based on known prefixes in our synthetic data
+            # Capturing "Patient X" or "Dr. Y"
+            (self.patient_name_pattern, 1, '[NAME]'),
+            (self.dr_name_pattern, 1, '[NAME]'),
+            (self.for_name_pattern, 1, '[NAME]'),
+            (self.evaluated_name_pattern, 1, '[NAME]'),
+        ]
+
+        for pattern, group, placeholder in passes:
+            pieces = []
+            last = 0
+            for m in pattern.finditer(cleaned_text):
+                start, end = m.span(group)
+                pieces.append(cleaned_text[last:start])
+                pieces.append(placeholder)
+                last = end
+                if replacements is not None:
+                    # Earlier placeholders are never matched again, so the span maps cleanly back
+                    replacements.append((offset_map.to_original(start), offset_map.to_original(end, end=True), placeholder))
+            if last:
+                pieces.append(cleaned_text[last:])
+                cleaned_text = ''.join(pieces)
+                if replacements is not None:
+                    offset_map = OffsetMap.from_replacements(replacements)
 
         return cleaned_text
 
@@ -0,0 +1,155 @@
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import datetime
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+MANIFEST_NAME = 'helix_artifact.json'
+WEIGHTS_NAME = 'model.safetensors'
+TOKENIZER_NAME = 'tokenizer.json'
+LABELS_NAME = 'labels.json'
+
+# Bumped whenever the artifact layout changes
+ARTIFACT_FORMAT = 1
+
+def read_manifest(path):
+    """
+    Returns the manifest of the compiled artifact at `path`, or None if `path` isn't one.
+    """
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} is a format {manifest.get('format')} artifact, expected {ARTIFACT_FORMAT}; recompile it")
+    return manifest
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compile_artifact(model_name, output_dir):
+    """
+    Writes a self-contained copy of `model_name` (hub name or local directory) to `output_dir`:
+    - `model.safetensors`: the weights, memory-mapped at load time.
+    - `tokenizer.json`: the fast tokenizer, already converted from any slow vocabulary.
+    - `config.json` and `labels.json`: the label maps (`labels.json` also lists the entity groups).
+    - `helix_artifact.json`: the manifest (source, weights hash), written last.
+
+    The artifact is assembled next to `output_dir` and renamed into place, so
+    workers never see a half-written one. Returns the manifest.
+    """
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+    import transformers
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError(f"{model_name} has no fast tokenizer; the NER pipeline needs one for character offsets")
+    model = AutoModelForTokenClassification.from_pretrained(model_name).eval()
+
+    output_dir = os.path.abspath(output_dir)
+    tmp_dir = output_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model.save_pretrained(tmp_dir, safe_serialization=True)
+    tokenizer.save_pretrained(tmp_dir)
+    if not os.path.isfile(os.path.join(tmp_dir, WEIGHTS_NAME)):
+        raise RuntimeError(f"{model_name} was saved as sharded weights; artifacts need a single {WEIGHTS_NAME}")
+    if not os.path.isfile(os.path.join(tmp_dir, TOKENIZER_NAME)):
+        raise RuntimeError(f"The {model_name} tokenizer didn't save a {TOKENIZER_NAME}")
+
+    id2label = {int(i): label for i, label in model.config.id2label.items()}
+    with open(os.path.join(tmp_dir, LABELS_NAME), 'w') as f:
+        json.dump({
+            "id2label": id2label,
+            "label2id": {label: i for i, label in id2label.items()},
+            # What the pipeline's "simple" aggregation reports, i.e. labels without their B-/I- prefix
+            "entity_groups": sorted({label[2:] if label[:2] in ("B-", "I-") else label for label in id2label.values()}),
+        }, f, indent=2)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "source": model_name,
+        "weights_sha256": file_sha256(os.path.join(tmp_dir, WEIGHTS_NAME)),
+        "model_type": model.config.model_type,
+        "num_labels": len(id2label),
+        "transformers_version": transformers.__version__,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(output_dir):
+        old_dir = output_dir + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(output_dir, old_dir)
+        os.replace(tmp_dir, output_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(tmp_dir, output_dir)
+    return manifest
+
+def load_artifact(path):
+    """
+    Loads a compiled artifact without touching the network. Returns (model, tokenizer).
+
+    The model is built without allocating or initializing weights, then
+    pointed at tensors memory-mapped from `model.safetensors`: pages are read
+    on first use and stay in the page cache, shared by every worker (and
+    every process on the host) that loads the same file.
+    """
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoTokenizer, AutoModelForTokenClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+    try:
+        from transformers.integrations.accelerate import init_empty_weights
+    except ImportError:
+        # Older transformers: let from_pretrained do the (slower, copying) load, still offline
+        return AutoModelForTokenClassification.from_pretrained(path, local_files_only=True).eval(), tokenizer
+
+    config = AutoConfig.from_pretrained(path, local_files_only=True)
+    # Parameters on the meta device; buffers (position ids) are real, as they aren't in the weights file
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForTokenClassification.from_config(config)
+    state = load_file(os.path.join(path, WEIGHTS_NAME))
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    if unexpected:
+        raise ValueError(f"{path} has weights the {config.model_type} model doesn't use: {unexpected[:5]}")
+    if missing:
+        # Weights saved once for tied parameters (e.g. shared embeddings)
+        model.tie_weights()
+        still_missing = [name for name, param in model.named_parameters() if param.is_meta]
+        if still_missing:
+            raise ValueError(f"{path} is missing weights: {still_missing[:5]}")
+    return model.eval(), tokenizer
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix model compiler: write a local artifact workers load in about a second")
+    parser.add_argument('--model', default="d4data/biomedical-ner-all", help="Hugging Face model name or local model directory.")
+    parser.add_argument('--output', required=True, help="Directory to write the artifact to (replaced if it exists).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    manifest = compile_artifact(args.model, args.output)
+    print(f" [✓] Compiled {args.model} to {args.output} in {time.perf_counter() - started:.1f}s "
+          f"(weights {manifest['weights_sha256'][:12]}, {manifest['num_labels']} labels).")
+
+    # Time a cold load the way a worker does it
+    started = time.perf_counter()
+    load_artifact(args.output)
+    print(f" [i] Loads in {time.perf_counter() - started:.2f}s; start workers with --model {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import sys
+import os
+import csv
+import json
+import time
+import queue
+import argparse
+import datetime
+import threading
+
+import pyarrow as pa
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.deidentification.phi_removal import PHIRemover
+from src.ner.inference import add_model_arguments, load_model, apply_runtime, build_result
+from src.storage.segment_store import SCHEMA, SEGMENT_SUFFIX, to_record_batch
+
+CHECKPOINT_NAME = 'checkpoint.json'
+
+# Marks the end of the stream between stages
+DONE = object()
+
+def parse_timestamp(value):
+    """
+    Accepts UNIX seconds (number or numeric string) or an ISO 8601 date/time (UTC unless it says otherwise).
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+def read_notes(path, text_field='note', timestamp_field='timestamp'):
+    """
+    Yields producer-style messages ({"note", "timestamp"}) from a JSONL or CSV file, in file order.
+    Records without a timestamp get the file's modification time, so reruns see the same input.
+    """
+    fallback = os.path.getmtime(path)
+
+    def message(record):
+        timestamp = parse_timestamp(record.get(timestamp_field))
+        return {'note': record[text_field], 'timestamp': fallback if timestamp is None else timestamp}
+
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                yield message(row)
+    else:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield message(json.loads(line))
+
+class Backfill:
+    """
+    Reprocesses historical notes with the current model, without RabbitMQ.
+
+    Reading, de-identification, NER and writing run as separate threads
+    connected by bounded queues, so a batch is de-identified while the
+    previous one is in the model (torch releases the GIL during the forward
+    pass) and a slow stage holds back the ones before it instead of
+    buffering without limit.
+
+    Results are written to `output_dir` as numbered shards of `shard_size`
+    notes in input order, each sorted by timestamp and readable with
+    `read_segment`. A shard is renamed into place only once complete, and
+    the checkpoint listing the finished shards is rewritten after each one,
+    so a crashed run resumes at the first unfinished shard.
+    """
+    def __init__(self, model, phi_remover, output_dir, shard_size=10000, batch_size=64, queue_size=4, fsync=True):
+        self.model = model
+        self.phi_remover = phi_remover
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.fsync = fsync
+
+        self.stopped = threading.Event()
+        self.error = None
+        # Seconds each stage spent working, to show the bottleneck
+        self.busy = {"read": 0.0, "deidentify": 0.0, "ner": 0.0, "write": 0.0}
+
+    def checkpoint_path(self):
+        return os.path.join(self.output_dir, CHECKPOINT_NAME)
+
+    def shard_path(self, index):
+        return os.path.join(self.output_dir, f"shard-{index:06d}{SEGMENT_SUFFIX}")
+
+    def _describe(self, paths):
+        return {
+            "inputs": [{"path": os.path.abspath(path), "size": os.path.getsize(path)} for path in paths],
+            "model_version": self.model.model_version(),
+            "shard_size": self.shard_size,
+        }
+
+    def load_checkpoint(self, paths, restart=False):
+        """
+        Returns the checkpoint to resume from, or a fresh one.
+        Refuses to resume a run over different inputs, model or shard size.
+        """
+        fresh = dict(self._describe(paths), shards=[], complete=False)
+        if restart or not os.path.exists(self.checkpoint_path()):
+            return fresh
+        with open(self.checkpoint_path(), 'r') as f:
+            state = json.load(f)
+        for key in ("inputs", "model_version", "shard_size"):
+            if state.get(key) != fresh[key]:
+                raise ValueError(f"{self.checkpoint_path()} was written for a different {key.replace('_', ' ')}; "
+                                 f"use a new output directory or --restart")
+        return state
+
+    def _save_checkpoint(self, state):
+        tmp_path = self.checkpoint_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path())
+
+    def _put(self, target, item):
+        # Bounded put that gives up once another stage has failed
+        while not self.stopped.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        # Blocking get that returns DONE once another stage has failed
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set():
+                    return DONE
+
+    def _stage(self, name, source, target, work):
+        """
+        Runs `work` on every item from `source` and passes the result on, until DONE.
+        """
+        try:
+            while True:
+                item = self._get(source)
+                if item is DONE:
+                    break
+                started = time.perf_counter()
+                result = work(item)
+                self.busy[name] += time.perf_counter() - started
+                if not self._put(target, result):
+                    return
+        except BaseException as e:
+            self.error = e
+            self.stopped.set()
+        self._put(target, DONE)
+
+    def _read(self, paths, skip, target, text_field, timestamp_field):
+        try:
+            batch = []
+            seen = 0
+            started = time.perf_counter()
+            for path in paths:
+                for message in read_notes(path, text_field, timestamp_field):
+                    seen += 1
+                    # Notes of finished shards are skipped, not reprocessed
+                    if seen <= skip:
+                        continue
+                    batch.append(message)
+                    if len(batch) >= self.batch_size:
+                        self.busy["read"] += time.perf_counter() - started
+                        if not self._put(target, batch):
+                            return
+                        batch = []
+                        started = time.perf_counter()
+            if batch:
+                self.busy["read"] += time.perf_counter() - started
+                self._put(target, batch)
+        except BaseException as e:
+            self.error = e
+            self.stopped.set()
+        self._put(target, DONE)
+
+    def _deidentify(self, messages):
+        cleaned_texts, offset_maps = self.phi_remover.deidentify_batch_with_map([message['note'] for message in messages])
+        return messages, cleaned_texts, offset_maps
+
+    def _infer(self, batch):
+        messages, cleaned_texts, offset_maps = batch
+        batch_entities = self.model.extract_entities_batch(cleaned_texts, self.batch_size)
+        return [build_result(message, cleaned_text, entities, offset_map)
+                for message, cleaned_text, entities, offset_map in zip(messages, cleaned_texts, batch_entities, offset_maps)]
+
+    def _write_shard(self, index, results):
+        """
+        Writes one shard, sorted by timestamp, and returns its checkpoint entry.
+        """
+        started = time.perf_counter()
+        results.sort(key=lambda result: result['timestamp'])
+        path = self.shard_path(index)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            with pa.ipc.new_stream(f, SCHEMA) as stream:
+                stream.write_batch(to_record_batch(results))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.busy["write"] += time.perf_counter() - started
+        return {"file": os.path.basename(path), "rows": len(results),
+                "min_timestamp": results[0]['timestamp'], "max_timestamp": results[-1]['timestamp']}
+
+    def run(self, paths, restart=False, text_field='note', timestamp_field='timestamp'):
+        """
+        Processes `paths` (JSONL or CSV) into shards, resuming from the checkpoint if there is one.
+        Returns a summary dict.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        state = self.load_checkpoint(paths, restart)
+        if restart:
+            for name in os.listdir(self.output_dir):
+                if name.startswith("shard-") and (name.endswith(SEGMENT_SUFFIX) or name.endswith('.tmp')):
+                    os.remove(os.path.join(self.output_dir, name))
+        if state["complete"]:
+            print(f"Backfill in {self.output_dir} is already complete ({len(state['shards'])} shards).")
+            return self._summary(state, 0, 0.0)
+
+        done = sum(shard["rows"] for shard in state["shards"])
+        if done:
+            print(f"Resuming after {len(state['shards'])} shards ({done} notes).")
+
+        to_deidentify = queue.Queue(self.queue_size)
+        to_infer = queue.Queue(self.queue_size)
+        to_write = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._read, args=(paths, done, to_deidentify, text_field, timestamp_field), name="backfill-read", daemon=True),
+            threading.Thread(target=self._stage, args=("deidentify", to_deidentify, to_infer, self._deidentify), name="backfill-deidentify", daemon=True),
+            threading.Thread(target=self._stage, args=("ner", to_infer, to_write, self._infer), name="backfill-ner", daemon=True),
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        processed = 0
+        pending = []
+        try:
+            while True:
+                results = self._get(to_write)
+                if results is DONE:
+                    break
+                pending.extend(results)
+                while len(pending) >= self.shard_size:
+                    shard, pending = pending[:self.shard_size], pending[self.shard_size:]
+                    processed += len(shard)
+                    self._commit(state, shard, started, processed)
+            if self.error is None and pending:
+                processed += len(pending)
+                self._commit(state, pending, started, processed)
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+        state["complete"] = True
+        self._save_checkpoint(state)
+        return self._summary(state, processed, time.perf_counter() - started)
+
+    def _commit(self, state, results, started, processed):
+        state["shards"].append(self._write_shard(len(state["shards"]), results))
+        self._save_checkpoint(state)
+        elapsed = time.perf_counter() - started
+        print(f" [✓] Shard {len(state['shards']) - 1} written ({processed} notes this run, {processed / elapsed:,.0f} notes/s).")
+
+    def _summary(self, state, processed, elapsed):
+        return {
+            "output_dir": self.output_dir,
+            "shards": len(state["shards"]),
+            "notes": sum(shard["rows"] for shard in state["shards"]),
+            "processed_this_run": processed,
+            "elapsed_s": round(elapsed, 3),
+            "notes_per_s": round(processed / elapsed, 1) if elapsed else 0.0,
+            "stage_busy_s": {stage: round(seconds, 3) for stage, seconds in self.busy.items()},
+        }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix offline backfill: reprocess note files without RabbitMQ")
+    parser.add_argument('inputs', nargs='+', help="JSONL or CSV files of notes, processed in the order given.")
+    parser.add_argument('--output', required=True, help="Directory for the result shards and the checkpoint.")
+    parser.add_argument('--batch-size', type=int, default=64, help="Notes per de-identification and model batch.")
+    parser.add_argument('--shard-size', type=int, default=10000, help="Notes per output shard (and per checkpoint).")
+    parser.add_argument('--queue-size', type=int, default=4, help="Batches each stage may queue ahead of the next.")
+    parser.add_argument('--text-field', default='note', help="JSON key or CSV column holding the note text.")
+    parser.add_argument('--timestamp-field', default='timestamp',
+                        help="JSON key or CSV column holding the note time (UNIX seconds or ISO 8601).")
+    parser.add_argument('--no-fsync', dest='fsync', action='store_false', help="Skip fsync of shards and checkpoints.")
+    parser.add_argument('--restart', action='store_true', help="Discard the checkpoint and existing shards and start over.")
+    add_model_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("Loading NER Model... (this may take a moment)")
+    model = load_model(args)
+    apply_runtime(model, args)
+    backfill = Backfill(model, PHIRemover(), args.output, shard_size=args.shard_size, batch_size=args.batch_size,
+                        queue_size=args.queue_size, fsync=args.fsync)
+    try:
+        summary = backfill.run(args.inputs, restart=args.restart, text_field=args.text_field, timestamp_field=args.timestamp_field)
+    finally:
+        if model.cache is not None:
+            model.cache.close()
+    for key, value in summary.items():
+        print(f"  {key:>18}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,425 @@
+import os
+import sys
+import time
+
+import torch
 from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
 
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.ner.artifact import read_manifest, load_artifact
+
+BACKENDS = ("torch", "quantized", "onnx")
+
+# Pipeline entity groups tracked by the dashboard, and the label each is reported under
+TARGET_LABELS = {
+    'DIAGNOSTIC_PROCEDURE': 'Target: Disease',
+    'DISEASE_DISORDER': 'Target: Disease',
+    'Sign_symptom': 'Target: Disease',
+    'MEDICATION': 'Target: Medication',
+    'Medication': 'Target: Medication',
+    'DOSAGE': 'Target: Dosage',
+    'Dosage': 'Target: Dosage',
+}
+
+# Generic words that pollute the dashboard when tagged
+GENERIC_WORDS = frozenset(['symptoms', 'diagnosis', 'history', 'plan', 'medications', 'date', 'id'])
+TRAILING_PUNCTUATION = ".,;:!?"
+
+# Bumped whenever post-processing changes its output, so cached results are recomputed
+POSTPROCESS_VERSION = 2
+
+# Entity group -> target label ("" for untracked groups), filled as groups are first seen
+_TARGETS = {}
+
+def target_label(group):
+    """
+    Returns the target label for a pipeline entity group, or "" if it isn't tracked.
+    Groups already named "Target: ..." are kept as they are.
+    """
+    label = TARGET_LABELS.get(group, group if "Target:" in group else "")
+    _TARGETS[group] = label
+    return label
+
+def build_pipeline(model_name, backend="torch", export_dir=None):
+    """
+    Builds the NER pipeline on the requested inference backend:
+    - "torch": fp32 PyTorch eager mode (reference).
+    - "quantized": PyTorch with dynamic int8 quantization of the Linear layers.
+    - "onnx": ONNX Runtime on CPU (needs `optimum[onnxruntime]`). The export is
+      saved to `export_dir` when given and reused on later starts.
+
+    `model_name` may be a compiled artifact (see `src.ner.artifact`), which is
+    loaded offline with memory-mapped weights instead of through the hub.
+    """
+    model, tokenizer = None, None
+    if read_manifest(model_name) is not None:
+        model, tokenizer = load_artifact(model_name)
+
+    if backend == "torch":
+        if model is not None:
+            return pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+        return pipeline("ner", model=model_name, tokenizer=model_name, aggregation_strategy="simple")
+
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    if backend == "quantized":
+        model = (model or AutoModelForTokenClassification.from_pretrained(model_name)).eval()
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForTokenClassification
+        except ImportError:
+            raise ImportError("The 'onnx' backend requires optimum with onnxruntime: pip install optimum[onnxruntime]")
+        if export_dir and os.path.exists(os.path.join(export_dir, "model.onnx")):
+            model = ORTModelForTokenClassification.from_pretrained(export_dir)
+        else:
+            model = ORTModelForTokenClassification.from_pretrained(model_name, export=True)
+            if export_dir:
+                model.save_pretrained(export_dir)
+                tokenizer.save_pretrained(export_dir)
+    else:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+    return pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+
+def check_parity(reference, candidate, texts, score_tolerance=0.05):
+    """
+    Compares the entities two NERModels extract from `texts`.
+    Returns (text, reference_entities, candidate_entities) for every note where the
+    entity spans or labels differ, or a score drifts by more than `score_tolerance`.
+    An empty list means the candidate backend is at parity.
+    """
+    mismatches = []
+    for text, expected, actual in zip(texts, reference.extract_entities_batch(texts), candidate.extract_entities_batch(texts)):
+        spans_match = [(e['label'], e['start'], e['end']) for e in expected] == [(e['label'], e['start'], e['end']) for e in actual]
+        if not spans_match or any(abs(e['score'] - a['score']) > score_tolerance for e, a in zip(expected, actual)):
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+def token_windows(word_ids, size, overlap):
+    """
+    Splits a token sequence into overlapping windows of at most `size` tokens.
+    Window edges are moved to word boundaries so no word is cut in half.
+    Returns a list of (first_token, end_token) pairs.
+    """
+    n = len(word_ids)
+    if n <= size:
+        return [(0, n)]
+
+    def at_word_start(i):
+        return i <= 0 or i >= n or word_ids[i] is None or word_ids[i] != word_ids[i - 1]
+
+    windows = []
+    first = 0
+    while True:
+        end = min(first + size, n)
+        while end > first + 1 and not at_word_start(end):
+            end -= 1
+        windows.append((first, end))
+        if end >= n:
+            return windows
+
+        next_first = max(end - overlap, first + 1)
+        while next_first > first + 1 and not at_word_start(next_first):
+            next_first -= 1
+        first = next_first
+
 class NERModel:
     """
     Wrapper for a ClinicalBERT-based NER model.
     """
-    def __init__(self, model_name="d4data/biomedical-ner-all"):
+    # Chunked mode is off unless a window size is given
+    chunk_tokens = None
+    chunk_overlap = 64
+    # Dictionary fast path is off unless a Gazetteer is given
+    gazetteer = None
+    # Result cache is off unless a ResultCache is given
+    cache = None
+    # Stage timings are off unless a Metrics is given
+    metrics = None
+    model_name = None
+    # Manifest of the compiled artifact the model was loaded from, if any
+    artifact = None
+    backend = "torch"
+
+    def __init__(self, model_name="d4data/biomedical-ner-all", chunk_tokens=None, chunk_overlap=64, backend="torch", export_dir=None,
+                 gazetteer=None, cache=None, metrics=None):
         """
         Initializes the NER pipeline.
         We use 'd4data/biomedical-ner-all' as a proxy for a fine-tuned ClinicalBERT 
         since it has good coverage of medical entities out-of-the-box for this demo.
+
+        If `chunk_tokens` is set, notes longer than that are split into overlapping
+        windows of `chunk_tokens` tokens (sharing `chunk_overlap` tokens) instead of
+        being passed to the model whole.
+
+        `backend` selects the inference runtime, see `build_pipeline`.
+        `model_name` may also be a compiled artifact directory (see `src.ner.artifact`).
+
+        If a `gazetteer` is given, notes fully covered by its dictionary hits
+        skip the transformer; `fast_path_stats` counts how many did.
+
+        If a `cache` (see `ResultCache`) is given, results are looked up by the
+        hash of the note and `model_version()` before any inference runs.
+
+        If `metrics` (see `src.ner.metrics.Metrics`) are given, tokenization,
+        the model forward, the pipeline's post-processing and the subword merge
+        are timed into them.
         """
-        self.pipeline = pipeline("ner", model=model_name, tokenizer=model_name, aggregation_strategy="simple")
+        self.model_name = model_name
+        self.backend = backend
+        self.artifact = read_manifest(model_name)
+        self.pipeline = build_pipeline(model_name, backend, export_dir)
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.gazetteer = gazetteer
+        self.fast_path_stats = {"notes": 0, "fast_path": 0}
+        self.cache = cache
+        if metrics is not None:
+            self.instrument(metrics)
+
+    def instrument(self, metrics):
+        """
+        Times the pipeline's steps into `metrics` by wrapping them on this instance.
+        """
+        self.metrics = metrics
+        for owner, name, stage in ((self.pipeline, "preprocess", "tokenize"),
+                                   (self.pipeline, "_forward", "forward"),
+                                   (self.pipeline, "postprocess", "postprocess"),
+                                   (self, "_token_lengths", "tokenize"),
+                                   (self, "_chunk", "tokenize"),
+                                   (self, "_postprocess", "merge")):
+            setattr(owner, name, metrics.timed(stage, getattr(owner, name)))
+
+    def model_version(self):
+        """
+        Identifies everything that shapes the output, so cached results are
+        never served for a different model or configuration.
+        """
+        # Artifacts are identified by their weights, so a recompiled artifact in the same place invalidates the cache
+        model = self.model_name if self.artifact is None else f"{self.artifact['source']}@{self.artifact['weights_sha256'][:16]}"
+        gazetteer = self.gazetteer.fingerprint[:16] if self.gazetteer is not None else None
+        return (f"{model}|{self.backend}|chunk={self.chunk_tokens}/{self.chunk_overlap}"
+                f"|gazetteer={gazetteer}|post={POSTPROCESS_VERSION}")
 
     def extract_entities(self, text):
         """
         Runs NER on the input text and returns structured entities.
         Focuses on Disease, Medication, Dosage.
         """
+        if self.cache is None:
+            return self._extract_entities_single(text)
+
+        self.cache.bind(self.model_version())
+        entities = self.cache.get(text)
+        if entities is None:
+            entities = self._extract_entities_single(text)
+            self.cache.put(text, entities)
+        return entities
+
+    def _extract_entities_single(self, text):
+        if self.gazetteer:
+            entities, covered = self._fast_path(text)
+            if covered:
+                return entities
+        if self.chunk_tokens:
+            # The fast path already ran; the note's windows go straight to the model, bucketed as in a batch call
+            return self._extract_entities_model([text], 16)[0]
         results = self.pipeline(text)
-        
-        # 1. Group entities by aggregation strategy handled by pipeline, 
-        # but we need to double check for subword fragmentation if the pipeline didn't merge them perfectly
-        # or if we want to enforce specific logic.
-        # The 'simple' aggregation strategy in pipeline usually handles B- I- tags.
-        # However, "hyper" and "##tension" might still appear if the model isn't predicting B- I- correctly
-        # or if it's just raw tokens. 
-        # Since we used 'simple' aggregation, 'results' should already be words. 
-        # If we are seeing "##tension", it means the tokenizer split it and the model treated them as separate entities 
-        # not strongly linked. Let's merge manually.
-        
+        return self._postprocess(results)
+
+    def extract_entities_batch(self, texts, batch_size=16):
+        """
+        Runs NER on a list of texts and returns one entity list per text, in input order.
+
+        Texts are sorted by token length and split into buckets of `batch_size`,
+        so each forward pass only pads up to the longest note in its bucket
+        instead of the longest note overall (short triage notes and long
+        discharge summaries arrive mixed).
+        """
+        if not texts:
+            return []
+        texts = list(texts)
+
+        if self.cache is None:
+            return self._extract_entities_uncached(texts, batch_size)
+
+        # Serve repeats from the cache; each distinct miss is inferred once
+        self.cache.bind(self.model_version())
+        entities = [self.cache.get(text) for text in texts]
+        misses = list(dict.fromkeys(text for text, cached in zip(texts, entities) if cached is None))
+        if misses:
+            computed = dict(zip(misses, self._extract_entities_uncached(misses, batch_size)))
+            for text, note_entities in computed.items():
+                self.cache.put(text, note_entities)
+            for i, text in enumerate(texts):
+                if entities[i] is None:
+                    entities[i] = [dict(entity) for entity in computed[text]]
+        return entities
+
+    def _extract_entities_uncached(self, texts, batch_size):
+        if not self.gazetteer:
+            return self._extract_entities_model(texts, batch_size)
+
+        # Only notes the dictionary can't fully explain go through the model
+        entities = [None] * len(texts)
+        remaining = []
+        for i, text in enumerate(texts):
+            entities[i], covered = self._fast_path(text)
+            if not covered:
+                remaining.append(i)
+        if remaining:
+            for i, note_entities in zip(remaining, self._extract_entities_model([texts[i] for i in remaining], batch_size)):
+                entities[i] = note_entities
+        return entities
+
+    def _fast_path(self, text):
+        entities, covered = self.gazetteer.match(text)
+        self.fast_path_stats["notes"] += 1
+        if covered:
+            self.fast_path_stats["fast_path"] += 1
+        return entities, covered
+
+    def _extract_entities_model(self, texts, batch_size):
+        """
+        Transformer path of `extract_entities_batch`.
+        """
+
+        if not self.chunk_tokens:
+            return [self._postprocess(results) for results in self._run_buckets(texts, self._token_lengths(texts), batch_size)]
+
+        # Chunked mode: every window is scheduled as its own sequence,
+        # then the raw groups are stitched back per note before merging.
+        chunks = []
+        for note_index, text in enumerate(texts):
+            for chunk in self._chunk(text):
+                chunks.append((note_index,) + chunk)
+
+        chunk_results = self._run_buckets([texts[note_index][char_start:char_end] for note_index, char_start, char_end, _, _, _ in chunks],
+                                          [n_tokens for _, _, _, _, _, n_tokens in chunks],
+                                          batch_size)
+
+        stitched = [[] for _ in texts]
+        for (note_index, char_start, _, own_start, own_end, _), results in zip(chunks, chunk_results):
+            for entity in results:
+                start = entity['start'] + char_start
+                # Overlap regions are seen by two windows: keep the copy from
+                # the window that owns the entity's start offset.
+                if not own_start <= start < own_end:
+                    continue
+                stitched[note_index].append(dict(entity, start=start, end=entity['end'] + char_start))
+
+        return [self._postprocess(sorted(results, key=lambda entity: entity['start'])) for results in stitched]
+
+    def _token_lengths(self, texts):
+        return [len(ids) for ids in self.pipeline.tokenizer(texts)['input_ids']]
+
+    def _run_buckets(self, texts, lengths, batch_size):
+        """
+        Runs the pipeline over `texts` in buckets of similar token length.
+        Returns the raw pipeline output per text, in input order.
+        """
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+        outputs = [None] * len(texts)
+        for i in range(0, len(order), batch_size):
+            bucket = order[i:i + batch_size]
+            bucket_results = self.pipeline([texts[j] for j in bucket], batch_size=len(bucket))
+            for j, results in zip(bucket, bucket_results):
+                outputs[j] = results
+        return outputs
+
+    def _chunk(self, text):
+        """
+        Splits a note into overlapping token windows.
+        Returns (char_start, char_end, own_start, own_end, n_tokens) per window, where
+        [own_start, own_end) is the character range whose entities that window keeps:
+        each overlap is split at its midpoint between the two windows sharing it.
+        """
+        encoding = self.pipeline.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding['offset_mapping']
+        # Leave room for [CLS]/[SEP]
+        size = self.chunk_tokens - 2
+        windows = token_windows(encoding.word_ids(), size, min(self.chunk_overlap, size // 2))
+        if len(windows) == 1:
+            return [(0, len(text), 0, len(text), len(offsets))]
+
+        chunks = []
+        for k, (first, end) in enumerate(windows):
+            own_start = 0
+            if k > 0:
+                previous_end = windows[k - 1][1]
+                own_start = offsets[(first + previous_end) // 2][0]
+            own_end = len(text)
+            if k + 1 < len(windows):
+                next_first = windows[k + 1][0]
+                own_end = offsets[(next_first + end) // 2][0]
+            chunks.append((offsets[first][0], offsets[end - 1][1], own_start, own_end, end - first))
+        return chunks
+
+    def _postprocess(self, results):
+        """
+        Normalizes labels, filters noise and merges subword fragments
+        from the raw pipeline output of a single text.
+
+        The 'simple' aggregation already groups B-/I- tags into words, but the
+        model can still tag "hyper" and "##tension" as separate entities, so
+        fragments that touch the previous entity (or start with "##") are
+        joined. A merged entity's score is the average of its fragments'
+        scores weighted by their length.
+        """
         merged_entities = []
         current_entity = None
-        
+        current_end = None
+        weighted_score = 0.0
+        weight = 0
+        targets = _TARGETS
+
         for entity in results:
+            group = entity['entity_group']
+            label = targets.get(group)
+            if label is None:
+                label = target_label(group)
+            # Filter non-targets
+            if not label:
+                continue
+
             word = entity['word']
-            label = entity['entity_group']
-            score = float(entity['score'])
             start = entity['start']
             end = entity['end']
-            
-            # Normalize Label
-            normalized_label = label
-            if label in ['DIAGNOSTIC_PROCEDURE', 'DISEASE_DISORDER', 'Sign_symptom']:
-                normalized_label = 'Target: Disease'
-            elif label in ['MEDICATION', 'Medication']:
-                normalized_label = 'Target: Medication'
-            elif label in ['DOSAGE', 'Dosage']:
-                normalized_label = 'Target: Dosage'
-            
-            # Filter non-targets
-            if "Target:" not in normalized_label:
-                continue
-                
-            # Filter generic words that pollute the dashboard
-            clean_word_check = word.lower().strip(".,;:!?")
-            if clean_word_check in ['symptoms', 'diagnosis', 'history', 'plan', 'medications', 'date', 'id']:
+            is_subword = word[:2] == "##"
+            # Filter generic words that pollute the dashboard ("##" fragments never match)
+            if not is_subword and word.lower().strip(TRAILING_PUNCTUATION) in GENERIC_WORDS:
                 continue
-                
-            # Merge Logic
-            if current_entity and (start == current_entity['end'] or word.startswith("##")):
+
+            length = end - start or 1
+            if current_entity is not None and (is_subword or start == current_end):
                 # Merge with previous
-                clean_word = word.replace("##", "")
-                current_entity['entity'] += clean_word
-                current_entity['end'] = end
-                # Average score (simple approx)
-                current_entity['score'] = (current_entity['score'] + score) / 2
-            else:
-                # Discard orphan subwords (e.g. starting with ## but no current_entity)
-                if word.startswith("##"):
-                    continue
+                current_entity['entity'] += word.replace("##", "")
+                current_end = end
+                weighted_score += float(entity['score']) * length
+                weight += length
+                continue
+            # Discard orphan subwords
+            if is_subword:
+                continue
+
+            if current_entity is not None:
+                current_entity['end'] = current_end
+                current_entity['score'] = weighted_score / weight
+                merged_entities.append(current_entity)
+            score = float(entity['score'])
+            current_entity = {"entity": word, "label": label, "score": score, "start": start, "end": end}
+            current_end = end
+            weighted_score = score * length
+            weight = length
 
-                # Append previous if exists
-                if current_entity:
-                    merged_entities.append(current_entity)
-                
-                # Start new
-                current_entity = {
-                    "entity": word,
-                    "label": normalized_label,
-                    "score": score,
-                    "start": start,
-                    "end": end
-                }
-        
-        # Append last
-        if current_entity:
+        if current_entity is not None:
+            current_entity['end'] = current_end
+            current_entity['score'] = weighted_score / weight
             merged_entities.append(current_entity)
-            
+
         return merged_entities
 
 if __name__ == "__main__":
@@ -94,3 +427,17 @@ if __name__ == "__main__":
     model = NERModel()
     text = "Patient has hypertension and is taking Lisinopril 10 mg."
     print(model.extract_entities(text))
+
+    # Optionally check another backend against the fp32 reference:
+    #   python src/ner/clinicalbert.py quantized
+    if len(sys.argv) > 1:
+        candidate = NERModel(backend=sys.argv[1])
+        texts = [text, "Plan: Start Metformin 500 mg.", "History of atrial fibrillation. Medications: Warfarin 5 mg PO."]
+        for name, ner in (("torch", model), (sys.argv[1], candidate)):
+            ner.extract_entities_batch(texts)  # warm-up
+            started = time.perf_counter()
+            for _ in range(10):
+                ner.extract_entities_batch(texts)
+            print(f"{name}: {(time.perf_counter() - started) / (10 * len(texts)) * 1000:.1f} ms/note")
+        mismatches = check_parity(model, candidate, texts)
+        print("Parity OK" if not mismatches else f"Parity FAILED on {len(mismatches)} notes: {mismatches}")
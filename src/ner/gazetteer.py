@@ -0,0 +1,138 @@
+import sys
+import os
+import re
+import json
+import hashlib
+from collections import deque
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.streaming.vocabulary import CONDITIONS, MEDICATIONS, DOSAGES, TEMPLATE_WORDS
+
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+class Gazetteer:
+    """
+    Aho-Corasick dictionary matcher for known clinical terms.
+
+    Tags every dictionary term in one linear pass over the note, using the same
+    `Target: Disease/Medication/Dosage` schema as NERModel. A note is "covered"
+    when every word outside a dictionary hit is a known background word
+    (template words and PHI placeholders): such notes need no transformer call.
+    """
+    def __init__(self, terms, background_words=(), score=1.0):
+        """
+        `terms` maps each term to its label. Matching is case-insensitive and
+        only on word boundaries; overlapping hits resolve to the leftmost-longest.
+        """
+        self.score = score
+        self.background_words = frozenset(word.lower() for word in background_words)
+        # Identifies the dictionary's contents, so cached results follow dictionary edits
+        contents = json.dumps([sorted((term.lower(), label) for term, label in terms.items()), sorted(self.background_words), score])
+        self.fingerprint = hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+        # Trie as parallel lists: goto transitions, failure links, (length, label) outputs
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for term, label in terms.items():
+            self._add(term.lower(), label)
+        self._build_failure_links()
+
+    @classmethod
+    def default(cls):
+        """
+        Dictionary built from the synthetic note generator's vocabulary.
+        """
+        terms = {}
+        terms.update({term: 'Target: Disease' for term in CONDITIONS})
+        terms.update({term: 'Target: Medication' for term in MEDICATIONS})
+        terms.update({term: 'Target: Dosage' for term in DOSAGES})
+        return cls(terms, TEMPLATE_WORDS)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads a dictionary from JSON:
+        {"terms": {"Target: Disease": [...], ...}, "background": [...], "score": 0.99}
+        """
+        with open(path, 'r') as f:
+            config = json.load(f)
+        terms = {term: label for label, label_terms in config['terms'].items() for term in label_terms}
+        return cls(terms, config.get('background', ()), config.get('score', 1.0))
+
+    def _add(self, term, label):
+        state = 0
+        for char in term:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((len(term), label))
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        Returns entities for every dictionary term in `text`, in text order.
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Some characters expand when lowercased; keep offsets aligned with the input
+            lowered = ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        candidates = []
+        state = 0
+        for end, char in enumerate(lowered, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, label in outputs[state]:
+                start = end - length
+                if (start == 0 or not lowered[start - 1].isalnum()) and (end == len(lowered) or not lowered[end].isalnum()):
+                    candidates.append((start, end, label))
+
+        # Leftmost-longest, non-overlapping
+        candidates.sort(key=lambda hit: (hit[0], hit[0] - hit[1]))
+        entities = []
+        covered_until = 0
+        for start, end, label in candidates:
+            if start < covered_until:
+                continue
+            # Offsets line up with `text`, so the entity keeps the note's casing like the model path does
+            entities.append({"entity": text[start:end], "label": label, "score": self.score, "start": start, "end": end})
+            covered_until = end
+        return entities
+
+    def match(self, text):
+        """
+        Returns (entities, covered) for a note, see `find` and the class docstring.
+        """
+        entities = self.find(text)
+        i = 0
+        for word in WORD_PATTERN.finditer(text):
+            while i < len(entities) and entities[i]['end'] <= word.start():
+                i += 1
+            if i < len(entities) and entities[i]['start'] <= word.start() and word.end() <= entities[i]['end']:
+                continue
+            if word.group(0).lower() not in self.background_words:
+                return entities, False
+        return entities, True
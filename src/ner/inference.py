@@ -2,76 +2,470 @@ import sys
 import os
 import time
 import json
+import argparse
+import functools
 import pika
 
 # Add src to python path to allow imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 from src.deidentification.phi_removal import PHIRemover
-from src.ner.clinicalbert import NERModel
+from src.ner.clinicalbert import NERModel, BACKENDS
+from src.ner.worker_pool import WorkerPool
+from src.ner.gazetteer import Gazetteer
+from src.ner.result_cache import ResultCache
+from src.ner.metrics import Metrics, MetricsServer, DEFAULT_PORT
+from src.ner.runtime import PROFILES, build_profile, format_report
+from src.storage.segment_store import SegmentWriter
+from src.storage.result_writer import BufferedResultWriter
 
-PROCESSED_DATA_FILE = os.path.join(os.path.dirname(__file__), '../../data/processed_notes.jsonl')
+QUEUE_NAME = 'clinical_notes_stream'
+# Notes that keep failing (or can't be parsed) end up here for inspection
+DEAD_LETTER_QUEUE = QUEUE_NAME + '.dead'
 
-def callback(ch, method, properties, body, model, phi_remover):
+# Seconds between queue depth samples
+QUEUE_DEPTH_INTERVAL = 1.0
+
+# Bounds (seconds) on how long the batch consumer blocks waiting for a delivery
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.1
+
+# A note is dead-lettered once it has failed this many times
+MAX_ATTEMPTS = 3
+ATTEMPTS_HEADER = 'x-helix-attempts'
+ERROR_HEADER = 'x-helix-error'
+
+# Backoff (seconds) between commits while the result store is failing
+WRITER_RETRY_DELAY = 0.5
+WRITER_MAX_RETRY_DELAY = 30.0
+
+class MalformedMessage(ValueError):
     """
-    Callback function to process incoming messages.
+    A message no retry can fix; it goes straight to the dead-letter queue.
+    """
+
+def decode(body):
+    """
+    Parses a message body into a producer message ({"note", "timestamp"}).
+    """
+    try:
+        message = json.loads(body)
+    except ValueError as e:
+        raise MalformedMessage(f"not JSON: {e}")
+    if not isinstance(message, dict) or not isinstance(message.get('note'), str) or not isinstance(message.get('timestamp'), (int, float)):
+        raise MalformedMessage("expected {\"note\": str, \"timestamp\": number}")
+    return message
+
+def reject(channel, body, properties, error, max_attempts=MAX_ATTEMPTS, metrics=None):
+    """
+    Republishes a note that failed with its attempt count in a header: to the
+    back of the notes queue for another try, or to the dead-letter queue once
+    it has failed `max_attempts` times (malformed messages at once). Returns
+    the queue it went to; the caller then acks the original delivery.
+
+    On a channel in confirm mode (see `connect`) this returns only once the
+    broker has taken the copy, and raises (pika's NackError or UnroutableError)
+    if it didn't. The original must then stay unacked: the worker stops, and
+    the broker redelivers it when the connection closes.
+    """
+    headers = dict(getattr(properties, 'headers', None) or {})
+    attempts = headers.get(ATTEMPTS_HEADER, 0) + 1
+    headers[ATTEMPTS_HEADER] = attempts
+    headers[ERROR_HEADER] = f"{type(error).__name__}: {error}"[:1000]
+    dead = isinstance(error, MalformedMessage) or attempts >= max_attempts
+    target = DEAD_LETTER_QUEUE if dead else QUEUE_NAME
+    channel.basic_publish(exchange='', routing_key=target, body=body,
+                          properties=pika.BasicProperties(headers=headers, delivery_mode=getattr(properties, 'delivery_mode', None)),
+                          mandatory=True)
+    if metrics is not None:
+        metrics.count("notes_dead_lettered" if dead else "notes_retried")
+    print(f" [!] Note failed (attempt {attempts}, {headers[ERROR_HEADER]}); " + ("dead-lettered." if dead else "requeued."))
+    return target
+
+def pause(channel, seconds):
+    """
+    Sleeps without starving the connection's heartbeats (pika's sleep doesn't dispatch nested deliveries).
+    """
+    connection = getattr(channel, 'connection', None)
+    if connection is not None:
+        connection.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+def write_or_pause(channel, writer, operation, metrics=None):
+    """
+    Runs a writer operation (`add` or `maybe_flush`). If the store fails, the
+    consumer stops taking messages and retries the commit with backoff until
+    it succeeds: the deliveries behind the buffered results stay unacked, so
+    the broker holds everything else back at the prefetch limit and memory
+    stays flat however fast notes arrive.
+    """
+    try:
+        return operation()
+    except OSError as e:
+        error = e
+    if metrics is not None:
+        metrics.count("writer_stalls")
+    delay = WRITER_RETRY_DELAY
+    while True:
+        print(f" [!] Result store failed ({error}); consumption paused, retrying in {delay:.1f}s.")
+        pause(channel, delay)
+        try:
+            writer.flush()
+        except OSError as e:
+            error = e
+            delay = min(delay * 2, WRITER_MAX_RETRY_DELAY)
+            continue
+        print(" [✓] Result store recovered; consuming again.")
+        return
+
+def build_result(message, cleaned_text, entities, offset_map=None):
+    """
+    Builds the stored record for a processed note.
+    `phi_edits` lets downstream jobs map entity offsets back to the source note.
     """
-    message = json.loads(body)
-    raw_text = message['note']
-    
-    print(f" [x] Received: {raw_text[:50]}...")
-    
-    # 1. De-identification
-    cleaned_text = phi_remover.deidentify(raw_text)
-    
-    # 2. NER Inference
-    entities = model.extract_entities(cleaned_text)
-    
-    # 3. Store Result (Simulating a database or processed queue)
     result = {
         "timestamp": message['timestamp'],
         "original_text_masked": cleaned_text, # Don't store PHI even in logs if avoiding it
         "entities": entities
     }
-    
-    # Append to a JSONL file for the dashboard to read
-    with open(PROCESSED_DATA_FILE, 'a') as f:
-        f.write(json.dumps(result) + '\n')
-    
-    print(f" [✓] Processed and saved.")
-
-def main():
-    print("Loading NER Model... (this may take a moment)")
-    ner_model = NERModel()
-    phi_remover = PHIRemover()
-    print("Model loaded. Connecting to Queue...")
+    if offset_map is not None:
+        result["phi_edits"] = [list(edit) for edit in offset_map.edits]
+    return result
+
+def callback(ch, method, properties, body, model, phi_remover, writer, metrics=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Callback function to process incoming messages.
+    """
+    ack = functools.partial(ch.basic_ack, delivery_tag=method.delivery_tag)
+    try:
+        message = decode(body)
+    except MalformedMessage as e:
+        reject(ch, body, properties, e, max_attempts, metrics)
+        write_or_pause(ch, writer, functools.partial(writer.add, [], on_durable=ack), metrics)
+        return
+    raw_text = message['note']
+    if metrics is not None:
+        metrics.received([message])
+
+    print(f" [x] Received: {raw_text[:50]}...")
+
+    try:
+        # 1. De-identification
+        started = time.perf_counter()
+        cleaned_text, offset_map = phi_remover.deidentify_with_map(raw_text)
+        if metrics is not None:
+            metrics.observe("deidentify", time.perf_counter() - started)
+
+        # 2. NER Inference
+        entities = model.extract_entities(cleaned_text)
+    except Exception as e:
+        reject(ch, body, properties, e, max_attempts, metrics)
+        write_or_pause(ch, writer, functools.partial(writer.add, [], on_durable=ack), metrics)
+        return
+
+    # 3. Store Result (Simulating a database or processed queue)
+    result = build_result(message, cleaned_text, entities, offset_map)
+
+    # Buffer for the segment store; the message is acked once the group commit is durable
+    write_or_pause(ch, writer, functools.partial(writer.add, [result], on_durable=ack), metrics)
+    if metrics is not None:
+        metrics.processed(1)
+        metrics.buffered = writer.pending()
+
+    print(f" [✓] Processed.")
+
+def process_batch(messages, model, phi_remover, metrics=None, batch_size=16):
+    """
+    De-identifies a batch of decoded messages and runs them through the model
+    in padded batches of up to `batch_size` notes. Returns the results in message order.
+    """
+    started = time.perf_counter()
+    cleaned_texts, offset_maps = phi_remover.deidentify_batch_with_map([message['note'] for message in messages])
+    if metrics is not None:
+        metrics.observe("deidentify", time.perf_counter() - started)
+    batch_entities = model.extract_entities_batch(cleaned_texts, batch_size)
+    return [build_result(message, cleaned_text, entities, offset_map)
+            for message, cleaned_text, entities, offset_map in zip(messages, cleaned_texts, batch_entities, offset_maps)]
+
+def process_with_retries(channel, deliveries, model, phi_remover, max_attempts=MAX_ATTEMPTS, metrics=None, batch_size=16):
+    """
+    Processes (properties, body, message) deliveries as one batch. If the
+    batch fails, its notes are retried one by one so a poison note can't fail
+    the others; notes that fail on their own are passed to `reject`.
+    Returns the results of the notes that succeeded, in order.
+    """
+    if not deliveries:
+        return []
+    try:
+        return process_batch([message for _, _, message in deliveries], model, phi_remover, metrics, batch_size)
+    except Exception as e:
+        if len(deliveries) == 1:
+            properties, body, _ = deliveries[0]
+            reject(channel, body, properties, e, max_attempts, metrics)
+            return []
+        print(f" [!] Batch of {len(deliveries)} failed ({type(e).__name__}: {e}); retrying its notes one by one.")
+    results = []
+    for delivery in deliveries:
+        results.extend(process_with_retries(channel, [delivery], model, phi_remover, max_attempts, metrics, batch_size))
+    return results
+
+def queue_depth(channel):
+    """
+    Messages ready in the notes queue, not counting deliveries awaiting an ack.
+    """
+    return channel.queue_declare(queue=QUEUE_NAME, passive=True).method.message_count
+
+def consume_batches(channel, model, phi_remover, writer, batch_size, max_wait, prefetch=None, metrics=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Pulls up to `batch_size` messages, waiting at most `max_wait` seconds after
+    the first one arrives, and processes them together.
+    Messages are acked only once their results have been written to disk;
+    failed notes are retried up to `max_attempts` times, then dead-lettered.
+    With `metrics`, dequeue waits, batch stages and the queue depth are recorded.
+    """
+    # Room for the batch being filled plus the results waiting on a group commit
+    channel.basic_qos(prefetch_count=max(prefetch or 0, batch_size + writer.max_rows))
 
-    connection = None
-    channel = None
+    # (delivery tag, properties, body, decoded message or None if it was malformed)
+    pending = []
+    deadline = None
+    next_depth_sample = 0.0
 
+    # A short inactivity timeout lets us wake up to honour the deadline
+    # even when the queue goes quiet mid-batch. The floor keeps an idle
+    # worker from spinning when max_wait is 0.
+    poll_interval = max(min(max_wait, MAX_POLL_INTERVAL), MIN_POLL_INTERVAL)
+    for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=poll_interval):
+        if method is not None:
+            try:
+                message = decode(body)
+            except MalformedMessage as e:
+                reject(channel, body, properties, e, max_attempts, metrics)
+                message = None
+            pending.append((method.delivery_tag, properties, body, message))
+            if metrics is not None and message is not None:
+                metrics.received([message])
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+
+        if metrics is not None and time.monotonic() >= next_depth_sample:
+            metrics.queue_depth = queue_depth(channel)
+            next_depth_sample = time.monotonic() + QUEUE_DEPTH_INTERVAL
+
+        write_or_pause(channel, writer, writer.maybe_flush, metrics)
+        if not pending:
+            continue
+        if len(pending) < batch_size and time.monotonic() < deadline:
+            continue
+
+        deliveries = [(properties, body, message) for _, properties, body, message in pending if message is not None]
+        results = process_with_retries(channel, deliveries, model, phi_remover, max_attempts, metrics, batch_size)
+        # Delivery tags are monotonic per channel, so one ack covers the whole batch,
+        # including notes that were requeued or dead-lettered as copies
+        ack = functools.partial(channel.basic_ack, delivery_tag=pending[-1][0], multiple=True)
+        write_or_pause(channel, writer, functools.partial(writer.add, results, on_durable=ack), metrics)
+        if metrics is not None:
+            metrics.processed(len(results))
+            metrics.buffered = writer.pending()
+
+        details = []
+        if model.gazetteer:
+            details.append(f"fast path: {model.fast_path_stats['fast_path']}/{model.fast_path_stats['notes']} notes")
+        if model.cache is not None:
+            details.append(f"cache hit rate: {model.cache.hit_rate():.0%}")
+        if len(results) < len(pending):
+            details.append(f"{len(pending) - len(results)} failed")
+        print(f" [✓] Processed batch of {len(pending)}" + (f" ({', '.join(details)})." if details else "."))
+        pending = []
+        deadline = None
+
+def connect():
+    """
+    Connects to the local RabbitMQ broker, retrying until it is available.
+    """
     while True:
         try:
             connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
             channel = connection.channel()
-            channel.queue_declare(queue='clinical_notes_stream')
-            print(" [*] Waiting for messages. To exit press CTRL+C")
-            break
+            channel.queue_declare(queue=QUEUE_NAME)
+            channel.queue_declare(queue=DEAD_LETTER_QUEUE)
+            # Publisher confirms: a requeued or dead-lettered copy must be safe before its original is acked
+            channel.confirm_delivery()
+            return connection, channel
         except pika.exceptions.AMQPConnectionError:
             print("RabbitMQ not available, retrying in 5 seconds...")
             time.sleep(5)
 
-    # Use a lambda or partial to pass the model to the callback
-    channel.basic_consume(queue='clinical_notes_stream',
-                          on_message_callback=lambda ch, method, properties, body: callback(ch, method, properties, body, ner_model, phi_remover),
-                          auto_ack=True)
+def schedule_flushes(connection, channel, writer, metrics=None):
+    """
+    Flushes the writer on its time threshold even when no messages arrive.
+    """
+    def tick():
+        write_or_pause(channel, writer, writer.maybe_flush, metrics)
+        connection.call_later(writer.max_delay / 2, tick)
+    connection.call_later(writer.max_delay / 2, tick)
+
+def schedule_queue_depth(connection, channel, metrics):
+    """
+    Samples the queue depth into `metrics` every `QUEUE_DEPTH_INTERVAL` seconds.
+    """
+    def tick():
+        metrics.queue_depth = queue_depth(channel)
+        connection.call_later(QUEUE_DEPTH_INTERVAL, tick)
+    connection.call_later(0, tick)
+
+def start_metrics_server(metrics, port):
+    """
+    Serves `metrics` on localhost:`port`; the worker keeps running without it if the port is taken.
+    """
+    try:
+        server = MetricsServer(metrics, port).start()
+    except OSError as e:
+        print(f" [!] Metrics endpoint unavailable on port {port}: {e}")
+        return None
+    print(f" [*] Metrics at http://127.0.0.1:{server.port}/metrics")
+    return server
+
+def run_worker(model, phi_remover, args, worker_id=None):
+    """
+    Runs one consumer on its own connection until interrupted.
+    """
+    # Warmed up in every worker after the fork, under the worker's own thread settings
+    apply_runtime(model, args, threads=args.threads_per_worker if worker_id is None else None)
+    connection, channel = connect()
+    metrics = model.metrics
+    # Every worker serves its own metrics, on the base port plus its id
+    server = start_metrics_server(metrics, args.metrics_port + (worker_id or 0)) if metrics is not None else None
+    # Opened per worker so every process appends to its own segments
+    writer = BufferedResultWriter(SegmentWriter(fsync=args.fsync), max_rows=args.flush_rows, max_delay=args.flush_interval,
+                                  metrics=metrics)
+    if worker_id is None:
+        print(" [*] Waiting for messages. To exit press CTRL+C")
 
     try:
-        channel.start_consuming()
+        if args.batch_size > 1 or worker_id is not None:
+            consume_batches(channel, model, phi_remover, writer, args.batch_size, args.max_wait, args.prefetch, metrics,
+                            args.max_attempts)
+        else:
+            # Unacked deliveries are capped here too, or the broker pushes the whole backlog into memory
+            channel.basic_qos(prefetch_count=max(args.prefetch or 0, 1 + writer.max_rows))
+            # Use a lambda or partial to pass the model to the callback
+            channel.basic_consume(queue=QUEUE_NAME,
+                                  on_message_callback=lambda ch, method, properties, body: callback(ch, method, properties, body, model, phi_remover, writer, metrics, args.max_attempts))
+            schedule_flushes(connection, channel, writer, metrics)
+            if metrics is not None:
+                schedule_queue_depth(connection, channel, metrics)
+            channel.start_consuming()
     except KeyboardInterrupt:
         print("Stopping inference worker...")
     finally:
-        if connection:
+        writer.close()
+        if server is not None:
+            server.stop()
+        if connection.is_open:
             connection.close()
+        if model.gazetteer:
+            stats = model.fast_path_stats
+            print(f" [i] Dictionary fast path: {stats['fast_path']}/{stats['notes']} notes skipped the model.")
+        if model.cache is not None:
+            print(f" [i] Result cache: {model.cache.hit_rate():.1%} hit rate {model.cache.stats}.")
+            model.cache.close()
+
+def add_model_arguments(parser):
+    """
+    Adds the options that configure the NER model (see `load_model`).
+    """
+    parser.add_argument('--model', default="d4data/biomedical-ner-all",
+                        help="Hugging Face model name or local model directory.")
+    parser.add_argument('--chunk-tokens', type=int, default=None,
+                        help="Split notes longer than this many tokens into overlapping windows.")
+    parser.add_argument('--chunk-overlap', type=int, default=64,
+                        help="Tokens shared by neighbouring windows in chunked mode.")
+    parser.add_argument('--gazetteer', nargs='?', const='default', default=None,
+                        help="Skip the model for notes fully covered by a term dictionary: "
+                             "'default' (producer vocabulary) or a JSON dictionary file.")
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help="Results of this many distinct notes are cached in memory (0 disables the cache).")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Also keep cached results on disk here, shared by workers and across restarts.")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Inference runtime: fp32 torch, int8 dynamic quantization or ONNX Runtime.")
+    parser.add_argument('--export-dir', default=None,
+                        help="Where the ONNX backend caches its exported model.")
+    parser.add_argument('--runtime-profile', choices=tuple(PROFILES), default='latency',
+                        help="Torch runtime tuning applied at startup: inference mode, thread pools and a warm-up "
+                             "over short to long notes ('off' keeps the plain pipeline).")
+    parser.add_argument('--compile', choices=('inductor', 'torchscript'), default=None,
+                        help="Compile the transformer (torch backends only); falls back to eager mode if it can't.")
+
+def load_model(args, metrics=None):
+    """
+    Builds the NERModel described by the `add_model_arguments` options.
+    """
+    gazetteer = None
+    if args.gazetteer:
+        gazetteer = Gazetteer.default() if args.gazetteer == 'default' else Gazetteer.from_file(args.gazetteer)
+    cache = None
+    if args.cache_size > 0:
+        cache = ResultCache(max_entries=args.cache_size, disk_dir=args.cache_dir)
+    return NERModel(args.model, chunk_tokens=args.chunk_tokens, chunk_overlap=args.chunk_overlap,
+                    backend=args.backend, export_dir=args.export_dir, gazetteer=gazetteer, cache=cache, metrics=metrics)
+
+def apply_runtime(model, args, threads=None):
+    """
+    Applies the `--runtime-profile` to a loaded model and prints the warm-up report.
+    `threads` sizes the torch thread pool (None leaves it as it is).
+    """
+    profile = build_profile(args.runtime_profile, threads=threads, compile=args.compile)
+    report = profile.apply(model)
+    print(format_report(report))
+    # Warm-up passes aren't traffic
+    if model.metrics is not None:
+        model.metrics.reset()
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix NER inference worker")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="Max notes per model batch. 1 keeps the per-message path.")
+    parser.add_argument('--max-wait', type=float, default=0.05,
+                        help="Max seconds to wait for a batch to fill after its first note (0 runs whatever has arrived).")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of forked worker processes sharing the loaded model.")
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help="Unacked messages each worker may hold (defaults to batch size + flush rows).")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help=f"Times a failing note is retried (requeued at the back) before it goes to '{DEAD_LETTER_QUEUE}'.")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Torch threads per worker (defaults to cores / workers).")
+    parser.add_argument('--flush-rows', type=int, default=256,
+                        help="Group-commit results once this many are buffered.")
+    parser.add_argument('--flush-interval', type=float, default=0.5,
+                        help="Group-commit buffered results at least this often, in seconds.")
+    parser.add_argument('--no-fsync', dest='fsync', action='store_false',
+                        help="Skip fsync on group commit (faster, not crash-safe).")
+    add_model_arguments(parser)
+    parser.add_argument('--metrics-port', type=int, default=DEFAULT_PORT,
+                        help="Serve Prometheus metrics on localhost at this port (worker N uses port + N; 0 disables).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("Loading NER Model... (this may take a moment)")
+    ner_model = load_model(args, Metrics() if args.metrics_port else None)
+    phi_remover = PHIRemover()
+    print("Model loaded. Connecting to Queue...")
+
+    if args.workers > 1:
+        # Fork after loading so all workers share the weights copy-on-write;
+        # each worker opens its own connection since pika connections can't cross a fork.
+        pool = WorkerPool(lambda worker_id: run_worker(ner_model, phi_remover, args, worker_id),
+                          args.workers, threads_per_worker=args.threads_per_worker)
+        pool.run()
+    else:
+        run_worker(ner_model, phi_remover, args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,333 @@
+import time
+import bisect
+import inspect
+import threading
+import functools
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timed stages of the inference worker, in pipeline order
+STAGES = ("dequeue_wait", "deidentify", "tokenize", "forward", "postprocess", "merge", "write")
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Notes processed over this many seconds give the throughput gauge
+THROUGHPUT_WINDOW = 10.0
+
+DEFAULT_PORT = 9464
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram (Prometheus-style): constant memory however
+    many observations it takes, mergeable across workers, with quantiles
+    interpolated inside the bucket they fall in.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Estimated `q` quantile (0..1), or None without observations.
+        Values in the +Inf bucket are reported as the largest finite bound.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+class Metrics:
+    """
+    Latency histograms and counters of one inference worker.
+
+    Every stage histogram records one observation per call, so batched stages
+    (the model forward, the write) count batches while per-note ones
+    (dequeue wait, tokenization, post-processing) count notes. `end_to_end`
+    is the time from the producer's timestamp until the result was durable.
+    Updates come from the consumer thread, `render` from the HTTP server's.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.stages = {stage: Histogram(buckets) for stage in STAGES}
+        self.end_to_end = Histogram(buckets)
+        self.counters = {"messages_received": 0, "notes_processed": 0, "batches": 0, "results_written": 0,
+                         "notes_retried": 0, "notes_dead_lettered": 0, "writer_stalls": 0}
+        self.queue_depth = None
+        self.buffered = 0
+        self.recent = deque()
+
+    def reset(self):
+        """
+        Clears every histogram and counter, e.g. after a warm-up.
+        """
+        with self.lock:
+            self.stages = {stage: Histogram(histogram.buckets) for stage, histogram in self.stages.items()}
+            self.end_to_end = Histogram(self.end_to_end.buckets)
+            self.counters = dict.fromkeys(self.counters, 0)
+            self.recent.clear()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+
+    def timed(self, stage, function):
+        """
+        Wraps `function` so each call is observed in `stage`. Generators are
+        timed while they are being iterated, not when they are created.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = function(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return self._timed_generator(stage, result, time.perf_counter() - started)
+            self.observe(stage, time.perf_counter() - started)
+            return result
+        return wrapper
+
+    def _timed_generator(self, stage, generator, elapsed):
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                self.observe(stage, elapsed + time.perf_counter() - started)
+                return
+            elapsed += time.perf_counter() - started
+            yield item
+
+    def received(self, messages):
+        """
+        Records the time each decoded message waited between publish and dequeue.
+        """
+        now = time.time()
+        with self.lock:
+            for message in messages:
+                self.stages["dequeue_wait"].observe(max(now - message['timestamp'], 0.0))
+            self.counters["messages_received"] += len(messages)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def processed(self, notes):
+        with self.lock:
+            self.counters["notes_processed"] += notes
+            self.counters["batches"] += 1
+            self.recent.append((time.monotonic(), notes))
+
+    def written(self, results, seconds):
+        """
+        Records a group commit of `results` that took `seconds`.
+        """
+        now = time.time()
+        with self.lock:
+            self.stages["write"].observe(seconds)
+            for result in results:
+                self.end_to_end.observe(max(now - result['timestamp'], 0.0))
+            self.counters["results_written"] += len(results)
+
+    def throughput(self):
+        """
+        Notes per second over the last `THROUGHPUT_WINDOW` seconds.
+        """
+        horizon = time.monotonic() - THROUGHPUT_WINDOW
+        with self.lock:
+            while self.recent and self.recent[0][0] < horizon:
+                self.recent.popleft()
+            return sum(notes for _, notes in self.recent) / THROUGHPUT_WINDOW
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        throughput = self.throughput()
+        with self.lock:
+            lines = ["# HELP helix_stage_seconds Time spent per call in each inference worker stage.",
+                     "# TYPE helix_stage_seconds histogram"]
+            for stage, histogram in self.stages.items():
+                lines.extend(_histogram_lines("helix_stage_seconds", histogram, f'stage="{stage}"'))
+            lines.extend(["# HELP helix_end_to_end_seconds Time from publish until the result was durable.",
+                          "# TYPE helix_end_to_end_seconds histogram"])
+            lines.extend(_histogram_lines("helix_end_to_end_seconds", self.end_to_end))
+            for name, value in self.counters.items():
+                lines.extend([f"# TYPE helix_{name}_total counter", f"helix_{name}_total {value}"])
+            gauges = {"throughput_notes_per_second": round(throughput, 3), "buffered_results": self.buffered}
+            if self.queue_depth is not None:
+                gauges["queue_depth"] = self.queue_depth
+            for name, value in gauges.items():
+                lines.extend([f"# TYPE helix_{name} gauge", f"helix_{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+def _histogram_lines(name, histogram, labels=""):
+    prefix = labels + "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+class MetricsServer:
+    """
+    Serves `metrics.render()` at http://host:port/metrics from a daemon thread.
+    Binds to localhost by default; port 0 picks a free port (see `port`).
+    """
+    def __init__(self, metrics, port=DEFAULT_PORT, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_exposition(text):
+    """
+    Parses Prometheus text into {(name, labels): value}, where labels is a
+    sorted tuple of (key, value) pairs. Only handles what `render` emits.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        labels = ()
+        if "{" in series:
+            series, label_text = series[:-1].split("{", 1)
+            labels = tuple(sorted((key, raw.strip('"')) for key, raw in
+                                  (pair.split("=", 1) for pair in label_text.split(",") if pair)))
+        samples[(series, labels)] = float(value)
+    return samples
+
+def _histogram_from_samples(samples, name, match=()):
+    """
+    Rebuilds a Histogram from parsed `{name}_bucket/_sum/_count` samples with the given labels.
+    """
+    cumulative = {}
+    for (series, labels), value in samples.items():
+        if series == f"{name}_bucket" and all(pair in labels for pair in match):
+            bound = dict(labels)["le"]
+            cumulative[float("inf") if bound == "+Inf" else float(bound)] = value
+    if not cumulative:
+        return None
+    bounds = sorted(cumulative)
+    histogram = Histogram([bound for bound in bounds if bound != float("inf")])
+    previous = 0
+    for i, bound in enumerate(bounds):
+        histogram.counts[i] = int(cumulative[bound] - previous)
+        previous = cumulative[bound]
+    histogram.sum = samples.get((f"{name}_sum", tuple(sorted(match))), 0.0)
+    histogram.count = int(previous)
+    return histogram
+
+def scrape(urls, timeout=0.5):
+    """
+    Fetches and merges the metrics of one or more workers.
+
+    Returns None if no worker answered, else {"workers", "stages",
+    "end_to_end", "throughput", "queue_depth", "counters"}, where every
+    histogram is summarized as {"count", "p50_ms", "p95_ms", "mean_ms"}.
+    """
+    stages = {stage: None for stage in STAGES}
+    end_to_end = None
+    counters = {}
+    throughput = 0.0
+    queue_depth = None
+    workers = 0
+    for url in urls:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                samples = parse_exposition(response.read().decode("utf-8"))
+        except (OSError, ValueError):
+            continue
+        workers += 1
+        for stage in STAGES:
+            histogram = _histogram_from_samples(samples, "helix_stage_seconds", (("stage", stage),))
+            if histogram is not None:
+                stages[stage] = histogram if stages[stage] is None else _merged(stages[stage], histogram)
+        histogram = _histogram_from_samples(samples, "helix_end_to_end_seconds")
+        if histogram is not None:
+            end_to_end = histogram if end_to_end is None else _merged(end_to_end, histogram)
+        for (series, labels), value in samples.items():
+            if series.endswith("_total"):
+                name = series[len("helix_"):-len("_total")]
+                counters[name] = counters.get(name, 0) + int(value)
+        throughput += samples.get(("helix_throughput_notes_per_second", ()), 0.0)
+        # Workers share one queue, so they all see the same depth
+        if ("helix_queue_depth", ()) in samples:
+            queue_depth = int(samples[("helix_queue_depth", ())])
+    if not workers:
+        return None
+    return {
+        "workers": workers,
+        "stages": {stage: summarize(histogram) for stage, histogram in stages.items() if histogram is not None},
+        "end_to_end": summarize(end_to_end) if end_to_end is not None else None,
+        "throughput": throughput,
+        "queue_depth": queue_depth,
+        "counters": counters,
+    }
+
+def _merged(first, second):
+    if first.buckets != second.buckets:
+        raise ValueError("Cannot merge histograms with different buckets")
+    first.merge(second)
+    return first
+
+def summarize(histogram):
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+    return {"count": histogram.count, "p50_ms": ms(histogram.quantile(0.5)),
+            "p95_ms": ms(histogram.quantile(0.95)), "mean_ms": ms(histogram.mean())}
@@ -0,0 +1,122 @@
+import os
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    Content-addressed cache of NER results.
+
+    De-identified notes repeat heavily (templated notes, copy-forward text), so
+    results are keyed by a hash of the cleaned text and the model version. Hot
+    entries live in an in-memory LRU of `max_entries`; if `disk_dir` is given,
+    results are also kept in a SQLite file there, which survives restarts and
+    is shared by forked workers. Changing the version drops every entry
+    computed by another model.
+    """
+    def __init__(self, max_entries=4096, disk_dir=None, max_disk_entries=1000000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.version = None
+
+        self.memory = OrderedDict()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+        # SQLite connections can't cross a fork, so each process opens its own
+        self._db = None
+        self._db_pid = None
+        self._disk_writes = 0
+
+    def bind(self, version):
+        """
+        Sets the model version results are cached for.
+        Entries from any other version are invalidated.
+        """
+        if version == self.version:
+            return
+        self.version = version
+        self.memory.clear()
+        if self.disk_dir:
+            db = self._connection()
+            with db:
+                db.execute("DELETE FROM results WHERE version != ?", (version,))
+
+    def key(self, text):
+        return hashlib.blake2b(f"{self.version}\0{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, text):
+        """
+        Returns a copy of the cached entities for `text`, or None on a miss.
+        """
+        key = self.key(text)
+        entities = self.memory.get(key)
+        if entities is not None:
+            self.memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return [dict(entity) for entity in entities]
+
+        if self.disk_dir:
+            row = self._connection().execute("SELECT entities FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entities = json.loads(row[0])
+                self._remember(key, entities)
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return [dict(entity) for entity in entities]
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, text, entities):
+        key = self.key(text)
+        entities = [dict(entity) for entity in entities]
+        self._remember(key, entities)
+
+        if self.disk_dir:
+            db = self._connection()
+            with db:
+                db.execute("INSERT OR REPLACE INTO results (key, version, entities) VALUES (?, ?, ?)",
+                           (key, self.version, json.dumps(entities)))
+            self._disk_writes += 1
+            if self._disk_writes % 1000 == 0:
+                self._trim_disk()
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk_dir:
+            db = self._connection()
+            with db:
+                db.execute("DELETE FROM results")
+
+    def close(self):
+        if self._db is not None and self._db_pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+    def _remember(self, key, entities):
+        self.memory[key] = entities
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _trim_disk(self):
+        # Rows are roughly insertion-ordered by rowid: drop the oldest beyond the bound
+        db = self._connection()
+        with db:
+            db.execute("DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?", (self.max_disk_entries,))
+
+    def _connection(self):
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.disk_dir, "ner_cache.sqlite"), timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, entities TEXT)")
+            self._db_pid = os.getpid()
+        return self._db
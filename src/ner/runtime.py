@@ -0,0 +1,182 @@
+import time
+import statistics
+
+import torch
+
+# Token lengths the warm-up runs through the model: triage notes up to discharge summaries
+WARMUP_LENGTHS = (16, 64, 128, 256, 512)
+
+# Text the warm-up notes are cut from
+WARMUP_TEXT = ("Patient presents with symptoms consistent with hypertension. Prescribed Lisinopril 10 mg daily. "
+               "History of type 2 diabetes. Plan: Start Metformin 500 mg. Vital signs stable. ")
+
+COMPILE_MODES = (None, "inductor", "torchscript")
+
+class RuntimeProfile:
+    """
+    Torch runtime settings for an NERModel, applied once at worker startup.
+
+    - `threads` / `interop_threads`: intra- and inter-op thread pools (None
+      leaves them alone, e.g. when WorkerPool already sized them).
+    - `inference_mode`: run forward passes under `torch.inference_mode`
+      instead of the pipeline's `no_grad`, which also skips version counting.
+    - `compile`: "inductor" (`torch.compile` with dynamic shapes, so the
+      length buckets share one graph) or "torchscript" (a trace). Only for
+      the torch backends; outputs are checked against eager mode first.
+    - warm-up: `warmup_rounds` passes of `warmup_batch_size` notes at every
+      length in `warmup_lengths` (capped at what the model accepts), so the
+      first real notes don't pay for allocator growth, kernel selection or
+      compilation.
+    """
+    def __init__(self, threads=None, interop_threads=None, inference_mode=True, compile=None,
+                 warmup_lengths=WARMUP_LENGTHS, warmup_rounds=3, warmup_batch_size=1):
+        if compile not in COMPILE_MODES:
+            raise ValueError(f"Unknown compile mode {compile!r}, expected one of {COMPILE_MODES}")
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self.inference_mode = inference_mode
+        self.compile = compile
+        self.warmup_lengths = tuple(warmup_lengths)
+        self.warmup_rounds = warmup_rounds
+        self.warmup_batch_size = warmup_batch_size
+
+    def apply(self, model):
+        """
+        Configures torch and `model`, then warms it up.
+        Returns a report with cold-start and steady-state latency per warm-up length.
+        """
+        report = {"threads": None, "interop_threads": None, "inference_mode": self.inference_mode, "compile": None}
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        if self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                # Fixed for the life of the process once parallel work has run
+                pass
+        report["threads"] = torch.get_num_threads()
+        report["interop_threads"] = torch.get_num_interop_threads()
+
+        if self.inference_mode:
+            model.pipeline.get_inference_context = lambda: torch.inference_mode
+        if self.compile:
+            started = time.perf_counter()
+            report["compile"] = compile_model(model, self.compile, warmup_texts(model, [max(self.lengths(model))])[0])
+            report["compile_s"] = round(time.perf_counter() - started, 3)
+        report["warmup"] = self.warm_up(model) if self.warmup_lengths and self.warmup_rounds else {}
+        return report
+
+    def lengths(self, model):
+        limit = max_tokens(model)
+        lengths = sorted({min(length, limit) for length in self.warmup_lengths})
+        return lengths or [limit]
+
+    def warm_up(self, model):
+        """
+        Times the first pass (cold) and the median of the following passes (steady) per length, in ms.
+        Goes straight to the transformer, so the result cache and gazetteer are neither used nor filled.
+        """
+        timings = {}
+        for length, text in zip(self.lengths(model), warmup_texts(model, self.lengths(model))):
+            batch = [text] * self.warmup_batch_size
+            durations = []
+            for _ in range(1 + self.warmup_rounds):
+                started = time.perf_counter()
+                model._extract_entities_model(batch, self.warmup_batch_size)
+                durations.append((time.perf_counter() - started) * 1000)
+            timings[length] = {
+                "cold_ms": round(durations[0], 2),
+                "steady_ms": round(statistics.median(durations[1:]), 2) if durations[1:] else None,
+            }
+        return timings
+
+# Named presets; "latency" warms up single notes, "throughput" full batches
+PROFILES = {
+    "off": dict(inference_mode=False, warmup_lengths=()),
+    "latency": dict(interop_threads=1, warmup_batch_size=1),
+    "throughput": dict(interop_threads=1, warmup_batch_size=16),
+}
+
+def build_profile(name, **overrides):
+    """
+    Returns the RuntimeProfile preset `name`, with any non-None `overrides` applied.
+    """
+    if name not in PROFILES:
+        raise ValueError(f"Unknown runtime profile {name!r}, expected one of {tuple(PROFILES)}")
+    settings = dict(PROFILES[name])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return RuntimeProfile(**settings)
+
+def max_tokens(model):
+    """
+    Longest sequence (in tokens, with special tokens) that `model` feeds the transformer.
+    """
+    limit = getattr(getattr(model.pipeline.model, "config", None), "max_position_embeddings", None) or 512
+    tokenizer_limit = getattr(model.pipeline.tokenizer, "model_max_length", None)
+    if tokenizer_limit and tokenizer_limit < 100000:
+        limit = min(limit, tokenizer_limit)
+    if model.chunk_tokens:
+        limit = min(limit, model.chunk_tokens)
+    return limit
+
+def warmup_texts(model, lengths):
+    """
+    Returns one note per length that tokenizes to exactly that many tokens, special tokens included.
+    """
+    tokenizer = model.pipeline.tokenizer
+    longest = max(lengths)
+    text = WARMUP_TEXT
+    while len(tokenizer(text, add_special_tokens=False)['input_ids']) < longest:
+        text += WARMUP_TEXT
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+    # Leave room for [CLS]/[SEP]
+    return [text[:offsets[max(length - 2, 1) - 1][1]] for length in lengths]
+
+def compile_model(model, mode, example_text):
+    """
+    Replaces the transformer's forward with a compiled one, keeping eager mode if
+    compilation fails or changes the logits. Returns the mode in use, or None.
+    """
+    if model.backend not in ("torch", "quantized"):
+        raise ValueError(f"Compilation needs a torch backend, not {model.backend!r}")
+    module = model.pipeline.model
+    eager = module.forward
+    inputs = model.pipeline.tokenizer(example_text, return_tensors="pt")
+    # A second, shorter input checks the compiled forward isn't tied to one shape
+    short = model.pipeline.tokenizer(example_text[:len(example_text) // 3], return_tensors="pt")
+
+    try:
+        if mode == "inductor":
+            compiled = torch.compile(eager, dynamic=True)
+        else:
+            names = list(inputs.keys())
+            with torch.no_grad():
+                traced = torch.jit.trace(module, example_kwarg_inputs=dict(inputs), strict=False, check_trace=False)
+
+            def compiled(**kwargs):
+                output = traced(**{name: kwargs[name] for name in names if name in kwargs})
+                return {"logits": output["logits"] if isinstance(output, dict) else output[0]}
+
+        with torch.inference_mode():
+            for example in (inputs, short):
+                expected = eager(**example)["logits"]
+                actual = compiled(**example)["logits"]
+                if not torch.allclose(expected, actual, atol=1e-4, rtol=1e-3):
+                    raise RuntimeError("compiled logits differ from eager mode")
+    except Exception as e:
+        print(f" [!] {mode} compilation unavailable ({e}); staying in eager mode.")
+        return None
+
+    module.forward = compiled
+    return mode
+
+def format_report(report):
+    """
+    One-line-per-length summary of a `RuntimeProfile.apply` report.
+    """
+    lines = [f" [i] Runtime: {report['threads']} threads, {report['interop_threads']} inter-op, "
+             f"inference_mode={report['inference_mode']}, compile={report['compile']}"
+             + (f" ({report['compile_s']}s)" if "compile_s" in report else "")]
+    for length, timing in report["warmup"].items():
+        lines.append(f" [i]   {length:>4} tokens: cold {timing['cold_ms']:.1f} ms, steady {timing['steady_ms']} ms")
+    return "\n".join(lines)
@@ -0,0 +1,95 @@
+import os
+import time
+import multiprocessing
+
+import torch
+
+class WorkerPool:
+    """
+    Supervises N forked inference workers that share one copy of the model weights.
+
+    The model is loaded once in the parent before forking, so every worker maps
+    the same weight pages copy-on-write (inference never writes to them).
+    Each worker gets a disjoint slice of the available cores and sizes its
+    torch thread pool to match, so workers don't oversubscribe the host.
+    """
+    def __init__(self, target, num_workers, threads_per_worker=None, pin_cores=True, restart_delay=1.0):
+        """
+        `target(worker_id)` is run in every worker and should block until the worker stops.
+        """
+        self.target = target
+        self.num_workers = num_workers
+        self.pin_cores = pin_cores
+        self.restart_delay = restart_delay
+
+        self.cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        self.threads_per_worker = threads_per_worker or max(1, len(self.cores) // num_workers)
+
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+
+    def cores_for(self, worker_id):
+        """
+        Returns the contiguous core slice assigned to a worker, wrapping around
+        when there are more workers than cores.
+        """
+        first = worker_id * self.threads_per_worker
+        return [self.cores[(first + i) % len(self.cores)] for i in range(self.threads_per_worker)]
+
+    def _worker_main(self, worker_id):
+        if self.pin_cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cores_for(worker_id))
+        torch.set_num_threads(self.threads_per_worker)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Already fixed if the parent ran parallel work before forking
+            pass
+
+        try:
+            self.target(worker_id)
+        except KeyboardInterrupt:
+            pass
+
+    def _spawn(self, worker_id):
+        process = self.context.Process(target=self._worker_main, args=(worker_id,), name=f"ner-worker-{worker_id}")
+        process.start()
+        self.processes[worker_id] = process
+        print(f" [*] Worker {worker_id} started (pid {process.pid}, cores {self.cores_for(worker_id)})")
+
+    def start(self):
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+
+    def stop(self, timeout=10):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout)
+
+    def restart_exited(self):
+        """
+        Respawns every worker whose process has exited. Returns their ids.
+        """
+        restarted = []
+        for worker_id, process in list(self.processes.items()):
+            if not process.is_alive():
+                print(f" [!] Worker {worker_id} exited with code {process.exitcode}, restarting...")
+                self._spawn(worker_id)
+                restarted.append(worker_id)
+        return restarted
+
+    def run(self):
+        """
+        Starts the workers and restarts any that die until interrupted.
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(self.restart_delay)
+                self.restart_exited()
+        except KeyboardInterrupt:
+            print("Stopping worker pool...")
+        finally:
+            self.stop()
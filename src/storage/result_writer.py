@@ -0,0 +1,69 @@
+import time
+
+class BufferedResultWriter:
+    """
+    Buffers results in front of a SegmentWriter and group-commits them.
+
+    Results are held in memory until `max_rows` are pending or the oldest has
+    waited `max_delay` seconds, then written as one record batch (and fsynced,
+    if the store does so). Callbacks registered with `add` run only after the
+    flush that made their results durable, which is where messages get acked.
+    If `metrics` are given, every commit is timed into them.
+    """
+    def __init__(self, store, max_rows=256, max_delay=0.5, metrics=None):
+        self.store = store
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.metrics = metrics
+
+        self.buffer = []
+        self.callbacks = []
+        self.oldest = None
+
+    def add(self, results, on_durable=None):
+        """
+        Queues results; `on_durable` is called once they have been flushed.
+        """
+        if not results and not self.buffer:
+            # Nothing to commit and nothing earlier in flight: already durable
+            if on_durable is not None:
+                on_durable()
+            return
+        if not self.buffer:
+            self.oldest = time.monotonic()
+        self.buffer.extend(results)
+        if on_durable is not None:
+            self.callbacks.append(on_durable)
+        self.maybe_flush()
+
+    def pending(self):
+        return len(self.buffer)
+
+    def due(self):
+        return bool(self.buffer) and (len(self.buffer) >= self.max_rows or time.monotonic() - self.oldest >= self.max_delay)
+
+    def maybe_flush(self):
+        """
+        Flushes if the size or time threshold has been reached. Returns True if it flushed.
+        """
+        if not self.due():
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        if self.buffer:
+            started = time.perf_counter()
+            self.store.append(self.buffer)
+            if self.metrics is not None:
+                self.metrics.written(self.buffer, time.perf_counter() - started)
+        callbacks = self.callbacks
+        self.buffer = []
+        self.callbacks = []
+        self.oldest = None
+        for on_durable in callbacks:
+            on_durable()
+
+    def close(self):
+        self.flush()
+        self.store.close()
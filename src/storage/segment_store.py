@@ -0,0 +1,426 @@
+import sys
+import os
+import time
+import json
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), '../../data/processed_notes')
+
+# One boolean column per target label, so label predicates never touch the entity lists
+LABEL_COLUMNS = {
+    'Target: Disease': 'has_disease',
+    'Target: Medication': 'has_medication',
+    'Target: Dosage': 'has_dosage',
+}
+
+SCHEMA = pa.schema([
+    ('timestamp', pa.float64()),
+    ('original_text_masked', pa.string()),
+    ('entity_text', pa.list_(pa.string())),
+    ('entity_label', pa.list_(pa.string())),
+    ('entity_score', pa.list_(pa.float64())),
+    ('entity_start', pa.list_(pa.int64())),
+    ('entity_end', pa.list_(pa.int64())),
+    # De-identification edits: [masked_start, masked_end, original_start, original_end]
+    ('phi_edits', pa.list_(pa.list_(pa.int64()))),
+] + [(column, pa.bool_()) for column in LABEL_COLUMNS.values()])
+
+SEGMENT_SUFFIX = '.arrows'
+
+def partition_of(timestamp):
+    """
+    Returns the (day, hour) partition directory for a UNIX timestamp, in UTC.
+    """
+    t = time.gmtime(timestamp)
+    return time.strftime('%Y-%m-%d', t), time.strftime('%H', t)
+
+def to_record_batch(results):
+    """
+    Flattens processed-note results (the dicts written by the inference worker)
+    into a record batch with one list column per entity field.
+    """
+    columns = {name: [] for name in SCHEMA.names}
+    for result in results:
+        entities = result.get('entities', [])
+        labels = set()
+        columns['timestamp'].append(float(result['timestamp']))
+        columns['original_text_masked'].append(result.get('original_text_masked'))
+        columns['entity_text'].append([e['entity'] for e in entities])
+        columns['entity_label'].append([e['label'] for e in entities])
+        columns['entity_score'].append([float(e['score']) for e in entities])
+        columns['entity_start'].append([int(e['start']) for e in entities])
+        columns['entity_end'].append([int(e['end']) for e in entities])
+        columns['phi_edits'].append(result.get('phi_edits'))
+        for e in entities:
+            labels.add(e['label'])
+        for label, column in LABEL_COLUMNS.items():
+            columns[column].append(label in labels)
+    return pa.record_batch([pa.array(columns[name], type=SCHEMA.field(name).type) for name in SCHEMA.names], schema=SCHEMA)
+
+def to_results(table):
+    """
+    Inverse of `to_record_batch`: rebuilds the result dicts from a table or batch.
+    """
+    data = table.to_pydict()
+    results = []
+    for i, timestamp in enumerate(data['timestamp']):
+        entities = [
+            {"entity": text, "label": label, "score": score, "start": start, "end": end}
+            for text, label, score, start, end in zip(data['entity_text'][i], data['entity_label'][i], data['entity_score'][i],
+                                                       data['entity_start'][i], data['entity_end'][i])
+        ]
+        result = {
+            "timestamp": timestamp,
+            "original_text_masked": data['original_text_masked'][i],
+            "entities": entities
+        }
+        if data['phi_edits'][i] is not None:
+            result["phi_edits"] = data['phi_edits'][i]
+        results.append(result)
+    return results
+
+def conform(batch):
+    """
+    Brings a batch written under an older schema up to SCHEMA, filling new columns with nulls.
+    """
+    if batch.schema.equals(SCHEMA):
+        return batch
+    arrays = [batch.column(name) if name in batch.schema.names else pa.nulls(batch.num_rows, SCHEMA.field(name).type)
+              for name in SCHEMA.names]
+    return pa.record_batch(arrays, schema=SCHEMA)
+
+def fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class SegmentWriter:
+    """
+    Appends results to time-partitioned Arrow IPC stream segments.
+
+    Layout: <root>/<YYYY-MM-DD>/<HH>/segment-<first ts ms>-<pid>-<seq>.arrows
+    Each `append` writes one record batch to the active segment of its hour
+    partition. Segments are rotated when their partition changes or they exceed
+    `max_segment_rows` rows or `max_segment_age` seconds. Every writer process
+    owns its own segments, so forked workers never contend on a file.
+    """
+    def __init__(self, root=STORE_DIR, max_segment_rows=100000, max_segment_age=600, fsync=True):
+        self.root = root
+        self.max_segment_rows = max_segment_rows
+        self.max_segment_age = max_segment_age
+        self.fsync = fsync
+
+        self.sequence = 0
+        self.file = None
+        self.stream = None
+        self.partition = None
+        self.rows = 0
+        self.opened_at = 0
+
+    def _open(self, partition, first_timestamp):
+        directory = os.path.join(self.root, *partition)
+        created = not os.path.isdir(directory)
+        os.makedirs(directory, exist_ok=True)
+        while True:
+            self.sequence += 1
+            name = f"segment-{int(first_timestamp * 1000)}-{os.getpid()}-{self.sequence}{SEGMENT_SUFFIX}"
+            try:
+                # Never reuse a name: a restarted worker may get the same pid
+                self.file = open(os.path.join(directory, name), 'xb')
+                break
+            except FileExistsError:
+                continue
+        self.stream = pa.ipc.new_stream(self.file, SCHEMA)
+        if self.fsync:
+            # The new file's directory entry (and new partition directories) must survive a crash too
+            fsync_directory(directory)
+            if created:
+                fsync_directory(os.path.dirname(directory))
+                fsync_directory(self.root)
+        self.partition = partition
+        self.rows = 0
+        self.opened_at = time.monotonic()
+
+    def rotate(self):
+        """
+        Seals the active segment. The next append starts a new one.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            # A commit spanning partitions rotates mid-append: its rows here must be durable too
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.file.close()
+        self.file = None
+        self.stream = None
+        self.partition = None
+
+    def _needs_rotation(self, partition):
+        return (self.stream is None
+                or partition != self.partition
+                or self.rows >= self.max_segment_rows
+                or time.monotonic() - self.opened_at >= self.max_segment_age)
+
+    def append(self, results):
+        """
+        Writes results and, if `fsync` is set, forces them to disk before returning.
+        """
+        by_partition = {}
+        for result in results:
+            by_partition.setdefault(partition_of(result['timestamp']), []).append(result)
+
+        # Every segment this call writes to, with its size before the call (None if created by it)
+        touched = []
+        try:
+            for partition, rows in by_partition.items():
+                if self._needs_rotation(partition):
+                    self.rotate()
+                    self._open(partition, rows[0]['timestamp'])
+                    touched.append((self.file.name, None))
+                elif not touched or touched[-1][0] != self.file.name:
+                    touched.append((self.file.name, self.file.tell()))
+                self.stream.write_batch(to_record_batch(rows))
+                self.rows += len(rows)
+
+            if self.file is not None:
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+        except OSError:
+            self.abandon(touched)
+            raise
+
+    def abandon(self, touched=()):
+        """
+        Undoes a failed append so it is all-or-nothing: segments it created are
+        deleted, and ones it extended are cut back to their earlier size
+        (readers stop cleanly at a batch boundary). The active segment is
+        dropped, so the retry starts a new one.
+        """
+        for handle in (self.stream, self.file):
+            try:
+                if handle is not None:
+                    handle.close()
+            except (OSError, pa.ArrowException):
+                pass
+        self.file = None
+        self.stream = None
+        self.partition = None
+        for path, size in touched:
+            try:
+                if size is None:
+                    os.remove(path)
+                else:
+                    os.truncate(path, size)
+            except OSError as e:
+                print(f" [!] Could not roll back {path} after a failed write: {e}")
+
+    def close(self):
+        self.rotate()
+
+def read_segment(path, skip=0):
+    """
+    Reads the record batches of one segment, skipping the first `skip`.
+    Segments that are still being written are read up to their last complete batch.
+    """
+    batches = []
+    try:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_stream(source)
+            index = 0
+            while True:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                if index >= skip:
+                    batches.append(conform(batch))
+                index += 1
+    except (pa.ArrowInvalid, OSError):
+        # Empty or half-written segment: whatever was complete has been collected
+        pass
+    return batches
+
+class SegmentReader:
+    """
+    Reads results back from a segment store.
+
+    `scan`/`read` prune whole hour partitions and record batches outside the
+    requested time range, and filter rows by label on the `has_*` columns.
+    `read_new` tails the store, returning only rows it has not returned before.
+    """
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        # Per segment path: (size seen, batches consumed) for read_new
+        self.cursor = {}
+        self.last_partition = None
+
+    def partitions(self, start=None, end=None):
+        """
+        Lists (day, hour) partitions overlapping [start, end], oldest first.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        low = partition_of(start) if start is not None else None
+        high = partition_of(end) if end is not None else None
+        found = []
+        for day in sorted(os.listdir(self.root)):
+            day_dir = os.path.join(self.root, day)
+            if not os.path.isdir(day_dir):
+                continue
+            for hour in sorted(os.listdir(day_dir)):
+                partition = (day, hour)
+                if (low and partition < low) or (high and partition > high):
+                    continue
+                found.append(partition)
+        return found
+
+    def segments(self, partition):
+        directory = os.path.join(self.root, *partition)
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def scan(self, start=None, end=None, labels=None):
+        """
+        Returns a pyarrow Table with the rows in [start, end] that contain any of `labels`.
+        """
+        batches = []
+        for partition in self.partitions(start, end):
+            for path in self.segments(partition):
+                for batch in read_segment(path):
+                    batch = self._filter(batch, start, end, labels)
+                    if batch is not None and batch.num_rows:
+                        batches.append(batch)
+        return pa.Table.from_batches(batches, schema=SCHEMA)
+
+    def read(self, start=None, end=None, labels=None):
+        """
+        Same as `scan`, returned as result dicts in the worker's output shape.
+        """
+        return to_results(self.scan(start, end, labels))
+
+    def read_new(self):
+        """
+        Returns results written since the previous call, as result dicts.
+        Only the newest partitions are checked, and unchanged segments are skipped by size.
+        """
+        partitions = self.partitions()
+        if self.last_partition is not None:
+            # Allow one partition of lag for results that arrive slightly out of order
+            recent = [p for p in partitions if p >= self.last_partition]
+            older = [p for p in partitions if p < self.last_partition]
+            partitions = older[-1:] + recent
+
+        new_batches = []
+        for partition in partitions:
+            for path in self.segments(partition):
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                seen_size, consumed = self.cursor.get(path, (0, 0))
+                if size == seen_size:
+                    continue
+                batches = read_segment(path, skip=consumed)
+                self.cursor[path] = (size, consumed + len(batches))
+                new_batches.extend(batches)
+        if partitions:
+            self.last_partition = partitions[-1]
+
+        if not new_batches:
+            return []
+        results = to_results(pa.Table.from_batches(new_batches, schema=SCHEMA))
+        results.sort(key=lambda result: result['timestamp'])
+        return results
+
+    def read_until(self, other):
+        """
+        Returns the rows that `other`, a reader further along the same store,
+        has already returned from `read_new` but this one hasn't, and moves this
+        cursor up to `other`'s. Segments past `other`'s cursor aren't read.
+        """
+        new_batches = []
+        for path, (_, consumed) in sorted(other.cursor.items()):
+            _, seen = self.cursor.get(path, (0, 0))
+            if consumed > seen:
+                new_batches.extend(read_segment(path, skip=seen)[:consumed - seen])
+        self.cursor = dict(other.cursor)
+        self.last_partition = other.last_partition
+
+        if not new_batches:
+            return []
+        results = to_results(pa.Table.from_batches(new_batches, schema=SCHEMA))
+        results.sort(key=lambda result: result['timestamp'])
+        return results
+
+    def state(self):
+        """
+        Returns the `read_new` cursor as JSON-serializable data, with paths relative to the root.
+        """
+        return {
+            "cursor": {os.path.relpath(path, self.root): list(position) for path, position in self.cursor.items()},
+            "last_partition": list(self.last_partition) if self.last_partition else None,
+        }
+
+    def restore(self, state):
+        """
+        Resumes `read_new` from a cursor saved with `state`.
+        """
+        self.cursor = {os.path.join(self.root, path): tuple(position) for path, position in state["cursor"].items()}
+        self.last_partition = tuple(state["last_partition"]) if state["last_partition"] else None
+
+    def _filter(self, batch, start, end, labels):
+        timestamps = batch.column('timestamp')
+        if start is not None or end is not None:
+            # Whole-batch pruning on min/max before any row-level work
+            bounds = pc.min_max(timestamps)
+            if bounds['min'].as_py() is None:
+                return None
+            if (start is not None and bounds['max'].as_py() < start) or (end is not None and bounds['min'].as_py() > end):
+                return None
+
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(timestamps, start)
+        if end is not None:
+            upper = pc.less_equal(timestamps, end)
+            mask = upper if mask is None else pc.and_(mask, upper)
+        if labels:
+            label_mask = None
+            for label in labels:
+                column = batch.column(LABEL_COLUMNS[label])
+                label_mask = column if label_mask is None else pc.or_(label_mask, column)
+            mask = label_mask if mask is None else pc.and_(mask, label_mask)
+        return batch if mask is None else batch.filter(mask)
+
+def import_jsonl(path, root=STORE_DIR, chunk_size=10000):
+    """
+    Copies a legacy processed_notes.jsonl file into the segment store.
+    """
+    writer = SegmentWriter(root, fsync=False)
+    imported = 0
+    chunk = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                writer.append(chunk)
+                imported += len(chunk)
+                chunk = []
+    if chunk:
+        writer.append(chunk)
+        imported += len(chunk)
+    writer.close()
+    return imported
+
+if __name__ == "__main__":
+    # Migrate the legacy JSONL output:
+    #   python src/storage/segment_store.py data/processed_notes.jsonl
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '../../data/processed_notes.jsonl')
+    print(f"Imported {import_jsonl(source)} notes into {os.path.abspath(STORE_DIR)}")
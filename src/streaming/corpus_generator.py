@@ -0,0 +1,215 @@
+import sys
+import os
+import time
+import json
+import datetime
+import argparse
+
+import numpy as np
+from faker.providers.person.en_US import Provider as PersonProvider
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.streaming.vocabulary import EXTENDED_CONDITIONS, EXTENDED_MEDICATIONS, DOSE_AMOUNTS, DOSE_UNITS, FREQUENCIES
+
+# First sentence of every note; carries the PHI the de-identifier has to find
+OPENINGS = [
+    "Patient {name} seen on {date}.",
+    "Dr. {doctor} evaluated {name} on {date}.",
+    "Discharge summary for {name}. Date: {date}.",
+    "ID: {id}. {name} presents for follow-up on {date}.",
+]
+
+# (template, weight); about half of the sentences mention an entity
+SENTENCES = [
+    ("Presents with symptoms consistent with {condition}.", 3),
+    ("Diagnosis: {condition}.", 3),
+    ("History of {condition}.", 3),
+    ("Complains of worsening {condition}.", 2),
+    ("Prescribed {medication} {dose} {frequency}.", 3),
+    ("Plan: Start {medication} {dose}.", 3),
+    ("Medications: {medication} {dose} PO.", 2),
+    ("Increased {medication} to {dose}.", 1),
+    ("Vital signs stable.", 3),
+    ("No acute distress.", 3),
+    ("Lungs clear to auscultation bilaterally.", 2),
+    ("Denies chest pain or shortness of breath.", 2),
+    ("Labs reviewed and unremarkable.", 2),
+    ("Discussed risks and benefits of treatment with the patient.", 2),
+    ("Follow up in {weeks} weeks.", 2),
+]
+
+class CorpusGenerator:
+    """
+    Bulk synthetic note generator for benchmark corpora.
+
+    Unlike `generate_synthetic_note`, which calls Faker and `random` per
+    field, every random choice for a batch (names, dates, IDs, sentence
+    templates, vocabulary entries, note lengths) is drawn at once with NumPy
+    from a seeded generator; the Python loop only joins pre-built strings.
+    Note lengths follow a lognormal mixture: mostly short notes plus a
+    `long_fraction` of discharge-summary-length ones.
+    """
+    def __init__(self, seed=None, conditions=EXTENDED_CONDITIONS, medications=EXTENDED_MEDICATIONS,
+                 dose_amounts=DOSE_AMOUNTS, dose_units=DOSE_UNITS, frequencies=FREQUENCIES,
+                 median_sentences=3, long_fraction=0.03, long_median_sentences=40, max_sentences=250,
+                 last_date=datetime.date(2025, 12, 31)):
+        self.rng = np.random.default_rng(seed)
+        self.conditions = list(conditions)
+        self.medications = list(medications)
+        self.doses = [f"{amount} {unit}" for amount in dose_amounts for unit in dose_units]
+        self.frequencies = list(frequencies)
+
+        self.median_sentences = median_sentences
+        self.long_fraction = long_fraction
+        self.long_median_sentences = long_median_sentences
+        self.max_sentences = max_sentences
+
+        # Name pools weighted by US frequency, from Faker's tables
+        self.first_names, self.first_p = self._pool(PersonProvider.first_names)
+        self.last_names, self.last_p = self._pool(PersonProvider.last_names)
+        # Every date of the year up to `last_date`, formatted once (fixed, so a seed reproduces a corpus)
+        self.dates = [(last_date - datetime.timedelta(days=d)).strftime("%m/%d/%Y") for d in range(365)]
+
+        self.sentence_templates = [template for template, _ in SENTENCES]
+        weights = np.array([weight for _, weight in SENTENCES], dtype=float)
+        self.sentence_p = weights / weights.sum()
+
+    @staticmethod
+    def _pool(weighted):
+        names = list(weighted)
+        weights = np.array([float(weighted[name]) for name in names])
+        return names, weights / weights.sum()
+
+    @classmethod
+    def from_vocabulary_file(cls, path, **kwargs):
+        """
+        Builds a generator with vocabulary lists from JSON, e.g.
+        {"conditions": [...], "medications": [...], "dose_amounts": [...], "dose_units": [...], "frequencies": [...]}
+        """
+        with open(path, 'r') as f:
+            vocabulary = json.load(f)
+        return cls(**vocabulary, **kwargs)
+
+    def sentence_counts(self, n):
+        """
+        Sentences per note (including the opening one).
+        """
+        short = self.rng.lognormal(np.log(self.median_sentences), 0.6, size=n)
+        long = self.rng.lognormal(np.log(self.long_median_sentences), 0.5, size=n)
+        counts = np.where(self.rng.random(n) < self.long_fraction, long, short)
+        return np.clip(np.rint(counts), 1, self.max_sentences).astype(np.int64)
+
+    def generate(self, n):
+        """
+        Returns `n` notes.
+        """
+        rng = self.rng
+        counts = self.sentence_counts(n)
+        body_total = int(counts.sum()) - n
+
+        # Per-note fields
+        first = rng.choice(len(self.first_names), size=n, p=self.first_p).tolist()
+        last = rng.choice(len(self.last_names), size=n, p=self.last_p).tolist()
+        doctor = rng.choice(len(self.last_names), size=n, p=self.last_p).tolist()
+        dates = rng.integers(len(self.dates), size=n).tolist()
+        ids = rng.integers(10000, 100000, size=n).tolist()
+        openings = rng.integers(len(OPENINGS), size=n).tolist()
+
+        # Per-sentence fields, for all body sentences of the batch at once
+        templates = rng.choice(len(self.sentence_templates), size=body_total, p=self.sentence_p).tolist()
+        conditions = rng.integers(len(self.conditions), size=body_total).tolist()
+        medications = rng.integers(len(self.medications), size=body_total).tolist()
+        doses = rng.integers(len(self.doses), size=body_total).tolist()
+        frequencies = rng.integers(len(self.frequencies), size=body_total).tolist()
+        weeks = rng.integers(1, 13, size=body_total).tolist()
+
+        first_names, last_names = self.first_names, self.last_names
+        sentence_templates = self.sentence_templates
+        notes = []
+        k = 0
+        for i, count in enumerate(counts.tolist()):
+            parts = [OPENINGS[openings[i]].format(name=f"{first_names[first[i]]} {last_names[last[i]]}",
+                                                  date=self.dates[dates[i]], id=ids[i], doctor=last_names[doctor[i]])]
+            for j in range(k, k + count - 1):
+                parts.append(sentence_templates[templates[j]].format(
+                    condition=self.conditions[conditions[j]], medication=self.medications[medications[j]],
+                    dose=self.doses[doses[j]], frequency=self.frequencies[frequencies[j]], weeks=weeks[j]))
+            k += count - 1
+            notes.append(" ".join(parts))
+        return notes
+
+    def batches(self, n, batch_size=10000):
+        """
+        Yields `n` notes in lists of up to `batch_size`.
+        """
+        for start in range(0, n, batch_size):
+            yield self.generate(min(batch_size, n - start))
+
+def write_jsonl(generator, path, n, batch_size=10000, start_timestamp=None, interval=0.01):
+    """
+    Writes `n` notes as producer messages ({"note", "timestamp"}), one JSON object per line.
+    Timestamps start at `start_timestamp` (default: now) and advance by `interval` seconds per note.
+    """
+    timestamp = time.time() if start_timestamp is None else start_timestamp
+    written = 0
+    with open(path, 'w') as f:
+        for notes in generator.batches(n, batch_size):
+            f.write("".join(json.dumps({'note': note, 'timestamp': timestamp + (written + i) * interval}) + "\n"
+                            for i, note in enumerate(notes)))
+            written += len(notes)
+    return written
+
+def publish(generator, n, batch_size=10000, host='localhost'):
+    """
+    Publishes `n` notes straight to the notes queue.
+    """
+    import pika
+    from src.streaming.rabbitmq_producer import QUEUE_NAME
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host))
+    channel = connection.channel()
+    channel.queue_declare(queue=QUEUE_NAME)
+    published = 0
+    try:
+        for notes in generator.batches(n, batch_size):
+            for note in notes:
+                channel.basic_publish(exchange='', routing_key=QUEUE_NAME, body=json.dumps({'note': note, 'timestamp': time.time()}))
+            published += len(notes)
+    finally:
+        connection.close()
+    return published
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix bulk synthetic corpus generator")
+    parser.add_argument('--count', type=int, default=100000, help="Number of notes to generate.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed; the same seed and vocabulary give the same corpus.")
+    parser.add_argument('--output', default=None, help="JSONL file to write (default: publish to RabbitMQ).")
+    parser.add_argument('--vocabulary', default=None, help="JSON file overriding the vocabulary lists.")
+    parser.add_argument('--batch-size', type=int, default=10000, help="Notes assembled per batch.")
+    parser.add_argument('--median-sentences', type=float, default=3, help="Median sentences in a regular note.")
+    parser.add_argument('--long-fraction', type=float, default=0.03, help="Share of long, discharge-summary-sized notes.")
+    parser.add_argument('--host', default='localhost', help="RabbitMQ host when publishing.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = dict(seed=args.seed, median_sentences=args.median_sentences, long_fraction=args.long_fraction)
+    if args.vocabulary:
+        generator = CorpusGenerator.from_vocabulary_file(args.vocabulary, **options)
+    else:
+        generator = CorpusGenerator(**options)
+
+    started = time.perf_counter()
+    if args.output:
+        count = write_jsonl(generator, args.output, args.count, args.batch_size)
+        destination = args.output
+    else:
+        count = publish(generator, args.count, args.batch_size, args.host)
+        destination = "RabbitMQ"
+    elapsed = time.perf_counter() - started
+    print(f"Generated {count} notes in {elapsed:.1f}s ({count / elapsed:,.0f} notes/s) -> {destination}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import sys
+import os
+import time
+import json
+import random
+import asyncio
+import argparse
+
+import numpy as np
+import pika
+from faker import Faker
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.streaming.rabbitmq_producer import generate_synthetic_note, QUEUE_NAME
+
+PROFILES = ("constant", "burst", "ramp")
+
+class RateProfile:
+    """
+    Target publish rate (msgs/s) over time:
+    - "constant": `rate` throughout.
+    - "burst": `rate`, jumping to `burst_rate` for `burst_seconds` every `burst_period` seconds.
+    - "ramp": linear from `rate` to `burst_rate` over `duration` seconds, to find the
+      rate at which the consumer saturates.
+    """
+    def __init__(self, rate, profile="constant", burst_rate=None, burst_seconds=5.0, burst_period=30.0, duration=60.0):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile!r}, expected one of {PROFILES}")
+        if rate <= 0 or (burst_rate is not None and burst_rate <= 0):
+            raise ValueError(f"Rates must be positive, got rate={rate} burst_rate={burst_rate}")
+        self.rate = rate
+        self.profile = profile
+        self.burst_rate = burst_rate if burst_rate is not None else rate * 5
+        self.burst_seconds = burst_seconds
+        self.burst_period = burst_period
+        self.duration = duration
+
+    def rate_at(self, elapsed):
+        if self.profile == "burst" and elapsed % self.burst_period < self.burst_seconds:
+            return self.burst_rate
+        if self.profile == "ramp":
+            return self.rate + (self.burst_rate - self.rate) * min(elapsed / self.duration, 1.0)
+        return self.rate
+
+class LoadGenerator:
+    """
+    Publishes synthetic notes at a target rate with publisher confirms.
+
+    Publishing is pipelined: up to `window` messages may be awaiting their
+    confirm at once, and the generator only stalls when the window is full,
+    which is exactly when the broker (or the consumer behind it) can't keep
+    up. Confirm latency is recorded per message for the final report.
+    """
+    def __init__(self, profile, duration=60.0, window=256, persistent=False, queue=QUEUE_NAME, pool_size=10000, seed=None):
+        self.profile = profile
+        self.duration = duration
+        self.window = window
+        self.queue = queue
+        self.properties = pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent) if persistent else None
+
+        # Notes are generated up front so Faker never limits the publish rate
+        if seed is not None:
+            # Faker draws from its own generator, not the `random` module's
+            random.seed(seed)
+            Faker.seed(seed)
+        self.notes = [generate_synthetic_note() for _ in range(pool_size)]
+
+        self.channel = None
+        self.next_tag = 1
+        # delivery tag -> publish time, for messages awaiting their confirm
+        self.in_flight = {}
+        self.latencies = []
+        self.published = 0
+        self.nacked = 0
+        self.max_in_flight = 0
+        self.window_stalls = 0
+        self.window_open = None
+        self.elapsed = 0.0
+
+    def on_confirm(self, method_frame):
+        """
+        Handles a Basic.Ack/Basic.Nack, which may cover every tag up to its own.
+        """
+        now = time.perf_counter()
+        method = method_frame.method
+        if method.multiple:
+            # Tags are inserted in ascending order, so stop at the first newer one
+            tags = []
+            for tag in self.in_flight:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self.in_flight else []
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        for tag in tags:
+            sent = self.in_flight.pop(tag)
+            if acked:
+                self.latencies.append(now - sent)
+            else:
+                self.nacked += 1
+        if len(self.in_flight) < self.window:
+            self.window_open.set()
+
+    def publish(self):
+        note = self.notes[self.published % len(self.notes)]
+        body = json.dumps({'note': note, 'timestamp': time.time()})
+        self.in_flight[self.next_tag] = time.perf_counter()
+        self.channel.basic_publish(exchange='', routing_key=self.queue, body=body, properties=self.properties)
+        self.next_tag += 1
+        self.published += 1
+        self.max_in_flight = max(self.max_in_flight, len(self.in_flight))
+
+    async def run(self, channel):
+        """
+        Paces publishes on `channel` (already in confirm mode) for `duration` seconds,
+        then waits briefly for outstanding confirms.
+        """
+        self.channel = channel
+        self.window_open = asyncio.Event()
+        self.window_open.set()
+
+        started = time.perf_counter()
+        # Time at which the next message is due; advanced by 1/rate per message
+        due = 0.0
+        while True:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.duration:
+                break
+            if due > elapsed:
+                await asyncio.sleep(min(due - elapsed, 0.05))
+                continue
+            # Send everything that is due (catching up after a stall), as far as the window allows
+            while due <= elapsed and due < self.duration:
+                if len(self.in_flight) >= self.window:
+                    self.window_stalls += 1
+                    self.window_open.clear()
+                    try:
+                        # A broker that stopped confirming must not hold the run past its duration
+                        await asyncio.wait_for(self.window_open.wait(), self.duration - (time.perf_counter() - started))
+                    except asyncio.TimeoutError:
+                        pass
+                    break
+                self.publish()
+                due += 1.0 / self.profile.rate_at(due)
+            # Yield so confirms get processed between sends
+            await asyncio.sleep(0)
+        self.elapsed = time.perf_counter() - started
+
+        deadline = time.perf_counter() + 10
+        while self.in_flight and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        return self.report()
+
+    def report(self):
+        latencies = np.array(self.latencies) * 1000
+        report = {
+            "profile": self.profile.profile,
+            "target_rate": self.profile.rate,
+            "duration_s": round(self.elapsed, 3),
+            "published": self.published,
+            "confirmed": len(self.latencies),
+            "nacked": self.nacked,
+            "unconfirmed": len(self.in_flight),
+            "publish_rate": round(self.published / self.elapsed, 1) if self.elapsed else 0.0,
+            "achieved_rate": round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "max_in_flight": self.max_in_flight,
+            "window_stalls": self.window_stalls,
+        }
+        if latencies.size:
+            for p in (50, 95, 99):
+                report[f"confirm_p{p}_ms"] = round(float(np.percentile(latencies, p)), 3)
+            report["confirm_max_ms"] = round(float(latencies.max()), 3)
+        return report
+
+async def open_channel(parameters, queue=QUEUE_NAME, on_confirm=None):
+    """
+    Opens an AsyncioConnection and a channel in confirm mode with `queue` declared.
+    Returns (connection, channel).
+    """
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+
+    def fail(error):
+        if not ready.done():
+            ready.set_exception(error if isinstance(error, BaseException) else RuntimeError(str(error)))
+
+    def on_channel(channel):
+        def on_declared(_):
+            channel.confirm_delivery(on_confirm, callback=lambda _: ready.set_result((connection, channel)))
+        channel.queue_declare(queue=queue, callback=on_declared)
+
+    connection = AsyncioConnection(parameters,
+                                   on_open_callback=lambda conn: conn.channel(on_open_callback=on_channel),
+                                   on_open_error_callback=lambda conn, error: fail(error),
+                                   on_close_callback=lambda conn, error: fail(error),
+                                   custom_ioloop=loop)
+    return await ready
+
+async def run_load(generator, host='localhost'):
+    connection, channel = await open_channel(pika.ConnectionParameters(host), generator.queue, generator.on_confirm)
+    try:
+        return await generator.run(channel)
+    finally:
+        connection.close()
+
+def positive_float(value):
+    value = float(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be positive, got {value:g}")
+    return value
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix synthetic note load generator")
+    parser.add_argument('--rate', type=positive_float, required=True, help="Target publish rate in msgs/s.")
+    parser.add_argument('--duration', type=float, default=60.0, help="Seconds to publish for.")
+    parser.add_argument('--profile', choices=PROFILES, default='constant',
+                        help="constant rate, periodic bursts, or a linear ramp to --burst-rate.")
+    parser.add_argument('--burst-rate', type=positive_float, default=None,
+                        help="Rate during bursts, or at the end of a ramp (defaults to 5x --rate).")
+    parser.add_argument('--burst-seconds', type=float, default=5.0, help="Length of each burst.")
+    parser.add_argument('--burst-period', type=float, default=30.0, help="Seconds between burst starts.")
+    parser.add_argument('--window', type=int, default=256, help="Max messages awaiting a publisher confirm.")
+    parser.add_argument('--persistent', action='store_true',
+                        help="Publish with delivery_mode=2, so the broker writes messages to disk before confirming them.")
+    parser.add_argument('--host', default='localhost', help="RabbitMQ host.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for the synthetic note pool.")
+    parser.add_argument('--json', dest='json_path', default=None, help="Also write the report to this JSON file.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    profile = RateProfile(args.rate, args.profile, args.burst_rate, args.burst_seconds, args.burst_period, args.duration)
+    generator = LoadGenerator(profile, args.duration, args.window, args.persistent, seed=args.seed)
+    print(f"Publishing to '{QUEUE_NAME}' at {args.rate:g} msgs/s ({args.profile}) for {args.duration:g}s...")
+    report = asyncio.run(run_load(generator, args.host))
+
+    for key, value in report.items():
+        print(f"  {key:>16}: {value}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
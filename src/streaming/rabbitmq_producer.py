@@ -2,8 +2,17 @@ import pika
 import time
 import json
 import random
+import sys
+import os
 from faker import Faker
 
+# Add src to python path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.streaming.vocabulary import CONDITIONS, MEDICATIONS, DOSAGES
+
+QUEUE_NAME = 'clinical_notes_stream'
+
 # Initialize Faker for generating synthetic data
 fake = Faker()
 
@@ -14,14 +23,9 @@ def generate_synthetic_note():
     patient_name = fake.name()
     date = fake.date_this_year().strftime("%m/%d/%Y")
     
-    # List of common diseases and medications for synthesis
-    conditions = ["hypertension", "type 2 diabetes", "asthma", "pneumonia", "atrial fibrillation"]
-    medications = ["Lisinopril", "Metformin", "Albuterol", "Azithromycin", "Warfarin"]
-    dosages = ["10 mg", "500 mg", "90 mcg", "250 mg", "5 mg"]
-    
-    condition = random.choice(conditions)
-    medication = random.choice(medications)
-    dosage = random.choice(dosages)
+    condition = random.choice(CONDITIONS)
+    medication = random.choice(MEDICATIONS)
+    dosage = random.choice(DOSAGES)
     
     # Templates for clinical notes
     templates = [
@@ -33,10 +37,17 @@ def generate_synthetic_note():
     
     return random.choice(templates)
 
-def main():
+def main(argv=None):
     """
     Main loop to publish messages to RabbitMQ.
+    With arguments (e.g. `--rate 500`), runs the asyncio load generator instead,
+    see src/streaming/load_generator.py.
     """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        from src.streaming.load_generator import main as run_load_generator
+        return run_load_generator(argv)
+
     connection = None
     channel = None
     
@@ -45,7 +56,7 @@ def main():
         try:
             connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
             channel = connection.channel()
-            channel.queue_declare(queue='clinical_notes_stream')
+            channel.queue_declare(queue=QUEUE_NAME)
             print("Connected to RabbitMQ.")
             break
         except pika.exceptions.AMQPConnectionError:
@@ -58,7 +69,7 @@ def main():
             message = {'note': note, 'timestamp': time.time()}
             
             channel.basic_publish(exchange='',
-                                  routing_key='clinical_notes_stream',
+                                  routing_key=QUEUE_NAME,
                                   body=json.dumps(message))
             
             print(f" [x] Sent: {note[:50]}...")
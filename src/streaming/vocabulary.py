@@ -0,0 +1,50 @@
+"""
+Shared clinical vocabulary of the synthetic note generator.
+Kept free of heavy imports so the NER side can build dictionaries from it.
+"""
+
+# List of common diseases and medications for synthesis
+CONDITIONS = ["hypertension", "type 2 diabetes", "asthma", "pneumonia", "atrial fibrillation"]
+MEDICATIONS = ["Lisinopril", "Metformin", "Albuterol", "Azithromycin", "Warfarin"]
+DOSAGES = ["10 mg", "500 mg", "90 mcg", "250 mg", "5 mg"]
+
+# Non-entity words used by the note templates, after de-identification
+TEMPLATE_WORDS = [
+    "patient", "seen", "on", "presents", "with", "symptoms", "consistent", "prescribed", "daily",
+    "dr", "evaluated", "diagnosis", "plan", "start",
+    "discharge", "summary", "for", "date", "history", "of", "medications", "po",
+    "id", "complains", "worsening", "increased", "to",
+    # De-identification placeholders
+    "name",
+]
+
+# Larger vocabulary for the bulk corpus generator (src/streaming/corpus_generator.py)
+EXTENDED_CONDITIONS = CONDITIONS + [
+    "chronic kidney disease", "congestive heart failure", "coronary artery disease", "copd", "hyperlipidemia",
+    "hypothyroidism", "hyperthyroidism", "migraine", "epilepsy", "major depressive disorder",
+    "generalized anxiety disorder", "bipolar disorder", "schizophrenia", "osteoarthritis", "rheumatoid arthritis",
+    "gout", "osteoporosis", "anemia", "iron deficiency anemia", "urinary tract infection",
+    "cellulitis", "sepsis", "bronchitis", "influenza", "covid-19",
+    "gastroesophageal reflux disease", "peptic ulcer disease", "crohn's disease", "ulcerative colitis", "cirrhosis",
+    "pancreatitis", "cholecystitis", "appendicitis", "deep vein thrombosis", "pulmonary embolism",
+    "stroke", "transient ischemic attack", "myocardial infarction", "angina", "peripheral artery disease",
+    "type 1 diabetes", "diabetic neuropathy", "obesity", "sleep apnea", "psoriasis",
+    "eczema", "allergic rhinitis", "sinusitis", "otitis media", "meningitis",
+    "parkinson's disease", "alzheimer's disease", "multiple sclerosis", "benign prostatic hyperplasia", "kidney stones",
+]
+EXTENDED_MEDICATIONS = MEDICATIONS + [
+    "Amlodipine", "Losartan", "Hydrochlorothiazide", "Metoprolol", "Atorvastatin",
+    "Simvastatin", "Rosuvastatin", "Levothyroxine", "Omeprazole", "Pantoprazole",
+    "Gabapentin", "Sertraline", "Escitalopram", "Fluoxetine", "Bupropion",
+    "Trazodone", "Prednisone", "Amoxicillin", "Ciprofloxacin", "Doxycycline",
+    "Cephalexin", "Insulin glargine", "Insulin lispro", "Glipizide", "Sitagliptin",
+    "Empagliflozin", "Furosemide", "Spironolactone", "Carvedilol", "Clopidogrel",
+    "Apixaban", "Rivaroxaban", "Heparin", "Aspirin", "Ibuprofen",
+    "Acetaminophen", "Tramadol", "Oxycodone", "Montelukast", "Fluticasone",
+    "Tiotropium", "Allopurinol", "Methotrexate", "Alendronate", "Tamsulosin",
+    "Ondansetron", "Famotidine", "Lorazepam", "Quetiapine", "Lamotrigine",
+    "Levetiracetam", "Donepezil", "Vancomycin", "Ceftriaxone", "Piperacillin-tazobactam",
+]
+DOSE_AMOUNTS = ["0.5", "1", "2", "2.5", "5", "10", "12.5", "20", "25", "40", "50", "75", "81", "100", "200", "250", "325", "400", "500", "600", "800", "1000"]
+DOSE_UNITS = ["mg", "mg", "mg", "mcg", "g", "units", "mL"]
+FREQUENCIES = ["daily", "twice daily", "three times daily", "every 6 hours", "every 8 hours", "at bedtime", "as needed", "weekly"]
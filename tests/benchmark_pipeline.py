@@ -0,0 +1,343 @@
+"""
+End-to-end pipeline benchmark.
+
+Drives the producer's note generator, PHIRemover, NERModel and the
+group-committed result writer through the real `consume_batches` loop, with
+an in-process stand-in for RabbitMQ, and writes a JSON report:
+
+    python tests/benchmark_pipeline.py --notes 2000 --batch-size 16 --output bench.json
+    python tests/benchmark_pipeline.py --model tiny            # no model download at all
+    python tests/benchmark_pipeline.py --baseline bench.json   # compare with an earlier run
+
+Runs on CPU with the Hugging Face hub in offline mode, so `--model` must be a
+local path or already in the cache; `--model tiny` builds a small randomly
+initialized BERT from the corpus vocabulary (the pipeline is exercised end to
+end, but the model numbers are not those of the real one).
+"""
+import os
+import sys
+
+# Offline and on CPU. Set before transformers/torch are imported (they read these at import
+# time), and only when run as a script: the tests import this module and must not inherit them.
+OFFLINE_ENV = {"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1", "CUDA_VISIBLE_DEVICES": ""}
+if __name__ == "__main__":
+    for name, value in OFFLINE_ENV.items():
+        os.environ.setdefault(name, value)
+
+import io
+import json
+import time
+import queue
+import random
+import argparse
+import contextlib
+import resource
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+
+import numpy as np
+from faker import Faker
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.streaming.rabbitmq_producer import generate_synthetic_note
+from src.deidentification.phi_removal import PHIRemover
+from src.ner.clinicalbert import NERModel
+from src.ner.inference import consume_batches
+from src.ner.metrics import Metrics, summarize
+from src.ner.runtime import PROFILES, build_profile
+from src.storage.segment_store import SegmentWriter
+from src.storage.result_writer import BufferedResultWriter
+
+STAGES = ("produce", "queue_wait", "deidentify", "ner", "write", "end_to_end")
+
+class StageTimer:
+    """
+    Collects per-call durations (and how many notes each call covered) per stage.
+    """
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def record(self, stage, seconds, notes=1):
+        self.samples[stage].append((seconds, notes))
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            durations = np.array([seconds for seconds, _ in samples]) * 1000
+            notes = sum(n for _, n in samples)
+            summary[stage] = {
+                "calls": len(samples),
+                "notes": notes,
+                "p50_ms": round(float(np.percentile(durations, 50)), 3),
+                "p95_ms": round(float(np.percentile(durations, 95)), 3),
+                "p99_ms": round(float(np.percentile(durations, 99)), 3),
+                "ms_per_note": round(float(durations.sum()) / notes, 4),
+            }
+        return summary
+
+class LocalChannel:
+    """
+    In-process stand-in for a pika BlockingChannel on one queue: `basic_publish`,
+    `consume(inactivity_timeout=...)`, `basic_qos` and `basic_ack(multiple=...)`.
+    `consume` ends once `close` was called and every delivered message is acked.
+    """
+    def __init__(self, timer):
+        self.timer = timer
+        self.messages = queue.Queue()
+        self.closed = threading.Event()
+        self.next_tag = 1
+        # delivery tag -> publish time (perf_counter), for delivered, unacked messages
+        self.unacked = {}
+        self.acked = 0
+        self.prefetch_count = None
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.messages.put((time.perf_counter(), body))
+
+    def basic_qos(self, prefetch_count=0):
+        self.prefetch_count = prefetch_count
+
+    def close(self):
+        self.closed.set()
+
+    def consume(self, queue_name, inactivity_timeout=None):
+        while True:
+            if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+                # Like the broker: nothing more is delivered until something is acked
+                time.sleep(inactivity_timeout or 0.01)
+                yield None, None, None
+                continue
+            waited = time.perf_counter()
+            try:
+                published, body = self.messages.get(timeout=inactivity_timeout)
+            except queue.Empty:
+                if self.closed.is_set() and not self.unacked:
+                    return
+                yield None, None, None
+                continue
+            now = time.perf_counter()
+            # Time the message sat in the queue (or the consumer waited for it, whichever is shorter)
+            self.timer.record("queue_wait", now - max(published, waited))
+            tag = self.next_tag
+            self.next_tag += 1
+            self.unacked[tag] = published
+            yield SimpleNamespace(delivery_tag=tag), None, body
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        now = time.perf_counter()
+        tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        for tag in tags:
+            self.timer.record("end_to_end", now - self.unacked.pop(tag))
+        self.acked += len(tags)
+
+class TimedPHIRemover:
+    def __init__(self, remover, timer):
+        self.remover = remover
+        self.timer = timer
+
+    def deidentify_batch_with_map(self, texts):
+        started = time.perf_counter()
+        result = self.remover.deidentify_batch_with_map(texts)
+        self.timer.record("deidentify", time.perf_counter() - started, len(texts))
+        return result
+
+class TimedModel:
+    def __init__(self, model, timer):
+        self.model = model
+        self.timer = timer
+        self.gazetteer = model.gazetteer
+        self.cache = model.cache
+        self.fast_path_stats = model.fast_path_stats
+
+    def extract_entities_batch(self, texts, batch_size=16):
+        started = time.perf_counter()
+        result = self.model.extract_entities_batch(texts, batch_size)
+        self.timer.record("ner", time.perf_counter() - started, len(texts))
+        return result
+
+class TimedStore:
+    def __init__(self, store, timer):
+        self.store = store
+        self.timer = timer
+
+    def append(self, results):
+        started = time.perf_counter()
+        self.store.append(results)
+        self.timer.record("write", time.perf_counter() - started, len(results))
+
+    def close(self):
+        self.store.close()
+
+def build_tiny_model(path, seed=0):
+    """
+    Saves a small randomly initialized BERT token classifier, with a WordPiece
+    vocabulary built from producer notes, so the benchmark never needs a download.
+    """
+    import torch
+    from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+    random.seed(seed)
+    Faker.seed(seed)
+    words = set()
+    for _ in range(2000):
+        words.update(generate_synthetic_note().lower().replace(".", " . ").replace(":", " : ").replace("/", " / ").split())
+    characters = sorted({c for word in words for c in word} | set("0123456789abcdefghijklmnopqrstuvwxyz.,:;/-"))
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + characters + [f"##{c}" for c in characters] + sorted(words)
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "vocab.txt"), "w") as f:
+        f.write("\n".join(dict.fromkeys(vocab)) + "\n")
+    tokenizer = BertTokenizerFast(os.path.join(path, "vocab.txt"), do_lower_case=True, model_max_length=512)
+
+    labels = ["O", "B-Sign_symptom", "I-Sign_symptom", "B-Medication", "I-Medication", "B-Dosage", "I-Dosage"]
+    config = BertConfig(vocab_size=tokenizer.vocab_size, hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=128, max_position_embeddings=512, num_labels=len(labels),
+                        id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)})
+    torch.manual_seed(seed)
+    BertForTokenClassification(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def produce(channel, timer, notes, rate, seed):
+    """
+    Publishes `notes` producer messages, at `rate` msgs/s or as fast as possible.
+    """
+    random.seed(seed)
+    Faker.seed(seed)
+    started = time.perf_counter()
+    for i in range(notes):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        note = generate_synthetic_note()
+        channel.basic_publish(exchange='', routing_key='', body=json.dumps({'note': note, 'timestamp': time.time()}))
+        timer.record("produce", time.perf_counter() - t0)
+    channel.close()
+
+def run_benchmark(args):
+    timer = StageTimer()
+
+    model_path = args.model
+    if model_path == "tiny":
+        model_path = build_tiny_model(os.path.join(tempfile.mkdtemp(), "tiny-ner"))
+
+    started = time.perf_counter()
+    model = NERModel(model_path, chunk_tokens=args.chunk_tokens, backend=args.backend)
+    model_load_s = time.perf_counter() - started
+
+    runtime = build_profile(args.runtime_profile, compile=args.compile).apply(model)
+
+    phi_remover = PHIRemover()
+    # Warm-up outside the measurement (first calls pay for lazy initialization)
+    random.seed(args.seed + 1)
+    warmup = [phi_remover.deidentify(generate_synthetic_note()) for _ in range(args.warmup)]
+    if warmup:
+        model.extract_entities_batch(warmup, args.batch_size)
+    # Break "ner" down into tokenization, forward and post-processing
+    metrics = Metrics()
+    model.instrument(metrics)
+
+    store_dir = tempfile.mkdtemp()
+    channel = LocalChannel(timer)
+    writer = BufferedResultWriter(TimedStore(SegmentWriter(store_dir, fsync=args.fsync), timer),
+                                  max_rows=args.flush_rows, max_delay=args.flush_interval)
+
+    producer = threading.Thread(target=produce, args=(channel, timer, args.notes, args.rate, args.seed), daemon=True)
+    started = time.perf_counter()
+    producer.start()
+    # The worker's per-batch log lines would drown the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        consume_batches(channel, TimedModel(model, timer), TimedPHIRemover(phi_remover, timer), writer, args.batch_size, args.max_wait)
+    writer.close()
+    elapsed = time.perf_counter() - started
+    producer.join()
+
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "model": args.model, "backend": args.backend, "notes": args.notes, "batch_size": args.batch_size,
+            "max_wait": args.max_wait, "rate": args.rate, "chunk_tokens": args.chunk_tokens,
+            "runtime_profile": args.runtime_profile, "compile": args.compile, "flush_rows": args.flush_rows, "flush_interval": args.flush_interval, "fsync": args.fsync, "seed": args.seed,
+        },
+        "model_load_s": round(model_load_s, 3),
+        "runtime": runtime,
+        "notes_processed": channel.acked,
+        "elapsed_s": round(elapsed, 3),
+        "notes_per_s": round(channel.acked / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+        "model_stages": {stage: summarize(metrics.stages[stage]) for stage in ("tokenize", "forward", "postprocess", "merge")},
+    }
+
+def compare(report, baseline):
+    """
+    Prints throughput and per-stage p95 changes against an earlier report.
+    """
+    print(f"vs baseline {baseline.get('commit')}:")
+    ratio = report["notes_per_s"] / baseline["notes_per_s"] if baseline.get("notes_per_s") else float('nan')
+    print(f"  notes/s {baseline.get('notes_per_s')} -> {report['notes_per_s']} ({ratio:.2f}x)")
+    for stage, stats in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before:
+            print(f"  {stage:>10} p95 {before['p95_ms']:.3f} -> {stats['p95_ms']:.3f} ms")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix end-to-end pipeline benchmark (offline, CPU)")
+    parser.add_argument('--notes', type=int, default=1000, help="Notes to push through the pipeline.")
+    parser.add_argument('--model', default="d4data/biomedical-ner-all",
+                        help="Local model path or cached hub name; 'tiny' builds a throwaway model.")
+    parser.add_argument('--backend', default='torch', help="NERModel backend.")
+    parser.add_argument('--batch-size', type=int, default=16, help="Consumer batch size.")
+    parser.add_argument('--max-wait', type=float, default=0.05, help="Max seconds to fill a batch.")
+    parser.add_argument('--rate', type=float, default=None, help="Producer rate in msgs/s (default: unthrottled).")
+    parser.add_argument('--chunk-tokens', type=int, default=None, help="Chunk long notes into windows of this many tokens.")
+    parser.add_argument('--flush-rows', type=int, default=256, help="Group-commit size.")
+    parser.add_argument('--flush-interval', type=float, default=0.5, help="Group-commit interval in seconds.")
+    parser.add_argument('--no-fsync', dest='fsync', action='store_false', help="Skip fsync on group commit.")
+    parser.add_argument('--runtime-profile', choices=tuple(PROFILES), default='latency', help="NERModel runtime profile.")
+    parser.add_argument('--compile', choices=('inductor', 'torchscript'), default=None, help="Compile the transformer.")
+    parser.add_argument('--warmup', type=int, default=32, help="Notes run through the model before measuring.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the synthetic notes.")
+    parser.add_argument('--output', default=None, help="Write the JSON report here (default: stdout).")
+    parser.add_argument('--baseline', default=None, help="Earlier JSON report to compare against.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}: {report['notes_per_s']} notes/s, peak RSS {report['peak_rss_mb']} MB")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Post-processing benchmark.
+
+Times `NERModel._postprocess` (label mapping, generic-word filter, subword
+merge) on recorded raw pipeline outputs, against the previous
+implementation kept below as `legacy_postprocess`:
+
+    python tests/benchmark_postprocess.py --model tiny --record outputs.json   # record once
+    python tests/benchmark_postprocess.py --input outputs.json --batch-sizes 64 256 1024
+
+Recording runs the model on de-identified notes from the bulk corpus
+generator; replaying needs no model at all.
+"""
+import os
+import sys
+
+# Offline and on CPU. Set before transformers/torch are imported (they read these at import
+# time), and only when run as a script: the tests import this module and must not inherit them.
+OFFLINE_ENV = {"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1", "CUDA_VISIBLE_DEVICES": ""}
+if __name__ == "__main__":
+    for name, value in OFFLINE_ENV.items():
+        os.environ.setdefault(name, value)
+
+import json
+import time
+import argparse
+import tempfile
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.ner.clinicalbert import NERModel
+
+def legacy_postprocess(results):
+    """
+    Post-processing as it was before the table-driven rewrite: per-entity list
+    membership tests, a rebuilt stopword list and pairwise score averaging.
+    """
+    merged_entities = []
+    current_entity = None
+    for entity in results:
+        word = entity['word']
+        label = entity['entity_group']
+        score = float(entity['score'])
+        start = entity['start']
+        end = entity['end']
+
+        normalized_label = label
+        if label in ['DIAGNOSTIC_PROCEDURE', 'DISEASE_DISORDER', 'Sign_symptom']:
+            normalized_label = 'Target: Disease'
+        elif label in ['MEDICATION', 'Medication']:
+            normalized_label = 'Target: Medication'
+        elif label in ['DOSAGE', 'Dosage']:
+            normalized_label = 'Target: Dosage'
+        if "Target:" not in normalized_label:
+            continue
+
+        clean_word_check = word.lower().strip(".,;:!?")
+        if clean_word_check in ['symptoms', 'diagnosis', 'history', 'plan', 'medications', 'date', 'id']:
+            continue
+
+        if current_entity and (start == current_entity['end'] or word.startswith("##")):
+            current_entity['entity'] += word.replace("##", "")
+            current_entity['end'] = end
+            current_entity['score'] = (current_entity['score'] + score) / 2
+        else:
+            if word.startswith("##"):
+                continue
+            if current_entity:
+                merged_entities.append(current_entity)
+            current_entity = {"entity": word, "label": normalized_label, "score": score, "start": start, "end": end}
+    if current_entity:
+        merged_entities.append(current_entity)
+    return merged_entities
+
+def record(model_path, notes, path, seed=7, batch_size=32):
+    """
+    Runs the raw pipeline over `notes` de-identified corpus notes and saves its outputs as JSON.
+    """
+    from src.streaming.corpus_generator import CorpusGenerator
+    from src.deidentification.phi_removal import PHIRemover
+    if model_path == "tiny":
+        from tests.benchmark_pipeline import build_tiny_model
+        model_path = build_tiny_model(os.path.join(tempfile.mkdtemp(), "tiny-ner"))
+
+    model = NERModel(model_path)
+    texts = PHIRemover().deidentify_batch_with_map(CorpusGenerator(seed=seed, max_sentences=20).generate(notes))[0]
+    outputs = []
+    for i in range(0, len(texts), batch_size):
+        for results in model.pipeline(texts[i:i + batch_size], batch_size=batch_size):
+            outputs.append([dict(entity, score=float(entity['score'])) for entity in results])
+    with open(path, 'w') as f:
+        json.dump(outputs, f)
+    return outputs
+
+def time_postprocess(postprocess, outputs, batch_size, repeat):
+    """
+    Best-of-`repeat` microseconds per note when post-processing batches of `batch_size` notes.
+    """
+    batches = [outputs[i:i + batch_size] for i in range(0, len(outputs), batch_size)]
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for batch in batches:
+            for results in batch:
+                postprocess(results)
+        best = min(best, time.perf_counter() - started)
+    return best / len(outputs) * 1e6
+
+def compare_outputs(outputs):
+    """
+    Returns (notes whose entity spans or labels differ, notes whose scores differ).
+    Only merged entities should change their score.
+    """
+    model = NERModel.__new__(NERModel)
+    spans, scores = 0, 0
+    for results in outputs:
+        old, new = legacy_postprocess(results), model._postprocess(results)
+        if [(e['entity'], e['label'], e['start'], e['end']) for e in old] != [(e['entity'], e['label'], e['start'], e['end']) for e in new]:
+            spans += 1
+        elif any(abs(a['score'] - b['score']) > 1e-9 for a, b in zip(old, new)):
+            scores += 1
+    return spans, scores
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Helix NER post-processing benchmark")
+    parser.add_argument('--input', default=None, help="Recorded pipeline outputs (JSON) to replay.")
+    parser.add_argument('--record', default=None, help="Record pipeline outputs to this file first.")
+    parser.add_argument('--model', default="tiny", help="Model used for recording; 'tiny' builds a throwaway model.")
+    parser.add_argument('--notes', type=int, default=2000, help="Notes to record.")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 256, 1024], help="Batch sizes to time.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing repeats (best is reported).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.input and not args.record:
+        with open(args.input, 'r') as f:
+            outputs = json.load(f)
+    else:
+        path = args.record or os.path.join(tempfile.mkdtemp(), "pipeline_outputs.json")
+        outputs = record(args.model, args.notes, path)
+        print(f"Recorded {len(outputs)} pipeline outputs to {path}")
+
+    groups = sum(len(results) for results in outputs)
+    print(f"{len(outputs)} notes, {groups} entity groups ({groups / len(outputs):.1f} per note)")
+    model = NERModel.__new__(NERModel)
+    for batch_size in args.batch_sizes:
+        legacy = time_postprocess(legacy_postprocess, outputs, batch_size, args.repeat)
+        current = time_postprocess(model._postprocess, outputs, batch_size, args.repeat)
+        print(f"  batch {batch_size:>5}: legacy {legacy:7.2f} us/note, table-driven {current:7.2f} us/note ({legacy / current:.2f}x)")
+    spans, scores = compare_outputs(outputs)
+    print(f"Differences vs legacy: {spans} notes with different entities, {scores} with re-weighted merged scores")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import time
+from types import SimpleNamespace
+
+import pika
+
+class FakeRemover:
+    """
+    Masks "Smith" as [NAME], nothing else.
+    """
+    def deidentify_batch_with_map(self, texts):
+        return [text.replace("Smith", "[NAME]") for text in texts], [None] * len(texts)
+
+class FakeModel:
+    """
+    Tags each note's first word as a disease (score 0.5) and records every
+    batch's size, and the `batch_size` it was called with.
+
+    Each batch takes `delay` seconds. A batch fails if it holds a note saying
+    "poison", or if it is the `fail_on`-th batch.
+    """
+    gazetteer = None
+    cache = None
+
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.batches = []
+        self.batch_sizes = []
+
+    def model_version(self):
+        return "fake"
+
+    def extract_entities_batch(self, texts, batch_size=16):
+        self.batches.append(len(texts))
+        self.batch_sizes.append(batch_size)
+        time.sleep(self.delay)
+        if len(self.batches) == self.fail_on or any("poison" in text for text in texts):
+            raise RuntimeError("model crashed")
+        return [[{"entity": text.split()[0], "label": "Target: Disease", "score": 0.5, "start": 0, "end": len(text.split()[0])}]
+                for text in texts]
+
+class FakeChannel:
+    """
+    Delivers messages to `consume_batches` up to the prefetch limit, records
+    publishes and acks, and stops once everything was delivered and acked.
+    A delivery is a body, or a (body, headers) pair. With `nack_publishes`,
+    the broker refuses every publish, as a confirm-mode channel reports it.
+    """
+    def __init__(self, deliveries, nack_publishes=False):
+        self.nack_publishes = nack_publishes
+        self.deliveries = [delivery if isinstance(delivery, tuple) else (delivery, None) for delivery in deliveries]
+        self.unacked = []
+        self.acked = []
+        self.published = []
+        self.prefetch_count = None
+        self.inactivity_timeout = None
+        self.idle_polls = 0
+
+    def basic_qos(self, prefetch_count=0):
+        self.prefetch_count = prefetch_count
+
+    def queue_declare(self, queue, passive=False):
+        return SimpleNamespace(method=SimpleNamespace(message_count=len(self.deliveries)))
+
+    def consume(self, queue, inactivity_timeout=None):
+        self.inactivity_timeout = inactivity_timeout
+        tag = 0
+        while self.deliveries or self.unacked:
+            if self.deliveries and len(self.unacked) < self.prefetch_count:
+                body, headers = self.deliveries.pop(0)
+                tag += 1
+                self.unacked.append(tag)
+                yield SimpleNamespace(delivery_tag=tag), SimpleNamespace(headers=headers, delivery_mode=None), body
+            else:
+                self.idle_polls += 1
+                yield None, None, None
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        acked = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        self.unacked = [tag for tag in self.unacked if tag not in acked]
+        self.acked.extend(acked)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.nack_publishes:
+            raise pika.exceptions.NackError([])
+        self.published.append((routing_key, body, properties.headers))
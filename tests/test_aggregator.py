@@ -0,0 +1,196 @@
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.analytics.aggregator import AggregationService
+from src.analytics.timeline import Timeline
+from src.analytics.search_index import SearchIndex
+from src.analytics.notifier import StoreWatcher
+from src.storage.segment_store import SegmentWriter
+
+BASE = 1766612005.0
+
+def make_result(timestamp, disease, medication):
+    return {"timestamp": timestamp, "original_text_masked": f"{disease} on {medication}", "entities": [
+        {"entity": disease, "label": "Target: Disease", "score": 0.9, "start": 0, "end": len(disease)},
+        {"entity": medication, "label": "Target: Medication", "score": 0.9, "start": len(disease) + 4, "end": len(disease) + 4 + len(medication)},
+    ]}
+
+class TestAggregationService(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = os.path.join(self.root, 'store')
+        self.checkpoint = os.path.join(self.root, 'aggregates.json')
+        self.writer = SegmentWriter(self.store, fsync=False)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.root)
+
+    def test_incremental_counts_and_shared_snapshot(self):
+        service = AggregationService(self.store, self.checkpoint)
+        self.writer.append([make_result(BASE, 'asthma', 'albuterol'), make_result(BASE + 25, 'asthma', 'warfarin')])
+        self.assertEqual(service.refresh(), 2)
+
+        snapshot = service.snapshot()
+        self.assertEqual(snapshot['total_processed'], 2)
+        self.assertEqual(snapshot['entities_found'], 4)
+        self.assertEqual(snapshot['diseases'].values.tolist(), [['asthma', 2]])
+        self.assertEqual(sorted(snapshot['pairs'].values.tolist()), [['asthma', 'albuterol', 1], ['asthma', 'warfarin', 1]])
+        # Empty 10s bins between notes are filled with zeros
+        self.assertEqual(snapshot['velocity'][10]['Count'].tolist(), [1, 0, 0, 1])
+        self.assertEqual(snapshot['messages'][0]['timestamp'], BASE + 25)
+
+        # Unchanged aggregates hand every session the same snapshot
+        self.assertEqual(service.refresh(), 0)
+        self.assertIs(service.snapshot(), snapshot)
+
+        self.writer.append([make_result(BASE + 30, 'pneumonia', 'azithromycin')])
+        service.refresh()
+        self.assertEqual(service.snapshot()['total_processed'], 3)
+
+    def test_checkpoint_resumes_without_replay(self):
+        service = AggregationService(self.store, self.checkpoint)
+        self.writer.append([make_result(BASE, 'asthma', 'albuterol')])
+        service.refresh()
+        service.checkpoint()
+
+        self.writer.append([make_result(BASE + 1, 'asthma', 'albuterol')])
+        restarted = AggregationService(self.store, self.checkpoint)
+        # Only the row written after the checkpoint is read
+        self.assertEqual(restarted.refresh(), 1)
+        self.assertEqual(restarted.snapshot()['total_processed'], 2)
+        self.assertEqual(restarted.aggregator.pairs[('asthma', 'albuterol')], 2)
+
+    def test_index_resumes_from_its_checkpoint(self):
+        service = AggregationService(self.store, self.checkpoint)
+        self.writer.append([make_result(BASE, 'asthma', 'albuterol')])
+        service.refresh()
+        service.checkpoint(save_index=True)
+        self.writer.append([make_result(BASE + 1, 'pneumonia', 'albuterol')])
+        service.refresh()
+        # The aggregates move on, the index checkpoint stays one row behind
+        service.checkpoint(save_index=False)
+        self.assertEqual(len(service.index), 2)
+
+        self.writer.append([make_result(BASE + 2, 'asthma', 'warfarin')])
+        restarted = AggregationService(self.store, self.checkpoint)
+        # Only the row between the two checkpoints is replayed into the index
+        self.assertEqual(len(restarted.index), 2)
+        self.assertEqual(restarted.search('albuterol')[0], 2)
+        self.assertEqual(restarted.refresh(), 1)
+        self.assertEqual(len(restarted.index), 3)
+        self.assertEqual(restarted.search('asthma')[0], 2)
+
+        # A damaged index file costs a replay up to the aggregates' cursor, not the aggregates
+        with open(os.path.join(self.root, 'aggregates_index.pkl'), 'wb') as f:
+            f.write(b'not a pickle')
+        restarted = AggregationService(self.store, self.checkpoint)
+        self.assertEqual((len(restarted.index), restarted.snapshot()['total_processed']), (2, 2))
+
+    def test_purge_is_per_viewer(self):
+        service = AggregationService(self.store, self.checkpoint)
+        self.writer.append([make_result(BASE, 'asthma', 'albuterol'), make_result(BASE + 1, 'asthma', 'warfarin')])
+        service.refresh()
+        baseline = service.baseline()
+        purged = service.snapshot(since=baseline)
+        self.assertEqual((purged['total_processed'], purged['messages']), (0, []))
+        self.assertTrue(purged['diseases'].empty and purged['velocity'][10].empty)
+
+        self.writer.append([make_result(BASE + 2, 'asthma', 'albuterol'), make_result(BASE + 30, 'pneumonia', 'albuterol')])
+        service.refresh()
+        purged = service.snapshot(since=baseline)
+        self.assertEqual(purged['total_processed'], 2)
+        self.assertEqual([message['timestamp'] for message in purged['messages']], [BASE + 30, BASE + 2])
+        self.assertEqual(sorted(purged['diseases'].values.tolist()), [['asthma', 1], ['pneumonia', 1]])
+        self.assertEqual(purged['velocity'][10]['Count'].tolist(), [1, 0, 0, 1])
+
+        # Other viewers and the checkpoint still see everything
+        self.assertEqual(service.snapshot()['total_processed'], 4)
+        self.assertEqual(service.snapshot()['diseases'].values.tolist(), [['asthma', 3], ['pneumonia', 1]])
+
+    def test_watcher_refreshes_on_new_results(self):
+        service = AggregationService(self.store, self.checkpoint)
+        changed = threading.Event()
+
+        def on_change():
+            if service.refresh():
+                changed.set()
+
+        watcher = StoreWatcher(self.store, on_change, debounce=0.05, poll_interval=0.05).start()
+        try:
+            self.writer.append([make_result(BASE, 'asthma', 'albuterol')])
+            self.assertTrue(changed.wait(5))
+            changed.clear()
+            # A new hour partition is picked up too
+            self.writer.append([make_result(BASE + 7200, 'asthma', 'albuterol')])
+            self.assertTrue(changed.wait(5))
+        finally:
+            watcher.stop()
+        self.assertEqual(service.snapshot()['total_processed'], 2)
+
+class TestTimeline(unittest.TestCase):
+    def test_bins_at_every_resolution(self):
+        timeline = Timeline([(10, 6), (60, 4)])
+        for offset in (0, 1, 25, 65):
+            timeline.add(1000 + offset)
+
+        starts, counts = timeline.series(10)
+        # Six bins cover 1010-1069: the first two notes have aged out, leading empty bins are trimmed
+        self.assertEqual(starts.tolist(), [1020, 1030, 1040, 1050, 1060])
+        self.assertEqual(counts.tolist(), [1, 0, 0, 0, 1])
+        starts, counts = timeline.series(60)
+        self.assertEqual((starts.tolist(), counts.tolist()), ([960, 1020], [2, 2]))
+
+    def test_ring_wraps_in_fixed_memory(self):
+        timeline = Timeline([(10, 6)])
+        for t in range(0, 100000, 5):
+            timeline.add(t)
+        # A stale note older than the window is dropped
+        timeline.add(0)
+
+        starts, counts = timeline.series(10)
+        self.assertEqual(len(counts), 6)
+        self.assertEqual(counts.tolist(), [2] * 6)
+        self.assertEqual(timeline.rings[10].counts.size, 6)
+
+        restored = Timeline.from_state(timeline.to_state())
+        self.assertEqual(restored.series(10)[1].tolist(), counts.tolist())
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add([
+            make_result(BASE, 'asthma', 'albuterol'),
+            {"timestamp": BASE + 1, "original_text_masked": "History of asthma, no medications.", "entities": []},
+            make_result(BASE + 2, 'atrial fibrillation', 'warfarin'),
+            make_result(BASE + 3, 'asthma', 'azithromycin'),
+        ])
+
+    def test_token_and_prefix_lookup(self):
+        total, doc_ids = self.index.search("asthma")
+        self.assertEqual(total, 3)
+        # Entity matches rank first, newest first among equals
+        self.assertEqual(doc_ids, [3, 0, 1])
+
+        # The last word matches as a prefix while typing, but not once it is complete
+        self.assertEqual(sorted(self.index.search("a")[1]), [0, 1, 2, 3])
+        self.assertEqual(self.index.search("az")[1], [3])
+        self.assertEqual(self.index.search("az ")[0], 0)
+        self.assertEqual(self.index.search("ASTHMA alb")[1], [0])
+        self.assertEqual(self.index.search("sepsis"), (0, []))
+
+    def test_pagination_and_rows(self):
+        self.assertEqual(self.index.search("", page=0, page_size=3), (4, [3, 2, 1]))
+        self.assertEqual(self.index.search("", page=1, page_size=3), (4, [0]))
+        self.assertEqual(self.index.search("asthma", page=1, page_size=2), (3, [1]))
+        self.assertEqual(self.index.rows([1]), [(BASE + 1, "History of asthma, no medications.", "")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.benchmark_pipeline import build_tiny_model
+from src.ner.clinicalbert import NERModel
+from src.ner.artifact import compile_artifact, read_manifest, load_artifact, MANIFEST_NAME, LABELS_NAME
+
+class TestArtifact(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.model_path = build_tiny_model(os.path.join(cls.root, "tiny-ner"))
+        cls.artifact_path = os.path.join(cls.root, "artifact")
+        cls.manifest = compile_artifact(cls.model_path, cls.artifact_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_artifact_matches_source_model(self):
+        self.assertEqual(read_manifest(self.artifact_path), self.manifest)
+        self.assertIsNone(read_manifest(self.model_path))
+        with open(os.path.join(self.artifact_path, LABELS_NAME)) as f:
+            labels = json.load(f)
+        self.assertEqual(labels["entity_groups"], ["Dosage", "Medication", "O", "Sign_symptom"])
+
+        source, artifact = NERModel(self.model_path), NERModel(self.artifact_path)
+        texts = ["Patient presents with hypertension.", "Prescribed Lisinopril 10 mg daily. Plan: Start Metformin 500 mg."]
+        self.assertEqual(list(artifact.pipeline(texts)), list(source.pipeline(texts)))
+
+    def test_weights_are_memory_mapped(self):
+        model, tokenizer = load_artifact(self.artifact_path)
+        self.assertTrue(tokenizer.is_fast)
+        self.assertFalse(any(param.is_meta for param in model.parameters()))
+        # The weights live in the file's mapping, not in memory the loader allocated
+        mapped = [line.split()[0] for line in open('/proc/self/maps') if line.rstrip().endswith("model.safetensors")]
+        ranges = [tuple(int(address, 16) for address in span.split('-')) for span in mapped]
+        weight = model.classifier.weight.data_ptr()
+        self.assertTrue(any(start <= weight < end for start, end in ranges))
+
+    def test_version_follows_weights_not_path(self):
+        moved = os.path.join(self.root, "moved")
+        shutil.copytree(self.artifact_path, moved)
+        self.assertEqual(NERModel(moved).model_version(), NERModel(self.artifact_path).model_version())
+
+        # Recompiling replaces the artifact in place
+        manifest = compile_artifact(self.model_path, moved)
+        self.assertEqual(manifest["weights_sha256"], self.manifest["weights_sha256"])
+        self.assertTrue(os.path.exists(os.path.join(moved, MANIFEST_NAME)))
+        self.assertFalse(os.path.exists(moved + ".old") or os.path.exists(moved + ".tmp"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.benchmark_pipeline import build_tiny_model
+from src.ner.clinicalbert import NERModel, build_pipeline, check_parity
+
+try:
+    import optimum.onnxruntime
+    HAS_OPTIMUM = True
+except ImportError:
+    HAS_OPTIMUM = False
+
+# Word -> entity group the tiny model is fitted to tag
+LEXICON = {"hypertension": "Sign_symptom", "fever": "Sign_symptom", "asthma": "Sign_symptom", "cough": "Sign_symptom",
+           "lisinopril": "Medication", "metformin": "Medication", "aspirin": "Medication",
+           "10": "Dosage", "500": "Dosage", "81": "Dosage", "mg": "Dosage"}
+
+NOTES = [
+    "Patient presents with hypertension and fever. Prescribed Lisinopril 10 mg daily.",
+    "History of asthma. Plan: Start Metformin 500 mg.",
+    "Cough and chest pain for 3 days; taking Aspirin 81 mg.",
+]
+
+def fit_tiny_model(path, texts, steps=150):
+    """
+    Fits the random tiny model to tag `texts` by LEXICON. Random weights leave
+    labels nearly tied, so int8 rounding flips them; a fitted model has the
+    clear margins a real fine-tuned one has.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    model = AutoModelForTokenClassification.from_pretrained(path)
+    encoded = tokenizer(texts, padding=True, return_tensors="pt", return_offsets_mapping=True)
+    offsets = encoded.pop("offset_mapping")
+    labels = torch.full(encoded["input_ids"].shape, -100)
+    for i, text in enumerate(texts):
+        previous = None
+        for j, word_id in enumerate(encoded.word_ids(i)):
+            if word_id is None:
+                continue
+            start, end = offsets[i][j].tolist()
+            word = text[start:end].lower()
+            group = LEXICON.get(word)
+            labels[i, j] = model.config.label2id[f"B-{group}"] if group and word_id != previous else 0
+            previous = word_id
+
+    torch.manual_seed(0)
+    optimizer = torch.optim.Adam(model.parameters(), lr=3e-3)
+    model.train()
+    for _ in range(steps):
+        optimizer.zero_grad()
+        model(**encoded, labels=labels).loss.backward()
+        optimizer.step()
+    model.eval().save_pretrained(path)
+    return path
+
+class TestBackendParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.model_path = fit_tiny_model(build_tiny_model(os.path.join(cls.root, "tiny-ner")), NOTES)
+        cls.reference = NERModel(cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_quantized_matches_torch(self):
+        candidate = NERModel(self.model_path, backend="quantized")
+        linear = [type(module).__module__ for module in candidate.pipeline.model.modules() if type(module).__name__ == "Linear"]
+        self.assertTrue(linear)
+        self.assertTrue(all("quantized" in module for module in linear))
+        self.assertTrue(any(self.reference.extract_entities_batch(NOTES)))
+        self.assertEqual(check_parity(self.reference, candidate, NOTES), [])
+
+    @unittest.skipUnless(HAS_OPTIMUM, "optimum[onnxruntime] is not installed")
+    def test_onnx_matches_torch(self):
+        export_dir = os.path.join(self.root, "onnx")
+        candidate = NERModel(self.model_path, backend="onnx", export_dir=export_dir)
+        self.assertTrue(os.path.exists(os.path.join(export_dir, "model.onnx")))
+        self.assertEqual(check_parity(self.reference, candidate, NOTES), [])
+        # Later starts reuse the export
+        self.assertEqual(check_parity(self.reference, NERModel(self.model_path, backend="onnx", export_dir=export_dir), NOTES), [])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            build_pipeline(self.model_path, backend="tensorrt")
+
+if __name__ == '__main__':
+    unittest.main()
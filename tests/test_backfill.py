@@ -0,0 +1,87 @@
+import sys
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.fakes import FakeRemover, FakeModel
+from src.ner.backfill import Backfill, parse_timestamp
+from src.storage.segment_store import read_segment, to_results
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.output = os.path.join(self.root, "out")
+        # 25 notes in reverse time order across a JSONL and a CSV file
+        self.jsonl = os.path.join(self.root, "notes.jsonl")
+        with open(self.jsonl, 'w') as f:
+            for i in range(15):
+                f.write(json.dumps({"note": f"note{i} for Smith", "timestamp": 1000 - i}) + "\n")
+        self.csv = os.path.join(self.root, "notes.csv")
+        with open(self.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["note", "timestamp"])
+            for i in range(15, 25):
+                writer.writerow([f"note{i} for Smith", 1000 - i])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_output(self):
+        results = []
+        for name in sorted(os.listdir(self.output)):
+            if name.startswith("shard-"):
+                shard = [result for batch in read_segment(os.path.join(self.output, name)) for result in to_results(batch)]
+                self.assertEqual([r['timestamp'] for r in shard], sorted(r['timestamp'] for r in shard))
+                results.extend(shard)
+        return results
+
+    def test_sorted_shards_and_checkpoint(self):
+        summary = Backfill(FakeModel(), FakeRemover(), self.output, shard_size=10, batch_size=4, fsync=False).run([self.jsonl, self.csv])
+
+        self.assertEqual((summary["shards"], summary["notes"]), (3, 25))
+        results = self.read_output()
+        # Shards follow input order, each sorted by time
+        self.assertEqual([r['entities'][0]['entity'] for r in results[:10]], [f"note{i}" for i in range(9, -1, -1)])
+        self.assertEqual(sorted(r['entities'][0]['entity'] for r in results), sorted(f"note{i}" for i in range(25)))
+        self.assertTrue(all("Smith" not in r['original_text_masked'] for r in results))
+
+        with open(os.path.join(self.output, "checkpoint.json")) as f:
+            checkpoint = json.load(f)
+        self.assertTrue(checkpoint["complete"])
+        self.assertEqual([shard["rows"] for shard in checkpoint["shards"]], [10, 10, 5])
+        self.assertEqual(checkpoint["shards"][0]["min_timestamp"], 991)
+
+    def test_crashed_run_resumes_at_first_unfinished_shard(self):
+        # Batches of 4: the 6th batch (notes 20-23) fails after two shards of 10 are written
+        with self.assertRaises(RuntimeError):
+            Backfill(FakeModel(fail_on=6), FakeRemover(), self.output, shard_size=10, batch_size=4, fsync=False).run([self.jsonl, self.csv])
+        self.assertEqual(len(self.read_output()), 20)
+
+        model = FakeModel()
+        summary = Backfill(model, FakeRemover(), self.output, shard_size=10, batch_size=4, fsync=False).run([self.jsonl, self.csv])
+
+        self.assertEqual(summary["processed_this_run"], 5)
+        self.assertEqual(len(model.batches), 2)
+        self.assertEqual(sorted(r['entities'][0]['entity'] for r in self.read_output()), sorted(f"note{i}" for i in range(25)))
+
+    def test_refuses_to_resume_with_another_model(self):
+        Backfill(FakeModel(), FakeRemover(), self.output, shard_size=10, fsync=False).run([self.jsonl])
+        other = FakeModel()
+        other.model_version = lambda: "other"
+        with self.assertRaises(ValueError):
+            Backfill(other, FakeRemover(), self.output, shard_size=10, fsync=False).run([self.jsonl])
+        self.assertEqual(Backfill(other, FakeRemover(), self.output, shard_size=10, fsync=False).run([self.jsonl], restart=True)["notes"], 15)
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp("1700000000.5"), 1700000000.5)
+        self.assertEqual(parse_timestamp("2024-01-01T00:00:00"), 1704067200.0)
+        self.assertIsNone(parse_timestamp(""))
+
+if __name__ == '__main__':
+    unittest.main()
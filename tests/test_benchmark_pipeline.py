@@ -0,0 +1,28 @@
+import sys
+import os
+import unittest
+from unittest import mock
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.benchmark_pipeline import parse_args, run_benchmark, STAGES, OFFLINE_ENV
+
+class TestBenchmarkHarness(unittest.TestCase):
+    def test_offline_run_reports_every_stage(self):
+        # The environment the script runs under, for this test only
+        with mock.patch.dict(os.environ, OFFLINE_ENV):
+            report = run_benchmark(parse_args(['--model', 'tiny', '--notes', '40', '--batch-size', '8', '--warmup', '4',
+                                               '--flush-rows', '16', '--flush-interval', '0.05', '--no-fsync']))
+
+        # Every note made it through and was acked after its group commit
+        self.assertEqual(report["notes_processed"], 40)
+        self.assertEqual(set(report["stages"]), set(STAGES))
+        self.assertEqual(report["stages"]["ner"]["notes"], 40)
+        for stats in report["stages"].values():
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+        self.assertGreater(report["notes_per_s"], 0)
+        self.assertGreater(report["peak_rss_mb"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import pika
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.fakes import FakeChannel, FakeRemover, FakeModel
+import src.ner.inference as inference
+from src.ner.inference import consume_batches, QUEUE_NAME, DEAD_LETTER_QUEUE, ATTEMPTS_HEADER
+from src.ner.metrics import Metrics
+from src.storage.segment_store import SegmentWriter, SegmentReader
+from src.storage.result_writer import BufferedResultWriter
+
+class FlakyStore(SegmentWriter):
+    """
+    A segment store whose first `failures` appends fail like a full disk.
+    """
+    def __init__(self, root, failures):
+        super().__init__(root, fsync=False)
+        self.failures = failures
+
+    def append(self, results):
+        if self.failures:
+            self.failures -= 1
+            raise OSError(28, "No space left on device")
+        super().append(results)
+
+def note(text, timestamp=1700000000.0):
+    return json.dumps({'note': text, 'timestamp': timestamp})
+
+class TestConsumer(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.retry_delay = inference.WRITER_RETRY_DELAY
+        inference.WRITER_RETRY_DELAY = 0.01
+
+    def tearDown(self):
+        inference.WRITER_RETRY_DELAY = self.retry_delay
+        shutil.rmtree(self.root)
+
+    def test_poison_and_malformed_notes_are_isolated(self):
+        metrics = Metrics()
+        channel = FakeChannel([(note("fever"), None), (note("poison pill"), None), ("{not json", None),
+                               (note("cough"), None), (note("poison pill"), {ATTEMPTS_HEADER: 2})])
+        writer = BufferedResultWriter(SegmentWriter(self.root, fsync=False), max_rows=2, max_delay=60)
+
+        model = FakeModel()
+        consume_batches(channel, model, FakeRemover(), writer, batch_size=5, max_wait=0.01, metrics=metrics, max_attempts=3)
+        writer.close()
+
+        self.assertEqual(channel.prefetch_count, 7)
+        self.assertEqual(sorted(channel.acked), [1, 2, 3, 4, 5])
+        self.assertEqual([r['original_text_masked'] for r in SegmentReader(self.root).read()], ["fever", "cough"])
+        routes = [(queue, headers[ATTEMPTS_HEADER]) for queue, _, headers in channel.published]
+        # The malformed note is dead-lettered on sight, the poison note requeued once and dead-lettered on its third failure
+        self.assertEqual(routes, [(DEAD_LETTER_QUEUE, 1), (QUEUE_NAME, 1), (DEAD_LETTER_QUEUE, 3)])
+        self.assertIn("RuntimeError: model crashed", channel.published[1][2]["x-helix-error"])
+        self.assertEqual((metrics.counters["notes_retried"], metrics.counters["notes_dead_lettered"]), (1, 2))
+        self.assertEqual(metrics.counters["notes_processed"], 2)
+        # The configured batch size reaches the model, retries included
+        self.assertEqual(set(model.batch_sizes), {5})
+
+    def test_original_stays_unacked_if_its_copy_is_refused(self):
+        channel = FakeChannel([note("fever"), note("poison pill"), note("cough")], nack_publishes=True)
+        writer = BufferedResultWriter(SegmentWriter(self.root, fsync=False), max_rows=1, max_delay=60)
+
+        with self.assertRaises(pika.exceptions.NackError):
+            consume_batches(channel, FakeModel(), FakeRemover(), writer, batch_size=1, max_wait=0.01)
+        writer.close()
+
+        # Only the note before the poison one was acked; the rest are redelivered on reconnect
+        self.assertEqual(channel.acked, [1])
+        self.assertEqual(channel.published, [])
+
+    def test_failing_writer_pauses_consumption(self):
+        metrics = Metrics()
+        channel = FakeChannel([(note(f"note {i}"), None) for i in range(12)])
+        writer = BufferedResultWriter(FlakyStore(self.root, failures=3), max_rows=4, max_delay=60)
+
+        consume_batches(channel, FakeModel(), FakeRemover(), writer, batch_size=2, max_wait=0.01, metrics=metrics)
+        writer.close()
+
+        # Nothing is lost or acked early: every note was written once, after the store recovered
+        self.assertEqual(len(channel.acked), 12)
+        self.assertEqual(sorted(r['original_text_masked'] for r in SegmentReader(self.root).read()), sorted(f"note {i}" for i in range(12)))
+        self.assertEqual(metrics.counters["writer_stalls"], 1)
+
+    def test_zero_max_wait_still_blocks_between_polls(self):
+        channel = FakeChannel([note("fever"), note("cough")])
+        writer = BufferedResultWriter(SegmentWriter(self.root, fsync=False), max_rows=1, max_delay=60)
+
+        consume_batches(channel, FakeModel(), FakeRemover(), writer, batch_size=4, max_wait=0)
+        writer.close()
+
+        self.assertEqual(channel.inactivity_timeout, inference.MIN_POLL_INTERVAL)
+        self.assertEqual(channel.acked, [1, 2])
+
+    def test_writer_acks_empty_commits_in_order(self):
+        writer = BufferedResultWriter(SegmentWriter(self.root, fsync=False), max_rows=10, max_delay=60)
+        acked = []
+        writer.add([], on_durable=lambda: acked.append("empty"))
+        self.assertEqual(acked, ["empty"])
+        # Behind buffered results, an empty commit waits for them
+        writer.add([{'timestamp': 1700000000.0, 'original_text_masked': "x", 'entities': []}], on_durable=lambda: acked.append("rows"))
+        writer.add([], on_durable=lambda: acked.append("after"))
+        self.assertEqual(acked, ["empty"])
+        writer.flush()
+        self.assertEqual(acked, ["empty", "rows", "after"])
+
+if __name__ == '__main__':
+    unittest.main()
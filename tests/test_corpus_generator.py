@@ -0,0 +1,45 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.streaming.corpus_generator import CorpusGenerator, write_jsonl
+from src.deidentification.phi_removal import PHIRemover
+
+class TestCorpusGenerator(unittest.TestCase):
+    def test_seed_reproduces_corpus(self):
+        self.assertEqual(CorpusGenerator(seed=7).generate(50), CorpusGenerator(seed=7).generate(50))
+        self.assertNotEqual(CorpusGenerator(seed=7).generate(50), CorpusGenerator(seed=8).generate(50))
+
+    def test_length_distribution_has_long_tail(self):
+        generator = CorpusGenerator(seed=1, long_fraction=0.05)
+        counts = generator.sentence_counts(20000)
+        self.assertLessEqual(np.median(counts), 4)
+        self.assertGreater(np.percentile(counts, 99), 20)
+        self.assertGreaterEqual(counts.min(), 1)
+        self.assertLessEqual(counts.max(), generator.max_sentences)
+
+    def test_notes_carry_phi_and_vocabulary(self):
+        generator = CorpusGenerator(seed=3, conditions=["sepsis"], medications=["Heparin"])
+        remover = PHIRemover()
+        for note in generator.generate(200):
+            self.assertNotEqual(remover.deidentify(note), note)
+            self.assertNotIn("asthma", note)
+
+    def test_write_jsonl(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'corpus.jsonl')
+            self.assertEqual(write_jsonl(CorpusGenerator(seed=1), path, 25, batch_size=10, start_timestamp=100.0, interval=1.0), 25)
+            with open(path) as f:
+                messages = [json.loads(line) for line in f]
+        self.assertEqual([m['timestamp'] for m in messages], [100.0 + i for i in range(25)])
+        self.assertTrue(all(m['note'] for m in messages))
+
+if __name__ == '__main__':
+    unittest.main()
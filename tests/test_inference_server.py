@@ -0,0 +1,92 @@
+import sys
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.fakes import FakeRemover, FakeModel
+from src.api.server import InferenceService, DeadlineExceeded, serve, query
+
+class TestInferenceService(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.root, "ner.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_with_server(self, service, client):
+        """
+        Serves `service` on a temporary socket while `client()` runs.
+        """
+        async def main():
+            ready = asyncio.Event()
+            server = asyncio.create_task(serve(service, self.socket_path, ready=ready))
+            await ready.wait()
+            try:
+                return await client()
+            finally:
+                server.cancel()
+                await asyncio.gather(server, return_exceptions=True)
+        return asyncio.run(main())
+
+    def test_concurrent_requests_share_batches(self):
+        model = FakeModel(delay=0.02)
+        service = InferenceService(model, FakeRemover(), batch_size=8, max_wait=0.01)
+
+        async def client():
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            for i in range(20):
+                writer.write(json.dumps({"id": i, "note": f"fever{i} for Smith", "timestamp": 1700000000.0}).encode() + b"\n")
+            writer.write(b'{"id": 99, "text": "no note"}\n')
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(21)]
+            writer.close()
+            # The blocking client, from a thread
+            single = await asyncio.get_running_loop().run_in_executor(None, query, "cough today", self.socket_path)
+            return responses, single
+
+        responses, single = self.run_with_server(service, client)
+        by_id = {response["id"]: response for response in responses}
+        self.assertEqual(by_id[3], {"id": 3, "timestamp": 1700000000.0, "text": "fever3 for [NAME]",
+                                    "entities": [{"Label": "Target: Disease", "Text": "fever3", "Confidence": "50.00%"}]})
+        self.assertIn("error", by_id[99])
+        self.assertEqual(single["entities"][0]["Text"], "cough")
+        # 21 notes in far fewer, fuller batches than one per request
+        self.assertLessEqual(len(model.batches), 6)
+        self.assertEqual(max(model.batches), 8)
+        self.assertEqual(sum(model.batches), 21)
+        self.assertEqual(set(model.batch_sizes), {8})
+
+    def test_budget_and_poison_notes_fail_alone(self):
+        model = FakeModel(delay=0.2)
+        service = InferenceService(model, FakeRemover(), batch_size=4, max_wait=0.01)
+
+        async def client():
+            await service.start()
+            try:
+                slow = asyncio.create_task(service.infer("fever now", budget_ms=1000))
+                await asyncio.sleep(0.05)
+                # Queued behind a 200 ms batch with a 50 ms budget: answered as expired, never run
+                with self.assertRaises(DeadlineExceeded):
+                    await service.infer("rash now", budget_ms=50)
+                await slow
+                return await asyncio.gather(service.infer("poison pill", budget_ms=2000), service.infer("cough now", budget_ms=2000),
+                                            return_exceptions=True)
+            finally:
+                await service.stop()
+
+        poisoned, healthy = asyncio.run(client())
+        self.assertIsInstance(poisoned, RuntimeError)
+        self.assertEqual(healthy["entities"][0]["Text"], "cough")
+        self.assertEqual(service.stats["expired"], 1)
+        # The expired note never reached the model; the failed batch was retried note by note
+        self.assertEqual(model.batches, [1, 2, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
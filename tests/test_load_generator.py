@@ -0,0 +1,80 @@
+import sys
+import os
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import pika
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.streaming.load_generator import LoadGenerator, RateProfile, parse_args
+
+class FakeConfirmChannel:
+    """
+    Confirms every `batch` publishes with one multiple=True ack, after `delay` seconds.
+    """
+    def __init__(self, generator, batch=4, delay=0.002):
+        self.generator = generator
+        self.batch = batch
+        self.delay = delay
+        self.tag = 0
+        self.bodies = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.tag += 1
+        self.bodies.append(body)
+        if self.tag % self.batch == 0:
+            frame = SimpleNamespace(method=pika.spec.Basic.Ack(delivery_tag=self.tag, multiple=True))
+            asyncio.get_running_loop().call_later(self.delay, self.generator.on_confirm, frame)
+
+class TestLoadGenerator(unittest.TestCase):
+    def test_paces_and_confirms(self):
+        generator = LoadGenerator(RateProfile(400), duration=0.5, window=64, pool_size=20, seed=1)
+        channel = FakeConfirmChannel(generator)
+        report = asyncio.run(generator.run(channel))
+
+        self.assertAlmostEqual(report["published"], 200, delta=10)
+        self.assertEqual(report["confirmed"] + report["unconfirmed"], report["published"])
+        self.assertLessEqual(report["unconfirmed"], 3)
+        self.assertIn("confirm_p99_ms", report)
+        self.assertGreaterEqual(report["confirm_p99_ms"], report["confirm_p50_ms"])
+
+    def test_window_bounds_in_flight(self):
+        generator = LoadGenerator(RateProfile(2000), duration=0.3, window=8, pool_size=20)
+        channel = FakeConfirmChannel(generator, batch=8, delay=0.05)
+        report = asyncio.run(generator.run(channel))
+
+        # A slow broker throttles the generator instead of letting unconfirmed messages pile up
+        self.assertLessEqual(report["max_in_flight"], 8)
+        self.assertGreater(report["window_stalls"], 0)
+        self.assertLess(report["published"], 600)
+
+    def test_stalled_broker_does_not_outlast_duration(self):
+        generator = LoadGenerator(RateProfile(1000), duration=0.2, window=4, pool_size=20)
+        # The first confirms only arrive after the run should have ended
+        channel = FakeConfirmChannel(generator, batch=4, delay=0.6)
+        report = asyncio.run(generator.run(channel))
+
+        self.assertEqual(report["published"], 4)
+        self.assertLess(report["duration_s"], 0.4)
+        self.assertEqual(report["confirmed"], 4)
+
+    def test_seed_reproduces_the_pool(self):
+        first = LoadGenerator(RateProfile(1), pool_size=20, seed=7).notes
+        self.assertEqual(LoadGenerator(RateProfile(1), pool_size=20, seed=7).notes, first)
+        self.assertNotEqual(LoadGenerator(RateProfile(1), pool_size=20, seed=8).notes, first)
+
+    def test_rate_profiles(self):
+        burst = RateProfile(10, "burst", burst_rate=100, burst_seconds=2, burst_period=10)
+        self.assertEqual([burst.rate_at(t) for t in (0, 1.9, 2, 11, 15)], [100, 100, 10, 100, 10])
+        ramp = RateProfile(10, "ramp", burst_rate=110, duration=100)
+        self.assertEqual([ramp.rate_at(t) for t in (0, 50, 200)], [10, 60, 110])
+        with self.assertRaises(ValueError):
+            RateProfile(0)
+        with self.assertRaises(SystemExit):
+            parse_args(["--rate", "0"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import os
+import time
+import json
+import shutil
+import tempfile
+import unittest
+import urllib.request
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.fakes import FakeChannel, FakeRemover, FakeModel
+from src.ner.metrics import Histogram, Metrics, MetricsServer, parse_exposition, scrape
+from src.ner.inference import consume_batches
+from src.storage.segment_store import SegmentWriter
+from src.storage.result_writer import BufferedResultWriter
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles_interpolate_within_buckets(self):
+        histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+        for value in [0.005] * 50 + [0.05] * 40 + [0.5] * 9 + [5.0]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [50, 40, 9, 1])
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.01)
+        self.assertAlmostEqual(histogram.quantile(0.7), 0.01 + 0.09 * 20 / 40)
+        # The overflow bucket reports the largest finite bound
+        self.assertEqual(histogram.quantile(1.0), 1.0)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+    def test_generators_are_timed_while_iterated(self):
+        metrics = Metrics()
+
+        def slow_items():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+
+        items = metrics.timed("tokenize", slow_items)()
+        self.assertEqual(metrics.stages["tokenize"].count, 0)
+        self.assertEqual(list(items), [0, 1, 2])
+        self.assertEqual(metrics.stages["tokenize"].count, 1)
+        self.assertGreaterEqual(metrics.stages["tokenize"].sum, 0.03)
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def test_scrape_merges_workers(self):
+        servers = []
+        for wait in (0.02, 0.2):
+            metrics = Metrics()
+            metrics.received([{'timestamp': time.time() - wait}])
+            metrics.processed(1)
+            metrics.queue_depth = 7
+            servers.append(MetricsServer(metrics, port=0).start())
+        try:
+            urls = [f"http://127.0.0.1:{server.port}/metrics" for server in servers]
+            with urllib.request.urlopen(urls[0]) as response:
+                samples = parse_exposition(response.read().decode())
+            self.assertEqual(samples[("helix_notes_processed_total", ())], 1)
+            self.assertEqual(samples[("helix_stage_seconds_count", (("stage", "dequeue_wait"),))], 1)
+
+            # A worker that is down is skipped
+            telemetry = scrape(urls + ["http://127.0.0.1:1/metrics"])
+            self.assertEqual(telemetry["workers"], 2)
+            self.assertEqual(telemetry["counters"]["notes_processed"], 2)
+            self.assertEqual(telemetry["stages"]["dequeue_wait"]["count"], 2)
+            self.assertEqual(telemetry["queue_depth"], 7)
+        finally:
+            for server in servers:
+                server.stop()
+        self.assertIsNone(scrape(["http://127.0.0.1:1/metrics"]))
+
+class TestWorkerInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_consume_batches_records_every_stage(self):
+        metrics = Metrics()
+        published = time.time() - 0.05
+        channel = FakeChannel([json.dumps({'note': f"note {i}", 'timestamp': published}) for i in range(4)])
+        writer = BufferedResultWriter(SegmentWriter(self.root, fsync=False), max_rows=4, max_delay=60, metrics=metrics)
+
+        consume_batches(channel, FakeModel(), FakeRemover(), writer, batch_size=4, max_wait=0.01, metrics=metrics)
+        writer.close()
+
+        self.assertEqual(metrics.counters["messages_received"], 4)
+        self.assertEqual(metrics.counters["notes_processed"], 4)
+        self.assertEqual(metrics.counters["results_written"], 4)
+        self.assertEqual(metrics.stages["dequeue_wait"].count, 4)
+        self.assertEqual(metrics.stages["deidentify"].count, 1)
+        self.assertEqual(metrics.stages["write"].count, 1)
+        self.assertGreaterEqual(metrics.end_to_end.quantile(0.5), 0.05)
+        self.assertEqual(metrics.queue_depth, 3)
+        self.assertIn("helix_end_to_end_seconds_count 4", metrics.render())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import sys
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.ner.clinicalbert import NERModel, token_windows
+from src.ner.gazetteer import Gazetteer
+from src.ner.result_cache import ResultCache
+
+class MockNER(NERModel):
+    def __init__(self):
+        pass
+
+class FakeEncoding(dict):
+    def __init__(self, offsets):
+        super().__init__(offset_mapping=offsets)
+
+    def word_ids(self):
+        return list(range(len(self['offset_mapping'])))
+
+class FakeTokenizer:
+    # One "token" per whitespace-separated word is enough to drive bucketing and chunking
+    def __call__(self, texts, add_special_tokens=True, return_offsets_mapping=False):
+        if return_offsets_mapping:
+            return FakeEncoding([m.span() for m in re.finditer(r'\S+', texts)])
+        return {'input_ids': [text.split() for text in texts]}
+
+class FakePipeline:
+    """
+    Records every batch it is called with and tags each note's only word as a medication.
+    """
+    def __init__(self):
+        self.tokenizer = FakeTokenizer()
+        self.calls = []
+
+    def __call__(self, texts, batch_size=None):
+        self.calls.append(list(texts))
+        return [[{'entity_group': 'Medication', 'score': 0.9, 'word': text.split()[0], 'start': 0, 'end': len(text.split()[0])}]
+                for text in texts]
+
+class TestBatchInference(unittest.TestCase):
+    def test_buckets_sorted_by_length_and_order_restored(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        texts = ["aaa " * 9, "b", "ccc " * 5, "d d", "eee " * 7]
+
+        batch = model.extract_entities_batch(texts, batch_size=2)
+
+        # Buckets hold neighbours in length order, so padding stays local
+        self.assertEqual([[len(t.split()) for t in call] for call in model.pipeline.calls], [[1, 2], [5, 7], [9]])
+        # Results come back in input order
+        self.assertEqual([ents[0]['entity'] for ents in batch], ['aaa', 'b', 'ccc', 'd', 'eee'])
+        self.assertEqual(batch[1][0]['label'], 'Target: Medication')
+
+    def test_empty_batch(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        self.assertEqual(model.extract_entities_batch([]), [])
+        self.assertEqual(model.pipeline.calls, [])
+
+class KeywordPipeline(FakePipeline):
+    """
+    Tags every occurrence of 'aspirin' with offsets relative to the text it was given.
+    """
+    def __call__(self, texts, batch_size=None):
+        self.calls.append(list(texts))
+        return [[{'entity_group': 'Medication', 'score': 0.9, 'word': 'aspirin', 'start': m.start(), 'end': m.end()}
+                 for m in re.finditer('aspirin', text)]
+                for text in texts]
+
+class TestChunkedInference(unittest.TestCase):
+    def test_token_windows_overlap_and_cover(self):
+        windows = token_windows(list(range(10)), 4, 1)
+        self.assertEqual(windows, [(0, 4), (3, 7), (6, 10)])
+        self.assertEqual(token_windows(list(range(3)), 4, 1), [(0, 3)])
+
+    def test_token_windows_respect_word_boundaries(self):
+        # Tokens 3-5 are one word split into subwords
+        windows = token_windows([0, 1, 2, 3, 3, 3, 4, 5], 4, 1)
+        for first, end in windows:
+            self.assertNotIn(first, (4, 5))
+            self.assertNotIn(end, (4, 5))
+
+    def test_global_offsets_and_overlap_dedup(self):
+        model = MockNER()
+        model.pipeline = KeywordPipeline()
+        model.chunk_tokens = 8
+        model.chunk_overlap = 3
+        text = " ".join("word aspirin" if i % 3 == 0 else "word" for i in range(30))
+
+        entities = model.extract_entities(text)
+
+        # Several windows were used, yet every mention is reported exactly once at its global offset
+        self.assertGreater(len(model.pipeline.calls[0]), 1)
+        expected = [m.start() for m in re.finditer('aspirin', text)]
+        self.assertEqual([e['start'] for e in entities], expected)
+        for e in entities:
+            self.assertEqual(text[e['start']:e['end']], 'aspirin')
+
+class TestPostprocess(unittest.TestCase):
+    def test_labels_filters_and_length_weighted_merge(self):
+        results = [
+            {'entity_group': 'Medication', 'score': 0.7, 'word': '##s', 'start': 0, 'end': 1},
+            {'entity_group': 'Age', 'score': 0.9, 'word': '45', 'start': 1, 'end': 3},
+            {'entity_group': 'Sign_symptom', 'score': 0.9, 'word': 'History', 'start': 3, 'end': 10},
+            {'entity_group': 'DISEASE_DISORDER', 'score': 0.9, 'word': 'hypertens', 'start': 14, 'end': 23},
+            {'entity_group': 'DISEASE_DISORDER', 'score': 0.3, 'word': '##ion', 'start': 23, 'end': 26},
+            {'entity_group': 'Target: Dosage', 'score': 0.8, 'word': '10 mg', 'start': 30, 'end': 35},
+        ]
+
+        entities = MockNER()._postprocess(results)
+
+        # Orphan subwords, untracked groups and generic words are dropped, tagged groups pass through
+        self.assertEqual([(e['entity'], e['label'], e['start'], e['end']) for e in entities],
+                         [('hypertension', 'Target: Disease', 14, 26), ('10 mg', 'Target: Dosage', 30, 35)])
+        # 9 characters at 0.9 and 3 at 0.3, not the pairwise (0.9 + 0.3) / 2
+        self.assertAlmostEqual(entities[0]['score'], (0.9 * 9 + 0.3 * 3) / 12)
+        self.assertAlmostEqual(entities[1]['score'], 0.8)
+
+class TestGazetteerFastPath(unittest.TestCase):
+    def test_aho_corasick_overlaps_and_boundaries(self):
+        gazetteer = Gazetteer({'he': 'A', 'she': 'B', 'his': 'C', 'hers': 'D', 'type 2 diabetes': 'E'})
+        self.assertEqual([(e['entity'], e['label']) for e in gazetteer.find("Ushers his")], [('his', 'C')])
+        self.assertEqual([(e['entity'], e['start']) for e in gazetteer.find("She has Type 2 Diabetes")],
+                         [('She', 0), ('Type 2 Diabetes', 8)])
+
+    def test_covered_notes_skip_the_model(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        model.gazetteer = Gazetteer.default()
+        model.fast_path_stats = {"notes": 0, "fast_path": 0}
+        texts = ["Patient [NAME] presents with asthma. Prescribed Warfarin 5 mg daily.", "unknown drug"]
+
+        batch = model.extract_entities_batch(texts)
+
+        self.assertEqual(model.pipeline.calls, [["unknown drug"]])
+        self.assertEqual([(e['entity'], e['label']) for e in batch[0]],
+                         [('asthma', 'Target: Disease'), ('Warfarin', 'Target: Medication'), ('5 mg', 'Target: Dosage')])
+        self.assertEqual(batch[1][0]['entity'], 'unknown')
+        self.assertEqual(model.fast_path_stats, {"notes": 2, "fast_path": 1})
+
+    def test_single_chunked_note_is_matched_once(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        model.gazetteer = Gazetteer.default()
+        model.chunk_tokens = 8
+        model.fast_path_stats = {"notes": 0, "fast_path": 0}
+
+        entities = model.extract_entities("unknown drug")
+
+        self.assertEqual(entities[0]['entity'], 'unknown')
+        self.assertEqual(model.pipeline.calls, [["unknown drug"]])
+        self.assertEqual(model.fast_path_stats, {"notes": 1, "fast_path": 0})
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_repeated_notes_skip_the_model(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        model.cache = ResultCache(max_entries=2)
+
+        first = model.extract_entities_batch(["a", "b", "a"])
+        second = model.extract_entities_batch(["b", "c"])
+
+        # Duplicates within and across batches are inferred once
+        self.assertEqual(model.pipeline.calls, [["a", "b"], ["c"]])
+        self.assertEqual([ents[0]['entity'] for ents in first + second], ['a', 'b', 'a', 'b', 'c'])
+        self.assertEqual(model.cache.stats["hits"], 1)
+        # Callers get copies, so mutating a result can't poison the cache
+        second[0][0]['entity'] = 'mutated'
+        self.assertEqual(model.extract_entities("b")[0]['entity'], 'b')
+
+    def test_disk_tier_and_model_change(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        model.model_name = "model-a"
+        model.cache = ResultCache(max_entries=1, disk_dir=self.root)
+        model.extract_entities_batch(["a", "b"])
+
+        # A fresh process finds the results on disk
+        model.cache = ResultCache(max_entries=1, disk_dir=self.root)
+        model.extract_entities_batch(["a", "b"])
+        self.assertEqual(len(model.pipeline.calls), 1)
+        self.assertEqual(model.cache.stats["disk_hits"], 2)
+
+        # Another model name invalidates every entry
+        model.model_name = "model-b"
+        model.extract_entities_batch(["a"])
+        self.assertEqual(model.pipeline.calls[-1], ["a"])
+
+        # So does a dictionary with different contents
+        model.gazetteer = Gazetteer({'aspirin': 'Target: Medication'})
+        model.fast_path_stats = {"notes": 0, "fast_path": 0}
+        version = model.model_version()
+        self.assertEqual(Gazetteer({'Aspirin': 'Target: Medication'}).fingerprint, model.gazetteer.fingerprint)
+        model.gazetteer = Gazetteer({'aspirin': 'Target: Medication', 'warfarin': 'Target: Medication'})
+        self.assertNotEqual(model.model_version(), version)
+        model.cache.close()
+
+    def test_single_chunked_note_is_looked_up_once(self):
+        model = MockNER()
+        model.pipeline = FakePipeline()
+        model.chunk_tokens = 8
+        model.cache = ResultCache()
+
+        model.extract_entities("fever today")
+        model.extract_entities("fever today")
+
+        self.assertEqual(model.cache.stats, {"hits": 1, "disk_hits": 0, "misses": 1})
+        self.assertEqual(len(model.pipeline.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
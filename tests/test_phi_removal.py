@@ -0,0 +1,94 @@
+import sys
+import os
+import random
+import timeit
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from faker import Faker
+
+from src.deidentification.phi_removal import PHIRemover, OffsetMap
+from src.streaming.rabbitmq_producer import generate_synthetic_note
+
+def synthetic_notes(n, seed=42):
+    random.seed(seed)
+    Faker.seed(seed)
+    return [generate_synthetic_note() for _ in range(n)]
+
+class TestSinglePassDeidentification(unittest.TestCase):
+    def setUp(self):
+        self.remover = PHIRemover()
+
+    def test_matches_sequential_on_producer_notes(self):
+        for note in synthetic_notes(500):
+            self.assertEqual(self.remover.deidentify(note), self.remover._deidentify_sequential(note))
+
+    def test_matches_sequential_on_overlapping_rules(self):
+        # Cases where one rule masks the context or boundary of a later one
+        cases = [
+            "Patient John Doe seen on 12/05/2023. ID: 12345.",
+            "ID: 12345. Tyler Benson complains of worsening asthma.",
+            "Discharge summary for Patient John Doe.",
+            "Patient Dr. Smith was consulted.",
+            "ID: 7. Dr. Smith evaluated Mary Ann.",
+            "Dr. Smithevaluated Mary Ann on 1/2/33.",
+            "Seen by Ann Crawford Mary for follow-up.",
+            "ID: 99. Tyler12345 and ID: 12345. Ann1/2/33",
+            "Referral 123456 for Jane Roe, MRN 54321, dated 5-6-22.",
+        ]
+        for text in cases:
+            self.assertEqual(self.remover.deidentify(text), self.remover._deidentify_sequential(text), text)
+
+    def test_deidentify_batch(self):
+        notes = synthetic_notes(20)
+        self.assertEqual(self.remover.deidentify_batch(notes), [self.remover.deidentify(note) for note in notes])
+        self.assertEqual(self.remover.deidentify_batch([]), [])
+
+    def test_benchmark_against_sequential(self):
+        notes = synthetic_notes(2000)
+        long_notes = [" ".join(notes[i:i + 40]) for i in range(0, len(notes), 40)]
+
+        for name, corpus in (("short", notes), ("long", long_notes)):
+            sequential = min(timeit.repeat(lambda: [self.remover._deidentify_sequential(note) for note in corpus], number=1, repeat=5))
+            single_pass = min(timeit.repeat(lambda: self.remover.deidentify_batch(corpus), number=1, repeat=5))
+            print(f"{name} notes: sequential {sequential * 1000:.1f} ms, single-pass {single_pass * 1000:.1f} ms "
+                  f"({sequential / single_pass:.2f}x)")
+
+class TestOffsetMap(unittest.TestCase):
+    def setUp(self):
+        self.remover = PHIRemover()
+
+    def test_entity_offsets_map_back_to_source(self):
+        text = "Dr. Smith evaluated Tyler Benson on 12/05/2023. Diagnosis: asthma. Plan: Start Albuterol 90 mcg."
+        cleaned, offset_map = self.remover.deidentify_with_map(text)
+        self.assertEqual(cleaned, self.remover.deidentify(text))
+
+        start = cleaned.index("Albuterol")
+        original_start, original_end = offset_map.to_original_span(start, start + len("Albuterol"))
+        self.assertEqual(text[original_start:original_end], "Albuterol")
+        self.assertEqual(offset_map.to_masked(original_start), start)
+
+        # A span covering a placeholder maps to the whole PHI span it replaced
+        name_start = cleaned.index("[NAME] on")
+        original_start, original_end = offset_map.to_original_span(name_start, name_start + len("[NAME]"))
+        self.assertEqual(text[original_start:original_end], "Tyler Benson")
+
+    def test_fallback_path_produces_same_map(self):
+        # Triggers the sequential fallback (a context word inside a masked name)
+        text = "ID: 7. Dr. Smith evaluated Mary Ann on 1/2/33."
+        cleaned, offset_map = self.remover.deidentify_with_map(text)
+        self.assertEqual(cleaned, self.remover._deidentify_sequential(text))
+        for masked_start, masked_end, original_start, original_end in offset_map.edits:
+            self.assertIn(cleaned[masked_start:masked_end], ("[NAME]", "[DATE]", "[ID]"))
+        self.assertEqual(text[offset_map.to_original(len(cleaned) - 1)], ".")
+
+    def test_no_phi(self):
+        cleaned, offset_map = self.remover.deidentify_with_map("Presents with asthma.")
+        self.assertEqual(offset_map.edits, [])
+        self.assertEqual(offset_map.to_original(5), 5)
+        self.assertEqual(OffsetMap.from_replacements([]).edits, [])
+
+if __name__ == '__main__':
+    unittest.main()
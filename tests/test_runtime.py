@@ -0,0 +1,57 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from tests.benchmark_pipeline import build_tiny_model
+from src.ner.clinicalbert import NERModel
+from src.ner.runtime import RuntimeProfile, build_profile, warmup_texts
+
+class TestRuntimeProfile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.model_path = build_tiny_model(os.path.join(cls.root, "tiny-ner"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_warmup_reports_cold_and_steady_latency(self):
+        model = NERModel(self.model_path, chunk_tokens=128)
+        texts = warmup_texts(model, [16, 64])
+        self.assertEqual([len(model.pipeline.tokenizer(text)['input_ids']) for text in texts], [16, 64])
+
+        report = RuntimeProfile(warmup_lengths=(16, 64, 512), warmup_rounds=2).apply(model)
+
+        # Lengths are capped at the chunk size the model actually sees
+        self.assertEqual(list(report["warmup"]), [16, 64, 128])
+        for timing in report["warmup"].values():
+            self.assertGreater(timing["cold_ms"], 0)
+            self.assertGreater(timing["steady_ms"], 0)
+        self.assertTrue(report["inference_mode"])
+
+    def test_torchscript_matches_eager(self):
+        model = NERModel(self.model_path)
+        notes = ["Patient has hypertension and takes Lisinopril 10 mg.", "History of asthma."]
+        expected = model.extract_entities_batch(notes)
+
+        report = RuntimeProfile(compile="torchscript", warmup_lengths=(32,), warmup_rounds=1).apply(model)
+
+        self.assertEqual(report["compile"], "torchscript")
+        actual = model.extract_entities_batch(notes)
+        self.assertEqual([[(e['entity'], e['label']) for e in note] for note in actual],
+                         [[(e['entity'], e['label']) for e in note] for note in expected])
+
+    def test_presets(self):
+        self.assertEqual(build_profile("off").warmup_lengths, ())
+        self.assertEqual(build_profile("throughput", threads=2).threads, 2)
+        with self.assertRaises(ValueError):
+            build_profile("fastest")
+
+if __name__ == '__main__':
+    unittest.main()
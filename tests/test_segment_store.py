@@ -0,0 +1,149 @@
+import sys
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.storage.segment_store import SegmentWriter, SegmentReader, to_record_batch
+from src.storage.result_writer import BufferedResultWriter
+
+HOUR = 3600.0
+BASE = 1766612005.0
+
+def make_result(timestamp, label=None):
+    entities = []
+    if label:
+        entities.append({"entity": "asthma", "label": label, "score": 0.9, "start": 0, "end": 6})
+    return {"timestamp": timestamp, "original_text_masked": "asthma in [NAME]", "entities": entities}
+
+class TestSegmentStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        results = [make_result(BASE, 'Target: Disease'), make_result(BASE + 1)]
+        results[1]["phi_edits"] = [[11, 17, 11, 21]]
+        writer = SegmentWriter(self.root)
+        writer.append(results)
+        writer.close()
+
+        self.assertEqual(SegmentReader(self.root).read(), results)
+
+    def test_time_partitions_and_predicates(self):
+        writer = SegmentWriter(self.root)
+        writer.append([make_result(BASE, 'Target: Disease'), make_result(BASE + 10, 'Target: Medication')])
+        writer.append([make_result(BASE + 2 * HOUR, 'Target: Disease')])
+        writer.close()
+
+        reader = SegmentReader(self.root)
+        self.assertEqual(len(reader.partitions()), 2)
+        # The early partition is pruned without being opened
+        self.assertEqual(len(reader.partitions(start=BASE + HOUR)), 1)
+        self.assertEqual([r['timestamp'] for r in reader.read(start=BASE + 5, end=BASE + HOUR)], [BASE + 10])
+        self.assertEqual([r['timestamp'] for r in reader.read(labels=['Target: Disease'])], [BASE, BASE + 2 * HOUR])
+
+    def test_append_across_partitions_fsyncs_every_segment(self):
+        synced = []
+        real_fsync = os.fsync
+
+        def fsync(fd):
+            if stat.S_ISREG(os.fstat(fd).st_mode):
+                synced.append(os.readlink(f"/proc/self/fd/{fd}"))
+            return real_fsync(fd)
+
+        writer = SegmentWriter(self.root)
+        with mock.patch('src.storage.segment_store.os.fsync', side_effect=fsync):
+            writer.append([make_result(BASE), make_result(BASE + HOUR)])
+        writer.close()
+
+        segments = [os.path.join(directory, name) for directory, _, names in os.walk(self.root) for name in names]
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(sorted(set(synced)), sorted(os.path.realpath(path) for path in segments))
+
+    def test_read_new_tails_open_segment(self):
+        writer = SegmentWriter(self.root)
+        reader = SegmentReader(self.root)
+        self.assertEqual(reader.read_new(), [])
+
+        writer.append([make_result(BASE)])
+        self.assertEqual(len(reader.read_new()), 1)
+        self.assertEqual(reader.read_new(), [])
+
+        writer.append([make_result(BASE + 1), make_result(BASE + 2)])
+        self.assertEqual([r['timestamp'] for r in reader.read_new()], [BASE + 1, BASE + 2])
+
+        # A fresh writer never overwrites existing segments
+        other = SegmentWriter(self.root)
+        other.append([make_result(BASE)])
+        other.close()
+        writer.close()
+        self.assertEqual(len(reader.read_new()), 1)
+        self.assertEqual(len(reader.read()), 4)
+
+class TestBufferedResultWriter(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_acks_only_after_group_commit(self):
+        reader = SegmentReader(self.root)
+        writer = BufferedResultWriter(SegmentWriter(self.root), max_rows=3, max_delay=60)
+        acked = []
+
+        writer.add([make_result(BASE)], on_durable=lambda: acked.append(1))
+        writer.add([make_result(BASE + 1)], on_durable=lambda: acked.append(2))
+        # Below the threshold nothing is written and nothing is acked
+        self.assertEqual(acked, [])
+        self.assertEqual(reader.read_new(), [])
+
+        writer.add([make_result(BASE + 2)], on_durable=lambda: acked.append(3))
+        self.assertEqual(acked, [1, 2, 3])
+        self.assertEqual(len(reader.read_new()), 3)
+
+    def test_failed_commit_is_retried_without_duplicates(self):
+        store = SegmentWriter(self.root)
+        writer = BufferedResultWriter(store, max_rows=100, max_delay=60)
+        writer.add([make_result(BASE - HOUR)])
+        writer.flush()
+
+        # The second partition's batch fails after the first one was written
+        real_batch = to_record_batch
+        calls = []
+
+        def failing_batch(rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise OSError(28, "No space left on device")
+            return real_batch(rows)
+
+        writer.add([make_result(BASE - HOUR + 1), make_result(BASE)])
+        with mock.patch('src.storage.segment_store.to_record_batch', side_effect=failing_batch):
+            with self.assertRaises(OSError):
+                writer.flush()
+        writer.close()
+        self.assertEqual([r['timestamp'] for r in SegmentReader(self.root).read()], [BASE - HOUR, BASE - HOUR + 1, BASE])
+
+    def test_time_threshold_and_close(self):
+        writer = BufferedResultWriter(SegmentWriter(self.root), max_rows=100, max_delay=0)
+        self.assertFalse(writer.maybe_flush())
+        writer.add([make_result(BASE)])
+        self.assertEqual(writer.pending(), 0)
+
+        writer.max_delay = 60
+        writer.add([make_result(BASE + 1)])
+        self.assertEqual(writer.pending(), 1)
+        writer.close()
+        self.assertEqual(len(SegmentReader(self.root).read()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import json
+import shutil
+import tempfile
+import unittest
+
+import torch
+
+# Add src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.ner.worker_pool import WorkerPool
+
+def wait_for(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.02)
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def reports(self):
+        """
+        What each worker run recorded, in start order.
+        """
+        reports = []
+        for name in os.listdir(self.root):
+            with open(os.path.join(self.root, name)) as f:
+                reports.append(json.load(f))
+        return sorted(reports, key=lambda report: report["started"])
+
+    def target(self, worker_id):
+        """
+        Records how the worker was set up; worker 0's first run exits at once, the others block.
+        """
+        report = {"worker": worker_id, "pid": os.getpid(), "threads": torch.get_num_threads(),
+                  "cores": sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None,
+                  "started": time.time()}
+        path = os.path.join(self.root, f"{worker_id}-{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(report, f)
+        os.replace(path + ".tmp", path)
+        if worker_id == 0 and len([name for name in os.listdir(self.root) if name.startswith("0-")]) == 1:
+            return
+        time.sleep(60)
+
+    def test_workers_are_sized_and_restarted(self):
+        pool = WorkerPool(self.target, num_workers=2, threads_per_worker=2)
+        try:
+            pool.start()
+            wait_for(lambda: len(self.reports()) == 2)
+            first = {report["worker"]: report for report in self.reports()}
+            for worker_id, report in first.items():
+                self.assertEqual(report["pid"], pool.processes[worker_id].pid)
+                self.assertEqual(report["threads"], 2)
+                if report["cores"] is not None:
+                    self.assertEqual(report["cores"], sorted(set(pool.cores_for(worker_id))))
+
+            wait_for(lambda: not pool.processes[0].is_alive())
+            self.assertEqual(pool.restart_exited(), [0])
+            wait_for(lambda: len(self.reports()) == 3)
+            restarted = self.reports()[-1]
+            self.assertEqual(restarted["worker"], 0)
+            self.assertNotEqual(restarted["pid"], first[0]["pid"])
+            self.assertEqual(restarted["threads"], 2)
+            # The blocked worker was left alone
+            self.assertEqual(pool.restart_exited(), [])
+            self.assertEqual(pool.processes[1].pid, first[1]["pid"])
+        finally:
+            pool.stop(timeout=5)
+        self.assertFalse(any(process.is_alive() for process in pool.processes.values()))
+
+    def test_cores_are_split_between_workers(self):
+        pool = WorkerPool(self.target, num_workers=2)
+        self.assertEqual(pool.threads_per_worker, max(1, len(pool.cores) // 2))
+        pool.cores, pool.threads_per_worker = list(range(8)), 4
+        self.assertEqual((pool.cores_for(0), pool.cores_for(1)), ([0, 1, 2, 3], [4, 5, 6, 7]))
+        # More workers than cores wrap around
+        pool.cores, pool.threads_per_worker = [0, 1], 1
+        self.assertEqual([pool.cores_for(worker_id) for worker_id in range(3)], [[0], [1], [0]])
+
+if __name__ == '__main__':
+    unittest.main()